@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from pydantic import ValidationError
+from .models import PromptLogEntry, LogRiskAssessment, AuditResponse
+from .audit import audit_logs_async, RISK_STATUS_ORDER
+from .streaming import parse_log_line, MAX_SUMMARY_FLAGS
+from .rag_policy import warm_policy_index
+from .ratelimit import lane
+
+MANIFEST_FILE = "manifest.json"
+RESULTS_FILE = "results.ndjson"
+SUMMARY_FILE = "summary.json"
+PARTS_DIR = "parts"
+
+def _is_json_archive(path):
+    return path.lower().endswith(".json")
+
+def _load_json_records(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return data["logs"] if isinstance(data, dict) else data
+
+def count_records(path):
+    """Number of log records in a JSON or JSONL archive"""
+    if _is_json_archive(path):
+        return len(_load_json_records(path))
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+def _validate(record):
+    """Validate one JSON archive record; returns (PromptLogEntry, None) or (None, error message)"""
+    try:
+        return PromptLogEntry.model_validate(record), None
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'record'}: {err['msg']}" for err in e.errors())
+
+def iter_batches(path, batch_size, batches):
+    """Yield (batch number, [(index, log, error), ...]) for the wanted batch numbers, in file order"""
+    batches = set(batches)
+    if _is_json_archive(path):
+        records = _load_json_records(path)
+        for batch in sorted(batches):
+            start = batch * batch_size
+            yield batch, [(start + i, *_validate(record))
+                          for i, record in enumerate(records[start:start + batch_size])]
+        return
+
+    current, entries = None, []
+    with open(path, "rb") as f:
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            batch = index // batch_size
+            if batch in batches:
+                if batch != current and entries:
+                    yield current, entries
+                    entries = []
+                current = batch
+                entries.append((index, *parse_log_line(line)))
+            index += 1
+    if entries:
+        yield current, entries
+
+def _part_path(output_dir, batch):
+    return os.path.join(output_dir, PARTS_DIR, f"batch-{batch:06d}.ndjson")
+
+def _write_part(output_dir, batch, entries, result, elapsed):
+    """Write one batch's per-log lines plus a closing {"batch": ...} line, atomically"""
+    path = _part_path(output_dir, batch)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        for idx, log, error in entries:
+            if error:
+                f.write(json.dumps({"index": idx, "error": error}) + "\n")
+                continue
+            assessment = result.log_assessments.get(idx) or LogRiskAssessment(
+                risk_level="Medium", reason="Not analyzed due to processing error"
+            )
+            f.write(json.dumps({"index": idx, **assessment.model_dump()}) + "\n")
+        f.write(json.dumps({"batch": {
+            "number": batch,
+            "logs": len(entries),
+            "risk_status": result.risk_status,
+            "flags": result.flags,
+            "seconds": round(elapsed, 3),
+        }}) + "\n")
+    os.replace(tmp_path, path)
+
+async def _audit_shard(path, output_dir, batch_size, batches, shard):
+    # Each worker process loads its own copy of the policy index
+    await asyncio.to_thread(warm_policy_index)
+    logs_done = 0
+    failed = 0
+    start = time.perf_counter()
+    for batch, entries in iter_batches(path, batch_size, batches):
+        batch_start = time.perf_counter()
+        valid = [(idx, log) for idx, log, error in entries if not error]
+        if valid:
+            try:
+                with lane("bulk"):
+                    result = await audit_logs_async([log for _, log in valid], log_indices=[idx for idx, _ in valid])
+            except Exception as e:
+                # No part is written, so a resumed run retries this batch; the shard goes on
+                failed += 1
+                print(f"[shard {shard}] batch {batch} failed: {str(e)}", file=sys.stderr, flush=True)
+                continue
+        else:
+            result = AuditResponse(summary="")
+        elapsed = time.perf_counter() - batch_start
+        await asyncio.to_thread(_write_part, output_dir, batch, entries, result, elapsed)
+        logs_done += len(entries)
+        print(f"[shard {shard}] batch {batch}: {len(entries)} logs in {elapsed:.1f}s "
+              f"({len(entries) / elapsed if elapsed else 0:.0f} logs/sec)", file=sys.stderr, flush=True)
+    seconds = time.perf_counter() - start
+    return {
+        "shard": shard,
+        "batches": len(batches),
+        "failed_batches": failed,
+        "logs": logs_done,
+        "seconds": round(seconds, 3),
+        "logs_per_sec": round(logs_done / seconds, 1) if seconds else 0.0,
+    }
+
+def run_shard(path, output_dir, batch_size, batches, shard):
+    """Worker process entry point: audit the given batches of the archive"""
+    return asyncio.run(_audit_shard(path, output_dir, batch_size, batches, shard))
+
+def _prepare_output(path, output_dir, batch_size, restart):
+    """Create or validate the checkpoint manifest; returns the number of records"""
+    os.makedirs(os.path.join(output_dir, PARTS_DIR), exist_ok=True)
+    stat = os.stat(path)
+    manifest = {
+        "input": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "batch_size": batch_size,
+    }
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path) and not restart:
+        with open(manifest_path, "r") as f:
+            previous = json.load(f)
+        records = previous.pop("records", None)
+        if previous != manifest:
+            raise SystemExit(f"{output_dir} holds a run for a different input or batch size; use --restart")
+        return records
+
+    for name in os.listdir(os.path.join(output_dir, PARTS_DIR)):
+        os.remove(os.path.join(output_dir, PARTS_DIR, name))
+    manifest["records"] = count_records(path)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest["records"]
+
+def merge_parts(output_dir, batch_count):
+    """Concatenate the batch parts into results.ndjson and build the summary report"""
+    risk_counts = Counter()
+    flags = []
+    flag_count = 0
+    total = 0
+    invalid = 0
+    risk_status = "Safe"
+    with open(os.path.join(output_dir, RESULTS_FILE), "w") as out:
+        for batch in range(batch_count):
+            with open(_part_path(output_dir, batch), "r") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if "batch" in record:
+                        info = record["batch"]
+                        if RISK_STATUS_ORDER.get(info["risk_status"], 0) > RISK_STATUS_ORDER[risk_status]:
+                            risk_status = info["risk_status"]
+                        flag_count += len(info["flags"])
+                        for flag in info["flags"]:
+                            if len(flags) < MAX_SUMMARY_FLAGS and flag not in flags:
+                                flags.append(flag)
+                        continue
+                    total += 1
+                    if "error" in record:
+                        invalid += 1
+                    else:
+                        risk_counts[record["risk_level"]] += 1
+                    out.write(line)
+    return {
+        "total": total,
+        "invalid": invalid,
+        "risk_status": risk_status,
+        "risk_counts": dict(risk_counts),
+        "flag_count": flag_count,
+        "flags": flags,
+    }
+
+def run_archive(path, output_dir, workers, batch_size, restart=False):
+    """Audit an archive with `workers` processes and write results.ndjson and summary.json.
+
+    The archive is cut into batches of batch_size logs, dealt round-robin to one shard per
+    worker. Upstream budgets are shared through the rate limiter's SQLite file. Finished
+    batches are written atomically to parts/, so an interrupted run resumes with the
+    batches that are still missing. A batch that fails is logged and left without a part;
+    the other batches go on, and the run exits asking for a rerun instead of merging.
+    """
+    records = _prepare_output(path, output_dir, batch_size, restart)
+    batch_count = math.ceil(records / batch_size)
+    pending = [b for b in range(batch_count) if not os.path.exists(_part_path(output_dir, b))]
+    resumed = batch_count - len(pending)
+    if resumed:
+        print(f"Resuming: {resumed} of {batch_count} batches already done", file=sys.stderr)
+
+    shards = []
+    start = time.perf_counter()
+    workers = max(1, min(workers, len(pending))) if pending else 0
+    if workers:
+        assignments = [pending[shard::workers] for shard in range(workers)]
+        # Spawned (not forked) workers, so no thread or FAISS state is inherited
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        try:
+            futures = [pool.submit(run_shard, path, output_dir, batch_size, batches, shard)
+                       for shard, batches in enumerate(assignments)]
+            for future in as_completed(futures):
+                try:
+                    shard = future.result()
+                except Exception as e:
+                    # A shard that died leaves its missing batches for the next run
+                    print(f"Shard failed: {str(e)}", file=sys.stderr)
+                    continue
+                shards.append(shard)
+                print(f"[shard {shard['shard']}] done: {shard['logs']} logs in {shard['seconds']}s "
+                      f"({shard['logs_per_sec']} logs/sec)", file=sys.stderr)
+        except KeyboardInterrupt:
+            # Workers get the same SIGINT from the terminal; don't wait for them
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise SystemExit("Interrupted; finished batches are kept in "
+                             f"{os.path.join(output_dir, PARTS_DIR)}, rerun to resume")
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    missing = [b for b in pending if not os.path.exists(_part_path(output_dir, b))]
+    if missing:
+        raise SystemExit(f"{len(missing)} of {batch_count} batches failed; finished batches are kept in "
+                         f"{os.path.join(output_dir, PARTS_DIR)}, rerun to resume")
+
+    summary = merge_parts(output_dir, batch_count)
+    audited = sum(shard["logs"] for shard in shards)
+    summary["run"] = {
+        "workers": workers,
+        "batch_size": batch_size,
+        "batches": batch_count,
+        "resumed_batches": resumed,
+        "seconds": round(elapsed, 3),
+        "logs_per_sec": round(audited / elapsed, 1) if elapsed and audited else 0.0,
+        "shards": sorted(shards, key=lambda shard: shard["shard"]),
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit a JSON or JSONL log archive with a pool of worker processes")
+    parser.add_argument("input", help="JSONL file (one PromptLogEntry per line) or JSON file ({\"logs\": [...]})")
+    parser.add_argument("-o", "--output", help="Output directory (default: <input>.audit)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Logs per audit call and checkpoint")
+    parser.add_argument("--restart", action="store_true", help="Discard checkpoints of a previous run")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output or os.path.splitext(args.input)[0] + ".audit"
+    summary = run_archive(args.input, output_dir, args.workers, max(1, args.batch_size), args.restart)
+    run = summary["run"]
+    print(f"Audited {summary['total']} logs ({summary['invalid']} invalid) with {run['workers']} workers "
+          f"in {run['seconds']}s ({run['logs_per_sec']} logs/sec). Risk status: {summary['risk_status']}")
+    print(f"Results: {os.path.join(output_dir, RESULTS_FILE)}")
+    print(f"Summary: {os.path.join(output_dir, SUMMARY_FILE)}")
+
+if __name__ == "__main__":
+    main()
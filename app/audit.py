@@ -1,38 +1,110 @@
+import asyncio
+import json
 import os
+import random
 import re
-from typing import List, Dict
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from .models import PromptLogEntry, AuditResponse, LogRiskAssessment
-from .rag_policy import get_policy_context
-
-# Load the prompt template
-def load_prompt_template():
-    with open("app/prompts/prompt_template.txt", "r") as f:
-        return f.read()
-
-def check_format(response, log_count):
-    """Check if the response has the correct format for parsing"""
-    # Check for section headers
-    required_sections = ["LOG ASSESSMENTS", "SUGGESTIONS", "FLAGS", "SUMMARY", "RISK STATUS"]
-    
-    for section in required_sections:
-        if f"==={section}===" not in response:
-            return False
-    
-    # Check if we can find log assessments for each log
-    log_pattern = r"LOG\s+(\d+):\s+(High|Medium|Low)\s+\|\s+(.*)"
-    log_matches = re.findall(log_pattern, response, re.IGNORECASE)
-    
-    # Make sure we found at least one log assessment per log
-    if len(log_matches) < log_count:
-        return False
+import time
+from typing import List, Dict, Tuple
+from langchain_core.messages import AIMessage
+from .models import (
+    PromptLogEntry, AuditResponse, AuditStats, LogRiskAssessment, AuditOutput, LogAssessmentOutput
+)
+from .rag_policy import aget_log_policy_context, policy_corpus_version
+from .backends import backend_id
+from .runtime import get_runtime, OUTPUT_SCHEMA
+from .prescreen import prescreen_logs
+from .cache import get_cache, cache_key
+from .history import get_history
+from .profiles import get_profiles
+from .dedup import cluster_logs, fan_out
+from .prompt_builder import compact_logs, count_tokens_batch, estimate_tokens
+from .ratelimit import get_rate_limiter, RateLimited
+from . import metrics
+from .config import (
+    AUDIT_MODEL, AUDIT_CHUNK_TOKEN_BUDGET, AUDIT_POLICY_CONTEXT_TOKENS, AUDIT_MAX_CHUNK_LOGS, AUDIT_MAX_CONCURRENCY,
+    AUDIT_PRESCREEN, AUDIT_PRESCREEN_SKIP_SAFE, AUDIT_REPAIR_ATTEMPTS, AUDIT_REPAIR_BACKOFF,
+    AUDIT_OUTPUT_FORMAT, AUDIT_DEDUP, AUDIT_STREAM_RESPONSES, PROFILE_ESCALATION
+)
+
+RISK_STATUS_ORDER = {"Safe": 0, "Moderate": 1, "High-Risk": 2}
+
+# Tokens added to each log line by its policy references (" | Policy: P1, P2")
+POLICY_REF_TOKENS = 8
+
+# Reasons used when a log could not be analyzed at all; these are left out of the history
+UNANALYZED_REASONS = {
+    "Not analyzed due to parsing error",
+    "Not analyzed due to processing error",
+    "Processing error",
+}
+
+# Reasons used when the model did not actually assess a log; these are never cached
+FALLBACK_REASONS = UNANALYZED_REASONS | {
+    "Standard business usage",
+    "Assessment inferred from overall risk status",
+}
+
+# One precompiled pattern for text-mode LOG lines ("LOG 3: High | reason", "LOG 3: [Risk Level: High] | reason", ...)
+_LOG_LINE_PATTERN = re.compile(r"^\s*LOG\s+(\d+):[^|\n]*?\b(High|Medium|Low)\b[^|\n]*\|[ \t]*(.*)", re.IGNORECASE | re.MULTILINE)
+_SECTION_PATTERN = re.compile(r"^===\s*(.*?)\s*===$")
+_json_decoder = json.JSONDecoder()
+
+def format_log_line(i, log):
+    """Format a single log entry the way the prompt template expects it (always one line)"""
+    prompt = log.prompt
+    if "\n" in prompt or "\r" in prompt:
+        prompt = " ".join(prompt.split())
+    return f"LOG {i}: User: {log.user}, Prompt: '{prompt}', Tokens: {log.tokens}, Model: {log.model}"
+
+def _build_response(summary, risk_status, flags, suggestions, log_assessments, log_indices, fill_missing):
+    """Shared tail of the text and JSON parsers"""
+    flags = [f for f in flags if f and not ("no policy violations" in f.lower() or "no violations" in f.lower())]
+
+    # As a fallback, derive risk status from log assessments if we have them
+    if not flags and log_assessments:
+        high_risk_count = sum(1 for a in log_assessments.values() if a.risk_level == "High")
+        medium_risk_count = sum(1 for a in log_assessments.values() if a.risk_level == "Medium")
+        
+        if high_risk_count > 0:
+            risk_status = "High-Risk"
+        elif medium_risk_count > 0:
+            risk_status = "Moderate"
+
+    if fill_missing:
+        # Fill in any missing log assessments based on risk status
+        if len(log_assessments) == 0 and risk_status != "Safe":
+            # Create default assessments based on risk level
+            default_level = "Medium" if risk_status == "Moderate" else "High" if risk_status == "High-Risk" else "Low"
+            for i in log_indices:
+                log_assessments[i] = LogRiskAssessment(
+                    risk_level=default_level, 
+                    reason="Assessment inferred from overall risk status"
+                )
+        
+        # Fill in any missing log assessments with defaults
+        for i in log_indices:
+            if i not in log_assessments:
+                log_assessments[i] = LogRiskAssessment(
+                    risk_level="Low", 
+                    reason="Standard business usage"
+                )
     
-    return True
+    return AuditResponse(
+        summary=summary,
+        risk_status=risk_status,
+        flags=flags,
+        suggestions=suggestions,
+        log_assessments=log_assessments
+    )
+
+def parse_response(response, logs_count, log_indices=None, fill_missing=True):
+    """Parse a text-format LLM response into structured data.
 
-def parse_response(response, logs_count):
-    """Parse the LLM response into structured data"""
+    log_indices are the LOG numbers the model was given (0 to logs_count - 1 by default).
+    With fill_missing=False, logs without a LOG line are left out instead of defaulted.
+    """
+    if log_indices is None:
+        log_indices = range(logs_count)
     # Parse the response based on sections
     sections = {}
     current_section = None
@@ -46,14 +118,15 @@ def parse_response(response, logs_count):
         if not line:
             continue
             
-        if line.startswith('===') and line.endswith('==='):
+        header = _SECTION_PATTERN.match(line)
+        if header:
             # Store previous section if it exists
             if current_section:
                 sections[current_section] = section_content
                 section_content = []
             
             # Start new section
-            current_section = line.strip('=').strip()
+            current_section = header.group(1)
         else:
             section_content.append(line)
     
@@ -68,24 +141,14 @@ def parse_response(response, logs_count):
     summary = ""
     risk_status = "Safe"  # Default
     
-    # Process log assessments - use flexible regex patterns
-    if "LOG ASSESSMENTS" in sections:
-        for line in sections["LOG ASSESSMENTS"]:
-            # Try several regex patterns to match different formats
-            patterns = [
-                r"LOG\s+(\d+):\s+\[Risk\s+Level:\s+(High|Medium|Low)\]\s+\|\s+(.*)",  # Original format
-                r"LOG\s+(\d+):\s+(High|Medium|Low)\s+\|\s+(.*)",                      # Simpler format
-                r"LOG\s+(\d+):[^(High|Medium|Low)]*(High|Medium|Low)[^|]*\|\s*(.*)"   # Very flexible format
-            ]
-            
-            for pattern in patterns:
-                match = re.match(pattern, line, re.IGNORECASE)
-                if match:
-                    log_idx = int(match.group(1))
-                    risk_level = match.group(2).capitalize()  # Normalize to Title Case
-                    reason = match.group(3).strip()
-                    log_assessments[log_idx] = LogRiskAssessment(risk_level=risk_level, reason=reason)
-                    break
+    # Process log assessments
+    for line in sections.get("LOG ASSESSMENTS", []):
+        match = _LOG_LINE_PATTERN.match(line)
+        if match:
+            log_idx = int(match.group(1))
+            risk_level = match.group(2).capitalize()  # Normalize to Title Case
+            reason = match.group(3).strip()
+            log_assessments[log_idx] = LogRiskAssessment(risk_level=risk_level, reason=reason)
     
     # Process suggestions
     if "SUGGESTIONS" in sections:
@@ -99,9 +162,7 @@ def parse_response(response, logs_count):
     if "FLAGS" in sections:
         for line in sections["FLAGS"]:
             if line.startswith('-') or line.startswith('•'):
-                flag = line[1:].strip()
-                if flag and not ("no policy violations" in flag.lower() or "no violations" in flag.lower()):
-                    flags.append(flag)
+                flags.append(line[1:].strip())
     
     # Process summary
     if "SUMMARY" in sections and sections["SUMMARY"]:
@@ -117,154 +178,685 @@ def parse_response(response, logs_count):
         else:
             risk_status = "Safe"
     
-    # As a fallback, derive risk status from log assessments if we have them
-    if not flags and log_assessments:
-        high_risk_count = sum(1 for a in log_assessments.values() if a.risk_level == "High")
-        medium_risk_count = sum(1 for a in log_assessments.values() if a.risk_level == "Medium")
-        
-        if high_risk_count > 0:
-            risk_status = "High-Risk"
-        elif medium_risk_count > 0:
-            risk_status = "Moderate"
-    
-    # Fill in any missing log assessments based on risk status
-    if len(log_assessments) == 0 and risk_status != "Safe":
-        # Create default assessments based on risk level
-        default_level = "Medium" if risk_status == "Moderate" else "High" if risk_status == "High-Risk" else "Low"
-        for i in range(logs_count):
-            log_assessments[i] = LogRiskAssessment(
-                risk_level=default_level, 
-                reason="Assessment inferred from overall risk status"
-            )
-    
-    # Fill in any missing log assessments with defaults
-    for i in range(logs_count):
-        if i not in log_assessments:
-            log_assessments[i] = LogRiskAssessment(
-                risk_level="Low", 
-                reason="Standard business usage"
-            )
-    
-    return AuditResponse(
-        summary=summary,
-        risk_status=risk_status,
-        flags=flags,
-        suggestions=suggestions,
-        log_assessments=log_assessments
-    )
+    return _build_response(summary, risk_status, flags, suggestions, log_assessments, log_indices, fill_missing)
+
+def _salvage_json(text):
+    """Recover what validates from a JSON response that failed strict validation.
+
+    Entries of log_assessments are decoded one at a time, so everything before a
+    truncation point or a malformed entry is kept.
+    """
+    output = AuditOutput()
+    start = text.find('"log_assessments"')
+    pos = text.find("[", start) + 1 if start >= 0 else 0
+    while pos:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text) or text[pos] == "]":
+            break
+        try:
+            item, pos = _json_decoder.raw_decode(text, pos)
+        except ValueError:
+            break  # Truncated output: keep the entries decoded so far
+        try:
+            output.log_assessments.append(LogAssessmentOutput.model_validate(item))
+        except ValueError:
+            continue  # Skip an invalid entry
 
-def audit_logs(logs: List[PromptLogEntry]) -> AuditResponse:
-    # Format logs for the prompt
-    logs_text = ""
-    for i, log in enumerate(logs):
-        logs_text += f"LOG {i}: User: {log.user}, Prompt: '{log.prompt}', Tokens: {log.tokens}, Model: {log.model}\n"
-    
-    # Try to get policy context (if RAG is enabled)
     try:
-        policy_context = get_policy_context(logs_text)
-        has_policy = True
-    except Exception as e:
-        policy_context = f"No policy information available. Error: {str(e)}"
-        has_policy = False
-    
-    # Create the prompt
-    template = load_prompt_template()
-    prompt = PromptTemplate(
-        template=template,
-        input_variables=["logs", "policy_context"]
+        data = json.loads(text)
+    except ValueError:
+        return output
+    if isinstance(data, dict):
+        for name in ("suggestions", "flags", "summary", "risk_status"):
+            if name in data:
+                try:
+                    setattr(output, name, getattr(AuditOutput.model_validate({name: data[name]}), name))
+                except ValueError:
+                    pass
+    return output
+
+def _strip_fence(response):
+    """Response without a Markdown code fence around it (models add one in either format)"""
+    text = response.strip()
+    if text.startswith("```"):
+        text = text[text.find("\n") + 1:] if "\n" in text else text[3:]
+        text = text[:-3] if text.endswith("```") else text
+    return text.strip()
+
+def parse_json_response(response, logs_count, log_indices=None, fill_missing=True):
+    """Parse a JSON-mode response in a single validating pass, salvaging partial output"""
+    if log_indices is None:
+        log_indices = range(logs_count)
+    text = _strip_fence(response)
+    try:
+        output = AuditOutput.model_validate_json(text)
+    except ValueError:
+        output = _salvage_json(text)
+
+    log_assessments = {
+        entry.log: LogRiskAssessment(risk_level=entry.risk_level.strip().capitalize(), reason=entry.reason.strip())
+        for entry in output.log_assessments
+    }
+    suggestions = [s.strip() for s in output.suggestions if s.strip()]
+    flags = [f.strip() for f in output.flags]
+    return _build_response(output.summary.strip(), output.risk_status, flags, suggestions,
+                           log_assessments, log_indices, fill_missing)
+
+def parse_model_output(response, logs_count, log_indices=None, fill_missing=True):
+    """Parse a response in whichever format the model actually used"""
+    if _strip_fence(response).startswith("{"):
+        return parse_json_response(response, logs_count, log_indices, fill_missing)
+    return parse_response(response, logs_count, log_indices, fill_missing)
+
+class IncrementalParser:
+    """Parse a streamed response as it arrives, in either output format.
+
+    feed() returns the LOG assessments completed by a new piece of text; each LOG number is
+    returned once, even across a retried call. `violation` is set as soon as the response
+    clearly breaks the format (no section header or JSON object at the start, or repeated
+    malformed or unexpected LOG entries), so the caller can stop paying for the rest of it.
+    """
+
+    PREAMBLE_CHARS = 300  # Text allowed before the first ===SECTION=== header
+    MAX_MALFORMED = 3  # Consecutive bad LOG entries tolerated
+
+    def __init__(self, log_indices):
+        self.expected = set(log_indices)
+        self.assessments = {}
+        self.reset()
+
+    def reset(self):
+        """Start over on a new response, keeping the assessments already returned"""
+        # Only the unconsumed tail of the response is buffered, so feeding stays linear
+        self._buffer = ""
+        self._pos = 0
+        self._consumed = 0  # Characters dropped from the front of the buffer
+        self._mode = None  # "text" or "json", decided by the first characters
+        self._section = None
+        self._in_list = False
+        self._list_done = False
+        self._decoded_to = -1  # Position of the last "}" a JSON entry was decoded up to
+        self._malformed = 0
+        self._seen = set()  # LOG numbers in this response
+        self.violation = None
+
+    def feed(self, piece):
+        if self.violation is not None or not piece or self._list_done:
+            return {}
+        self._buffer += piece
+        if self._mode is None:
+            head = self._buffer.lstrip()
+            if head.startswith("```"):
+                # Decide on what follows a code fence line
+                if "\n" not in head:
+                    return {}
+                head = head[head.find("\n") + 1:].lstrip()
+            if len(head) < 3 and "\n" not in head:
+                return {}
+            self._mode = "json" if head.startswith("{") else "text"
+        new = self._feed_json() if self._mode == "json" else self._feed_text()
+        self.assessments.update(new)
+        return new
+
+    def _accept(self, idx, assessment, new):
+        if idx not in self.expected or idx in self._seen:
+            self._reject(f"unexpected LOG {idx}")
+            return
+        self._seen.add(idx)
+        self._malformed = 0
+        # A retried call repeats the LOG lines an earlier attempt already returned
+        if idx not in self.assessments:
+            new[idx] = assessment
+
+    def _trim(self):
+        """Drop the consumed part of the buffer"""
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._consumed += self._pos
+            self._decoded_to -= self._pos
+            self._pos = 0
+
+    def _reject(self, reason):
+        self._malformed += 1
+        if self._malformed >= self.MAX_MALFORMED:
+            self.violation = f"{self._malformed} malformed LOG entries in a row ({reason})"
+
+    def _feed_text(self):
+        new = {}
+        while self.violation is None:
+            end = self._buffer.find("\n", self._pos)
+            if end < 0:
+                break
+            line = self._buffer[self._pos:end].strip()
+            self._pos = end + 1
+            if not line:
+                continue
+            header = _SECTION_PATTERN.match(line)
+            if header:
+                self._section = header.group(1)
+            elif self._section == "LOG ASSESSMENTS":
+                match = _LOG_LINE_PATTERN.match(line)
+                if match:
+                    assessment = LogRiskAssessment(risk_level=match.group(2).capitalize(), reason=match.group(3).strip())
+                    self._accept(int(match.group(1)), assessment, new)
+                else:
+                    self._reject("not a LOG line")
+        self._trim()
+        if self._section is None and self._consumed + len(self._buffer) > self.PREAMBLE_CHARS:
+            self.violation = "no section header at the start of the response"
+        return new
+
+    def _feed_json(self):
+        new = {}
+        text = self._buffer
+        if not self._in_list:
+            start = text.find('"log_assessments"')
+            bracket = text.find("[", start) if start >= 0 else -1
+            if bracket < 0:
+                return new
+            self._in_list = True
+            self._pos = bracket + 1
+        while not self._list_done and self.violation is None:
+            pos = self._pos
+            while pos < len(text) and text[pos] in " \t\r\n,":
+                pos += 1
+            self._pos = pos
+            if pos < len(text) and text[pos] == "]":
+                self._list_done = True
+                break
+            # An entry can only be complete once another "}" has arrived
+            closing = text.rfind("}")
+            if closing < pos or closing == self._decoded_to:
+                break
+            try:
+                item, self._pos = _json_decoder.raw_decode(text, pos)
+            except ValueError:
+                self._decoded_to = closing  # Incomplete (or broken) entry: wait for more text
+                break
+            try:
+                entry = LogAssessmentOutput.model_validate(item)
+            except ValueError:
+                self._reject("invalid log_assessments entry")
+                continue
+            assessment = LogRiskAssessment(risk_level=entry.risk_level.strip().capitalize(), reason=entry.reason.strip())
+            self._accept(entry.log, assessment, new)
+        self._trim()
+        return new
+
+def _parsing_error_response(log_indices):
+    """Response used when the model never produced a usable assessment"""
+    return AuditResponse(
+        summary="⚠️ Parsing Error: Could not properly analyze the logs due to formatting issues",
+        risk_status="High-Risk",  # Default to high risk on parsing failure
+        flags=["Unable to properly analyze logs due to parsing error",
+               "System defaulted to High-Risk as a precaution"],
+        suggestions=["Try again with a different set of logs",
+                     "Check for any unusual characters or formatting in the logs"],
+        log_assessments={i: LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to parsing error")
+                         for i in log_indices}
     )
-    
-    # Setup the LLM
-    llm = ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo")
-    chain = LLMChain(llm=llm, prompt=prompt)
-    
-    # Get the response
-    raw_response = chain.run(logs=logs_text, policy_context=policy_context)
-    
-    # Check if it matches our expected format
-    format_valid = check_format(raw_response, len(logs))
-    
-    # If format is invalid, retry once with explicit instructions
-    if not format_valid:
-        print("Initial response format invalid. Retrying with explicit instructions...")
-        
-        retry_template = """
-        Your previous response did not follow the required format. Here was your response:
 
-        {previous_response}
+async def _invoke_model(chain, inputs, call, parser=None, on_assessments=None):
+    """Run one model call within the upstream rate limits, recording its latency and token usage.
 
-        Please redo your analysis and provide it in EXACTLY this format:
+    With a parser the response is streamed: on_assessments, if given, is awaited with each batch
+    of LOG assessments as soon as their lines are complete, and the stream is cut off when the
+    parser reports a format violation (the caller repairs whatever is still missing).
+    """
+    limiter = get_rate_limiter()
+    estimated = sum(estimate_tokens(value) for value in inputs.values() if isinstance(value, str))
 
-        ===LOG ASSESSMENTS===
-        LOG 0: High/Medium/Low | Brief reason
-        LOG 1: High/Medium/Low | Brief reason
-        (one line for EACH log number from 0 to {log_count})
+    async def invoke():
+        with metrics.span("llm", metrics.LLM_DURATION, model=AUDIT_MODEL, call=call):
+            if parser is None:
+                return await chain.ainvoke(inputs)
+            return await stream()
 
-        ===SUGGESTIONS===
-        - First suggestion
-        - Second suggestion
+    async def stream():
+        parser.reset()
+        start = time.perf_counter()
+        first = True
+        # Content pieces are joined once at the end; adding message chunks copies the content each time
+        pieces = []
+        usage = None
+        chunks = chain.astream(inputs)
+        try:
+            async for chunk in chunks:
+                pieces.append(chunk.content)
+                usage = chunk.usage_metadata or usage
+                new = parser.feed(chunk.content)
+                if new:
+                    if first:
+                        metrics.LLM_FIRST_ASSESSMENT.observe(time.perf_counter() - start, model=AUDIT_MODEL)
+                        first = False
+                    if on_assessments is not None:
+                        await on_assessments(new)
+                if parser.violation:
+                    metrics.STREAM_ABORTS.inc(model=AUDIT_MODEL)
+                    print(f"Stopping malformed {call} response: {parser.violation}")
+                    break
+        finally:
+            await chunks.aclose()
+        return AIMessage(content="".join(pieces), usage_metadata=usage)
 
-        ===FLAGS===
-        - First flag/concern
-        - Second flag/concern
-        (or "- No policy violations detected" if none)
+    message = await limiter.call(invoke, estimated)
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        # An aborted stream ends before the usage is reported; the estimate stays charged
+        usage = {"input_tokens": estimated, "output_tokens": estimate_tokens(message.content)}
+    else:
+        await limiter.settle(estimated, usage.get("total_tokens", 0))
+    metrics.LLM_TOKENS.inc(usage.get("input_tokens", 0), model=AUDIT_MODEL, direction="sent")
+    metrics.LLM_TOKENS.inc(usage.get("output_tokens", 0), model=AUDIT_MODEL, direction="received")
+    return message.content
 
-        ===SUMMARY===
-        One paragraph summary
+def _parse_timed(response, logs_count, log_indices):
+    """parse_model_output (without defaults for missing logs), recording the parse time"""
+    with metrics.span("parse", metrics.PARSE_DURATION, model=AUDIT_MODEL, format=AUDIT_OUTPUT_FORMAT):
+        return parse_model_output(response, logs_count, log_indices, fill_missing=False)
 
-        ===RISK STATUS===
-        Safe OR Moderate OR High-Risk
+async def _repair_chunk(result, missing, log_lines, policy_context, chain, on_assessments=None):
+    """Re-request assessments for the missing LOG numbers only, with bounded retries and backoff.
 
-        Original logs:
-        {logs}
+    Returns the number of repair calls made; repaired assessments and flags are added to result.
+    """
+    attempts = 0
+    while missing and attempts < AUDIT_REPAIR_ATTEMPTS:
+        await asyncio.sleep(AUDIT_REPAIR_BACKOFF * 2 ** attempts * random.uniform(0.5, 1.0))
+        attempts += 1
+        metrics.REPAIRS.inc(model=AUDIT_MODEL)
+        print(f"Response missing {len(missing)} log assessments. Repair attempt {attempts}...")
 
-        Policy context:
-        {policy_context}
-        """
-        
-        retry_prompt = PromptTemplate(
-            template=retry_template,
-            input_variables=["previous_response", "log_count", "logs", "policy_context"]
-        )
-        
-        retry_chain = LLMChain(llm=ChatOpenAI(temperature=0, model_name="gpt-3.5-turbo"), prompt=retry_prompt)
-        
-        raw_response = retry_chain.run(
-            previous_response=raw_response,
-            log_count=len(logs)-1,  # Logs are 0-indexed
-            logs=logs_text,
-            policy_context=policy_context
-        )
-        
-        # Check format again
-        format_valid = check_format(raw_response, len(logs))
-        
-        if not format_valid:
-            # Still failed, return error response
-            print("Retry failed. Returning error response.")
-            return AuditResponse(
-                summary="⚠️ Parsing Error: Could not properly analyze the logs due to formatting issues",
-                risk_status="High-Risk",  # Default to high risk on parsing failure
-                flags=["Unable to properly analyze logs due to parsing error", 
-                       "System defaulted to High-Risk as a precaution"],
-                suggestions=["Try again with a different set of logs", 
-                             "Check for any unusual characters or formatting in the logs"],
-                log_assessments={i: LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to parsing error") 
-                               for i in range(len(logs))}
-            )
-    
-    # Parse the valid response
+        logs_text = "".join(log_lines[idx] + "\n" for idx in missing)
+        parser = IncrementalParser(missing) if AUDIT_STREAM_RESPONSES else None
+        try:
+            response = await _invoke_model(chain, {
+                "logs": logs_text,
+                "policy_context": policy_context,
+                "log_numbers": ", ".join(map(str, missing)),
+                "schema": OUTPUT_SCHEMA
+            }, "repair", parser, on_assessments)
+            repaired = _parse_timed(response, len(missing), missing)
+        except Exception as e:
+            print(f"Repair attempt failed: {str(e)}")
+            if parser is None:
+                continue
+            repaired = AuditResponse(summary="")
+        if parser is not None:
+            repaired.log_assessments.update(parser.assessments)
+
+        # Only accept assessments for logs that were actually asked for
+        for idx in missing:
+            if idx in repaired.log_assessments:
+                result.log_assessments[idx] = repaired.log_assessments[idx]
+        result.flags.extend(f for f in repaired.flags if f not in result.flags)
+        missing = [idx for idx in missing if idx not in result.log_assessments]
+    return attempts
+
+async def _audit_chunk(chunk: List[Tuple[int, PromptLogEntry]], on_assessments=None) -> AuditResponse:
+    """Audit a chunk of (index, log) pairs with one LLM call, keeping the global LOG numbers.
+
+    Assessments that parse are kept; only missing LOG lines are re-requested (see _repair_chunk).
+    With AUDIT_STREAM_RESPONSES, on_assessments is awaited with each LOG assessment as the
+    response streams in.
+    """
+    log_indices = [idx for idx, _ in chunk]
+
+    # Retrieve the policy sections relevant to each log; sections shared by several logs are listed once
     try:
-        result = parse_response(raw_response, len(logs))
-        return result
+        policy_context, policy_refs = await aget_log_policy_context([log.prompt for _, log in chunk])
+    except Exception as e:
+        policy_context = f"No policy information available. Error: {str(e)}"
+        policy_refs = [[] for _ in chunk]
+
+    with metrics.span("format", metrics.PROMPT_FORMAT_DURATION, model=AUDIT_MODEL):
+        # Format logs for the prompt, each pointing at its policy sections
+        log_lines = {
+            idx: format_log_line(idx, log) + (f" | Policy: {', '.join(refs)}" if refs else "")
+            for (idx, log), refs in zip(chunk, policy_refs)
+        }
+        logs_text = "".join(line + "\n" for line in log_lines.values())
+
+    # Compiled template and pooled model, shared by every request
+    runtime = get_runtime()
+
+    # Get the response, streamed so that LOG lines are used (and format errors caught) as they arrive
+    parser = IncrementalParser(log_indices) if AUDIT_STREAM_RESPONSES else None
+    raw_response = await _invoke_model(
+        runtime.audit_chain(), {"logs": logs_text, "policy_context": policy_context, "schema": OUTPUT_SCHEMA}, "audit",
+        parser, on_assessments
+    )
+
+    # Keep whatever parsed, then repair only the gaps
+    try:
+        result = _parse_timed(raw_response, len(chunk), log_indices)
     except Exception as e:
         # Handle any parsing errors
+        metrics.FORMAT_FAILURES.inc(model=AUDIT_MODEL)
         print(f"Error parsing response: {str(e)}")
+        log_assessments = {i: LogRiskAssessment(risk_level="Medium", reason="Processing error") for i in log_indices}
+        if parser is not None:
+            log_assessments.update(parser.assessments)
         return AuditResponse(
             summary=f"Error parsing LLM response: {str(e)}",
             risk_status="High-Risk",
             flags=["Error in processing audit results"],
             suggestions=["Please try again"],
-            log_assessments={i: LogRiskAssessment(risk_level="Medium", reason="Processing error") 
-                          for i in range(len(logs))}
-        )
\ No newline at end of file
+            log_assessments=log_assessments
+        )
+    if parser is not None:
+        # Assessments already handed out while streaming stand
+        result.log_assessments.update(parser.assessments)
+
+    chunk_indices = set(log_indices)
+    result.log_assessments = {idx: a for idx, a in result.log_assessments.items() if idx in chunk_indices}
+    missing = [idx for idx in log_indices if idx not in result.log_assessments]
+    if missing:
+        metrics.FORMAT_FAILURES.inc(model=AUDIT_MODEL)
+    repairs = await _repair_chunk(
+        result, missing, log_lines, policy_context, runtime.repair_chain(), on_assessments
+    ) if missing else 0
+    result.stats = AuditStats(llm_repairs=repairs)
+
+    if not result.log_assessments:
+        # Nothing usable even after the repair attempts
+        print("Repair failed. Returning error response.")
+        result = _parsing_error_response(log_indices)
+        result.stats = AuditStats(llm_repairs=repairs)
+        return result
+
+    unparsed = [idx for idx in log_indices if idx not in result.log_assessments]
+    for idx in unparsed:
+        result.log_assessments[idx] = LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to parsing error")
+    if unparsed:
+        result.flags.append(f"{len(unparsed)} logs could not be analyzed due to parsing errors")
+
+    return result
+
+
+def chunk_logs(indexed_logs, token_budget=AUDIT_CHUNK_TOKEN_BUDGET, max_logs=AUDIT_MAX_CHUNK_LOGS,
+               policy_tokens=AUDIT_POLICY_CONTEXT_TOKENS):
+    """Split (index, log) pairs into chunks that fit the per-call token budget.
+
+    policy_tokens of the budget are reserved for the policy context, which
+    format_policy_context keeps within that allowance. Prompts over AUDIT_MAX_PROMPT_TOKENS
+    are compacted first, so the chunks hold the (index, log) pairs exactly as they will be sent.
+    """
+    token_budget = max(token_budget - policy_tokens, 1)
+    indexed_logs = compact_logs(indexed_logs)
+    costs = count_tokens_batch(format_log_line(idx, log) for idx, log in indexed_logs)
+    chunks = []
+    current = []
+    used = 0
+    for (idx, log), cost in zip(indexed_logs, costs):
+        cost += POLICY_REF_TOKENS
+        if current and (used + cost > token_budget or len(current) >= max_logs):
+            chunks.append(current)
+            current = []
+            used = 0
+        # An oversized log still gets a chunk of its own
+        current.append((idx, log))
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def derive_risk_status(log_assessments, statuses=()):
+    """Compute the overall risk status from per-log assessments and per-chunk statuses"""
+    level = max((RISK_STATUS_ORDER.get(s, 0) for s in statuses), default=0)
+    for assessment in log_assessments.values():
+        if assessment.risk_level == "High":
+            return "High-Risk"
+        if assessment.risk_level == "Medium":
+            level = max(level, 1)
+    return next(s for s, rank in RISK_STATUS_ORDER.items() if rank == level)
+
+def _unique(items):
+    """Remove duplicates while keeping the original order"""
+    return list(dict.fromkeys(items))
+
+async def _audit_indexed_chunk(chunk: List[Tuple[int, PromptLogEntry]], semaphore, on_progress=None):
+    """Audit a chunk, keeping only assessments for the logs it contains.
+
+    Returns (AuditResponse, error) so that one failing chunk does not lose the whole batch.
+    on_progress gets streamed assessments as they arrive and the rest once the chunk is done.
+    """
+    emitted = {}
+    on_assessments = None
+    if on_progress is not None:
+        async def on_assessments(assessments):
+            emitted.update(assessments)
+            await on_progress(assessments)
+
+    try:
+        async with semaphore:
+            result = await _audit_chunk(chunk, on_assessments)
+    except Exception as e:
+        metrics.CHUNK_ERRORS.inc(model=AUDIT_MODEL)
+        print(f"Error auditing chunk of {len(chunk)} logs: {str(e)}")
+        result = AuditResponse(
+            summary="",
+            risk_status="High-Risk",
+            flags=[f"Unable to analyze {len(chunk)} logs due to a processing error"],
+            log_assessments={idx: LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to processing error")
+                             for idx, _ in chunk if idx not in emitted}
+        )
+        if on_progress is not None and result.log_assessments:
+            await on_progress(result.log_assessments)
+        # Assessments streamed before the failure are kept
+        result.log_assessments.update(emitted)
+        return result, e
+
+    log_assessments = {}
+    for idx, _ in chunk:
+        assessment = result.log_assessments.get(idx)
+        if assessment is None:
+            assessment = LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to parsing error")
+        log_assessments[idx] = assessment
+    result.log_assessments = log_assessments
+    remaining = {idx: a for idx, a in log_assessments.items() if idx not in emitted}
+    if on_progress is not None and remaining:
+        await on_progress(remaining)
+    return result, None
+
+def merge_responses(results: List[AuditResponse], logs_count) -> AuditResponse:
+    """Merge per-chunk responses into a single AuditResponse"""
+    if len(results) == 1 and logs_count == len(results[0].log_assessments):
+        result = results[0]
+        result.risk_status = derive_risk_status(result.log_assessments, [result.risk_status])
+        return result
+
+    log_assessments = {}
+    for result in results:
+        log_assessments.update(result.log_assessments)
+    log_assessments = dict(sorted(log_assessments.items()))
+
+    summaries = _unique(r.summary for r in results if r.summary)
+
+    return AuditResponse(
+        summary=" ".join(summaries),
+        risk_status=derive_risk_status(log_assessments, [r.risk_status for r in results]),
+        flags=_unique(flag for r in results for flag in r.flags),
+        suggestions=_unique(s for r in results for s in r.suggestions),
+        log_assessments=log_assessments
+    )
+
+def _lookup_cached(indexed_logs, cache, keys):
+    """Split logs into cached assessments and the (index, log) pairs that still need the LLM"""
+    log_assessments = {}
+    flags = []
+    remaining = []
+    for idx, log in indexed_logs:
+        assessment = cache.get(keys[idx])
+        if assessment is None:
+            remaining.append((idx, log))
+            continue
+        log_assessments[idx] = assessment
+        if assessment.risk_level == "High":
+            flags.append(f"LOG {idx}: {assessment.reason} (user {log.user})")
+
+    result = AuditResponse(
+        summary=f"{len(log_assessments)} logs matched previous audits." if log_assessments else "",
+        flags=flags,
+        log_assessments=log_assessments
+    )
+    return result, remaining
+
+def _store_cached(results, cache, keys):
+    """Cache every assessment the model actually produced"""
+    for result in results:
+        for idx, assessment in result.log_assessments.items():
+            if assessment.reason not in FALLBACK_REASONS:
+                cache.set(keys[idx], assessment)
+
+async def audit_logs_async(logs: List[PromptLogEntry], max_concurrency=AUDIT_MAX_CONCURRENCY,
+                           on_progress=None, log_indices=None) -> AuditResponse:
+    """Audit logs in token-budgeted chunks, running up to max_concurrency LLM calls at once.
+
+    on_progress, if given, is awaited with a {index: LogRiskAssessment} dict every time a
+    group of logs has been assessed (pre-screen, cache, each streamed LOG line and each
+    finished chunk); every log is reported once.
+    log_indices overrides the LOG numbers (0 to len(logs) - 1 by default), e.g. for logs
+    that are part of a larger stream.
+    """
+    if not logs:
+        return AuditResponse(summary="No logs to audit", stats=AuditStats())
+    with metrics.span("total", metrics.AUDIT_DURATION, model=AUDIT_MODEL):
+        result = await _run_audit(logs, max_concurrency, on_progress, log_indices)
+
+    stats = result.stats
+    for stage, count in (("prescreen", stats.prescreened), ("cache", stats.cache_hits),
+                         ("dedup", stats.deduplicated), ("llm", stats.llm_audited)):
+        metrics.AUDIT_LOGS.inc(count, model=AUDIT_MODEL, stage=stage)
+    metrics.CACHE_HITS.inc(stats.cache_hits, model=AUDIT_MODEL)
+    metrics.CACHE_MISSES.inc(stats.cache_misses, model=AUDIT_MODEL)
+
+    # Profiles learn from the model's own assessments (before any escalation they cause);
+    # logs that could not be analyzed are left out of profiles and history
+    assessed = {idx: a for idx, a in result.log_assessments.items() if a.reason not in UNANALYZED_REASONS}
+    profiles = get_profiles()
+    try:
+        if PROFILE_ESCALATION:
+            stats.escalated = await asyncio.to_thread(escalate_logs, result, logs, log_indices, profiles)
+        await asyncio.to_thread(profiles.observe, logs, assessed, log_indices)
+    except Exception as e:
+        print(f"Failed to update risk profiles: {str(e)}")
+
+    history = get_history()
+    if history is not None:
+        if stats.escalated:
+            assessed = {idx: result.log_assessments[idx] for idx in assessed}
+        try:
+            await asyncio.to_thread(history.record, logs, assessed, log_indices)
+        except Exception as e:
+            print(f"Failed to record audit history: {str(e)}")
+    return result
+
+def escalate_logs(result: AuditResponse, logs, log_indices, profiles) -> int:
+    """Raise Low assessments to Medium for users whose recent findings are mostly High.
+
+    Profiles built from earlier audits act as a prior; returns the number of escalated logs.
+    """
+    escalated_users = profiles.escalated_users(log.user for log in logs)
+    if not escalated_users:
+        return 0
+    count = 0
+    indices = log_indices if log_indices is not None else range(len(logs))
+    for idx, log in zip(indices, logs):
+        assessment = result.log_assessments.get(idx)
+        if (assessment is not None and assessment.risk_level == "Low" and log.user in escalated_users
+                and assessment.reason not in UNANALYZED_REASONS):
+            result.log_assessments[idx] = LogRiskAssessment(
+                risk_level="Medium", reason=f"{assessment.reason} (escalated: user is repeatedly flagged)"
+            )
+            count += 1
+    if count:
+        result.flags.append(f"{count} low-risk logs escalated because their users are repeatedly flagged")
+        result.risk_status = derive_risk_status(result.log_assessments, [result.risk_status])
+    return count
+
+async def _run_audit(logs, max_concurrency, on_progress, log_indices):
+    # Pick up prompt template edits before the template version goes into cache keys
+    runtime = get_runtime()
+    runtime.refresh()
+
+    indexed_logs = list(zip(log_indices, logs)) if log_indices is not None else list(enumerate(logs))
+    results = []
+    stats = AuditStats(total_logs=len(logs))
+
+    # Clear-cut logs are assessed locally and never reach the LLM
+    if AUDIT_PRESCREEN:
+        # CPU-bound on large batches, so keep it off the event loop
+        with metrics.span("prescreen"):
+            prescreened, indexed_logs = await asyncio.to_thread(
+                prescreen_logs, indexed_logs, skip_safe=AUDIT_PRESCREEN_SKIP_SAFE
+            )
+        stats.prescreened = len(prescreened.log_assessments)
+        if prescreened.log_assessments:
+            results.append(prescreened)
+            if on_progress is not None:
+                await on_progress(prescreened.log_assessments)
+
+    # Logs seen before (same prompt, model, token bucket, policy and template) skip the LLM
+    cache = get_cache()
+    keys = {}
+    if cache is not None and indexed_logs:
+        policy_version = policy_corpus_version()
+        prompt_version = runtime.template_version
+        model_id = backend_id(AUDIT_MODEL)
+        keys = {idx: cache_key(log, model_id, policy_version, prompt_version) for idx, log in indexed_logs}
+        with metrics.span("cache"):
+            cached, indexed_logs = await asyncio.to_thread(_lookup_cached, indexed_logs, cache, keys)
+        stats.cache_hits = len(cached.log_assessments)
+        stats.cache_misses = len(indexed_logs)
+        if cached.log_assessments:
+            results.append(cached)
+            if on_progress is not None:
+                await on_progress(cached.log_assessments)
+
+    # Only one representative of each cluster of (near-)duplicate prompts goes to the LLM
+    members = {}
+    chunk_progress = on_progress
+    if AUDIT_DEDUP and len(indexed_logs) > 1:
+        pending = len(indexed_logs)
+        with metrics.span("dedup"):
+            indexed_logs, members = await asyncio.to_thread(cluster_logs, indexed_logs)
+        stats.deduplicated = pending - len(indexed_logs)
+        stats.dedup_ratio = round(stats.deduplicated / pending, 4)
+        if members and on_progress is not None:
+            async def chunk_progress(assessments):
+                await on_progress(fan_out(assessments, members, FALLBACK_REASONS))
+
+    chunks = await asyncio.to_thread(chunk_logs, indexed_logs)
+    stats.llm_audited = len(indexed_logs)
+    stats.llm_batches = len(chunks)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    outcomes = await asyncio.gather(*(_audit_indexed_chunk(chunk, semaphore, chunk_progress) for chunk in chunks))
+    stats.llm_repairs = sum(r.stats.llm_repairs for r, _ in outcomes if r.stats)
+
+    # Surface the error if nothing could be audited at all
+    errors = [error for _, error in outcomes if error]
+    if outcomes and len(errors) == len(outcomes):
+        # Rate limits are reported as such, so callers can ask the client to retry later
+        rate_limited = [error for error in errors if isinstance(error, RateLimited)]
+        if rate_limited:
+            raise rate_limited[0]
+        raise RuntimeError(str(errors[0]))
+
+    if cache is not None:
+        await asyncio.to_thread(_store_cached, [r for r, error in outcomes if not error], cache, keys)
+    for result, _ in outcomes:
+        if members:
+            result.log_assessments = fan_out(result.log_assessments, members, FALLBACK_REASONS)
+        results.append(result)
+
+    result = merge_responses(results, len(logs))
+    if len(chunks) > 1:
+        result.summary = f"Audited {len(logs)} logs in {len(chunks)} batches. {result.summary}"
+    result.stats = stats
+    return result
+
+def audit_logs(logs: List[PromptLogEntry], max_concurrency=AUDIT_MAX_CONCURRENCY) -> AuditResponse:
+    """Synchronous entry point for scripts; the API awaits audit_logs_async directly"""
+    return asyncio.run(audit_logs_async(logs, max_concurrency=max_concurrency))
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import random
+import re
+import time
+import zlib
+from typing import Any, AsyncIterator, Iterator, List, Optional
+import httpx
+import numpy as np
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from .prescreen import detect, DETECTORS
+from .config import (
+    LLM_BACKEND, EMBED_BACKEND, EMBED_DIMENSION, POLICY_EMBED_BATCH_SIZE,
+    MOCK_LLM_LATENCY, MOCK_LLM_LATENCY_PER_LOG, MOCK_LLM_MALFORMED_RATE, MOCK_LLM_RATE_LIMIT_RATE, MOCK_SEED
+)
+
+# Characters per streamed chunk (about four tokens)
+STREAM_CHUNK_CHARS = 16
+
+# Log lines as written by audit.format_log_line
+_LOG_LINE = re.compile(r"^LOG (\d+): User: (.*?), Prompt: '(.*)', Tokens: (\d+), Model: (.*)$", re.MULTILINE)
+_WORD = re.compile(r"\w+")
+
+def _stable_seed(text, seed):
+    """Seed that is identical across processes for the same text"""
+    return zlib.crc32(text.encode("utf-8")) ^ seed
+
+def _assess(prompt, tokens):
+    """Deterministic stand-in for the model's judgement of one log"""
+    found = detect(prompt)
+    if found:
+        return "High", f"Prompt contains {DETECTORS[found[0]][1]}"
+    if tokens > 1000:
+        return "Medium", "Large token usage without a stated business justification"
+    return "Low", "Routine business request"
+
+def mock_audit_response(prompt_text, malformed_rate=0.0, seed=0, json_output=False):
+    """Build a response (===SECTION=== text or JSON) for every LOG line found in the prompt"""
+    rng = random.Random(_stable_seed(prompt_text, seed))
+    assessments = []
+    flags = []
+    seen = set()
+    for match in _LOG_LINE.finditer(prompt_text):
+        idx, user, prompt, tokens = int(match.group(1)), match.group(2), match.group(3), int(match.group(4))
+        # Retrieved context may quote log lines again
+        if idx in seen:
+            continue
+        seen.add(idx)
+        level, reason = _assess(prompt, tokens)
+        assessments.append((idx, level, reason))
+        if level == "High":
+            flags.append(f"LOG {idx}: {reason} (user {user})")
+
+    levels = [level for _, level, _ in assessments]
+    if "High" in levels:
+        status = "High-Risk"
+    elif "Medium" in levels:
+        status = "Moderate"
+    else:
+        status = "Safe"
+    suggestions = ["Keep sensitive data out of prompts", "Cache repeated prompts"]
+    summary = (f"Reviewed {len(levels)} logs: {levels.count('High')} high, "
+               f"{levels.count('Medium')} medium and {levels.count('Low')} low risk.")
+
+    # Simulate the ways real models break the format
+    failure = None
+    if rng.random() < malformed_rate:
+        failure = rng.choice(["drop_logs", "drop_section", "prose"])
+        if failure == "drop_logs":
+            assessments = [a for a in assessments if rng.random() >= 0.2]
+        elif failure == "prose":
+            return f"Here is my analysis of the {len(levels)} logs. Overall the usage looks {status.lower()}."
+
+    if json_output:
+        output = {
+            "log_assessments": [{"log": idx, "risk_level": level, "reason": reason} for idx, level, reason in assessments],
+            "suggestions": suggestions,
+            "flags": flags,
+            "summary": summary,
+            "risk_status": status,
+        }
+        if failure == "drop_section":
+            del output[rng.choice(["suggestions", "flags", "summary", "risk_status"])]
+        return json.dumps(output)
+
+    lines = ["===LOG ASSESSMENTS==="] + [f"LOG {idx}: {level} | {reason}" for idx, level, reason in assessments]
+    lines += ["", "===SUGGESTIONS==="] + [f"- {s}" for s in suggestions]
+    lines += ["", "===FLAGS==="] + [f"- {flag}" for flag in flags or ["No policy violations detected"]]
+    lines += ["", "===SUMMARY===", summary]
+    lines += ["", "===RISK STATUS===", status]
+    if failure == "drop_section":
+        lines.remove(rng.choice(["===SUGGESTIONS===", "===FLAGS===", "===SUMMARY===", "===RISK STATUS==="]))
+    return "\n".join(lines)
+
+class MockAuditChatModel(BaseChatModel):
+    """Offline chat model that answers audit prompts deterministically"""
+
+    model_name: str = "mock-auditor"
+    latency: float = MOCK_LLM_LATENCY
+    latency_per_log: float = MOCK_LLM_LATENCY_PER_LOG
+    malformed_rate: float = MOCK_LLM_MALFORMED_RATE
+    rate_limit_rate: float = MOCK_LLM_RATE_LIMIT_RATE
+    seed: int = MOCK_SEED
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock-auditor"
+
+    def _check_rate_limit(self):
+        """Reject a share of calls the way the OpenAI API does when a rate limit is hit"""
+        # Not seeded by the prompt: a retried call must be able to succeed
+        if self.rate_limit_rate and random.random() < self.rate_limit_rate:
+            response = httpx.Response(429, headers={"retry-after": "0.1"},
+                                      request=httpx.Request("POST", "https://mock/v1/chat/completions"))
+            raise openai.RateLimitError("Rate limit reached for mock-auditor", response=response, body=None)
+
+    def _respond(self, messages: List[BaseMessage], response_format=None):
+        prompt_text = "\n".join(str(m.content) for m in messages)
+        json_output = bool(response_format) and response_format.get("type") == "json_object"
+        content = mock_audit_response(prompt_text, self.malformed_rate, self.seed, json_output)
+        usage = {
+            "input_tokens": len(prompt_text) // 4 + 1,
+            "output_tokens": len(content) // 4 + 1,
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        message = AIMessage(content=content, usage_metadata=usage)
+        delay = self.latency + self.latency_per_log * len(_LOG_LINE.findall(prompt_text))
+        return ChatResult(generations=[ChatGeneration(message=message)]), delay
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self._check_rate_limit()
+        result, delay = self._respond(messages, kwargs.get("response_format"))
+        if delay:
+            time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        self._check_rate_limit()
+        result, delay = self._respond(messages, kwargs.get("response_format"))
+        if delay:
+            await asyncio.sleep(delay)
+        return result
+
+    def _stream_pieces(self, messages, response_format):
+        """(delay before the piece, chunk) pairs: the call latency before the first token, then the
+        per-log latency spread over the response, ending with a chunk that carries the usage"""
+        result, delay = self._respond(messages, response_format)
+        message = result.generations[0].message
+        content = message.content
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        step = (delay - self.latency) / max(1, len(pieces))
+        for n, piece in enumerate(pieces):
+            yield (self.latency if n == 0 else 0) + step, ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield 0, ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        self._check_rate_limit()
+        for delay, chunk in self._stream_pieces(messages, kwargs.get("response_format")):
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self._check_rate_limit()
+        # Pieces are due on a fixed schedule, as if generated upstream while the caller reads them;
+        # waits shorter than 5 ms are batched since the event loop cannot time them reliably
+        due = time.monotonic()
+        for delay, chunk in self._stream_pieces(messages, kwargs.get("response_format")):
+            due += delay
+            wait = due - time.monotonic()
+            if wait >= 0.005:
+                await asyncio.sleep(wait)
+            yield chunk
+
+class MockEmbedding(BaseEmbedding):
+    """Offline embedder: hashed bag-of-words vectors, so similar texts land close together"""
+
+    dimension: int = EMBED_DIMENSION
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MockEmbedding"
+
+    def _embed(self, text) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD.findall(text.lower()):
+            bucket = zlib.crc32(word.encode("utf-8"))
+            vector[bucket % self.dimension] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+def get_chat_model(model_name, temperature=0, json_output=False):
+    """Chat model for the configured LLM backend; json_output requests a JSON object response"""
+    if LLM_BACKEND == "mock":
+        llm = MockAuditChatModel(model_name=model_name)
+    else:
+        # Imported lazily so the mock backend works without OpenAI credentials or network
+        from langchain_openai import ChatOpenAI
+        from .clients import get_http_client
+        # Retries are left to the rate limiter, which shares backoff across workers
+        # stream_usage reports token usage on the last chunk of streamed responses
+        llm = ChatOpenAI(temperature=temperature, model_name=model_name, http_async_client=get_http_client(),
+                         max_retries=0, stream_usage=True)
+    if json_output:
+        return llm.bind(response_format={"type": "json_object"})
+    return llm
+
+def get_embed_model(async_http_client=None):
+    """Embedding model for the configured embedding backend; async calls go through async_http_client if given"""
+    if EMBED_BACKEND == "mock":
+        return MockEmbedding(embed_batch_size=POLICY_EMBED_BATCH_SIZE)
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    return OpenAIEmbedding(embed_batch_size=POLICY_EMBED_BATCH_SIZE, async_http_client=async_http_client)
+
+def backend_id(model_name):
+    """Identifies the backend and model, so caches never mix mock and real results"""
+    return f"{LLM_BACKEND}:{model_name}"
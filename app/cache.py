@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from .models import PromptLogEntry, LogRiskAssessment
+from .config import (
+    AUDIT_CACHE, AUDIT_CACHE_MAX_ENTRIES, AUDIT_CACHE_TTL, AUDIT_CACHE_TOKEN_BUCKET,
+    AUDIT_CACHE_SQLITE_PATH, AUDIT_CACHE_SQLITE_MAX_ENTRIES
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Global cache instance (created on first use)
+_cache = None
+
+def normalize_prompt(prompt):
+    """Normalize a prompt so trivial whitespace and casing differences share a cache entry"""
+    return _WHITESPACE.sub(" ", prompt).strip().lower()
+
+def cache_key(log: PromptLogEntry, audit_model, policy_version, template_version, token_bucket=AUDIT_CACHE_TOKEN_BUCKET):
+    """Content address of a per-log assessment"""
+    parts = [
+        normalize_prompt(log.prompt),
+        log.model,
+        audit_model,
+        str(log.tokens // token_bucket),
+        policy_version,
+        template_version,
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+class AuditCache:
+    """Two-tier cache of per-log assessments: an in-memory LRU and an optional SQLite file"""
+
+    def __init__(self, max_entries=AUDIT_CACHE_MAX_ENTRIES, ttl=AUDIT_CACHE_TTL,
+                 sqlite_path=None, sqlite_max_entries=AUDIT_CACHE_SQLITE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_max_entries = sqlite_max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (expires_at, assessment)
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes = 0
+        if sqlite_path:
+            os.makedirs(os.path.dirname(os.path.abspath(sqlite_path)), exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS assessments ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS assessments_accessed ON assessments (accessed_at)")
+            self._db.commit()
+
+    def get(self, key) -> Optional[LogRiskAssessment]:
+        """Look up an assessment, promoting SQLite hits into memory"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM assessments WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._db.execute("UPDATE assessments SET accessed_at = ? WHERE key = ?", (now, key))
+                    assessment = LogRiskAssessment(**json.loads(row[0]))
+                    self._remember(key, row[1], assessment)
+                    self.hits += 1
+                    return assessment
+
+            self.misses += 1
+            return None
+
+    def set(self, key, assessment: LogRiskAssessment):
+        """Store an assessment in every tier"""
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, assessment)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO assessments (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, assessment.model_dump_json(), expires_at, now)
+                )
+                self._writes += 1
+                # Prune expired and least recently used rows every so often rather than on each write
+                if self._writes % 1000 == 0:
+                    self._prune(now)
+                self._db.commit()
+
+    def stats(self):
+        """Hit/miss counters since the cache was created"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+    def _remember(self, key, expires_at, assessment):
+        self._memory[key] = (expires_at, assessment)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now):
+        self._db.execute("DELETE FROM assessments WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM assessments WHERE key IN ("
+            "SELECT key FROM assessments ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.sqlite_max_entries,)
+        )
+
+def get_cache() -> Optional[AuditCache]:
+    """Return the process-wide audit cache, or None when caching is disabled"""
+    global _cache
+    if not AUDIT_CACHE:
+        return None
+    if _cache is None:
+        _cache = AuditCache(sqlite_path=AUDIT_CACHE_SQLITE_PATH or None)
+    return _cache
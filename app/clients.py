@@ -0,0 +1,28 @@
+import asyncio
+import weakref
+import httpx
+from .config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_TIMEOUT
+
+# One pooled HTTP client per event loop (httpx async clients cannot be shared across loops)
+_http_clients = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the pooled async HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=HTTP_TIMEOUT
+        )
+        _http_clients[loop] = client
+    return client
+
+async def close_http_client():
+    """Close the pooled client of the running event loop"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,135 @@
+import os
+
+# Audit engine settings (override through environment variables)
+AUDIT_MODEL = os.environ.get("AUDIT_MODEL", "gpt-3.5-turbo")
+
+# Maximum number of prompt tokens spent on log lines and policy context in a single LLM call,
+# of which at most AUDIT_POLICY_CONTEXT_TOKENS go to the policy context
+AUDIT_CHUNK_TOKEN_BUDGET = int(os.environ.get("AUDIT_CHUNK_TOKEN_BUDGET", "6000"))
+AUDIT_POLICY_CONTEXT_TOKENS = int(os.environ.get("AUDIT_POLICY_CONTEXT_TOKENS", "1500"))
+
+# Prompts longer than this are shortened to their head, tail and suspicious spans before auditing
+AUDIT_MAX_PROMPT_TOKENS = int(os.environ.get("AUDIT_MAX_PROMPT_TOKENS", "500"))
+
+# Maximum number of logs per LLM call (bounds the size of the response as well)
+AUDIT_MAX_CHUNK_LOGS = int(os.environ.get("AUDIT_MAX_CHUNK_LOGS", "100"))
+
+# Number of chunks audited at the same time
+AUDIT_MAX_CONCURRENCY = int(os.environ.get("AUDIT_MAX_CONCURRENCY", "4"))
+
+# Response format requested from the audit model: "json" (validated against a schema) or "text" (===SECTION=== format)
+AUDIT_OUTPUT_FORMAT = os.environ.get("AUDIT_OUTPUT_FORMAT", "json")
+
+# Seconds between checks of the prompt template file for edits (0 disables hot reload)
+AUDIT_TEMPLATE_RELOAD_INTERVAL = float(os.environ.get("AUDIT_TEMPLATE_RELOAD_INTERVAL", "2"))
+
+# Read model responses as a token stream: LOG assessments are used as soon as their line is
+# complete, and a response that breaks the format is cut off early and its missing logs repaired
+AUDIT_STREAM_RESPONSES = os.environ.get("AUDIT_STREAM_RESPONSES", "1") == "1"
+
+# Re-request only the LOG lines missing from a response, up to this many times per chunk
+AUDIT_REPAIR_ATTEMPTS = int(os.environ.get("AUDIT_REPAIR_ATTEMPTS", "2"))
+AUDIT_REPAIR_BACKOFF = float(os.environ.get("AUDIT_REPAIR_BACKOFF", "0.5"))  # seconds, doubled per attempt
+
+# Resolve clear-cut logs (secrets, PII, jailbreak attempts) locally before calling the LLM
+AUDIT_PRESCREEN = os.environ.get("AUDIT_PRESCREEN", "1") == "1"
+
+# Also mark short, plainly benign business requests as Low risk without an LLM call. Off by default:
+# the check is a keyword heuristic, and harmful requests phrased as ordinary tasks would go unread
+AUDIT_PRESCREEN_SKIP_SAFE = os.environ.get("AUDIT_PRESCREEN_SKIP_SAFE", "0") == "1"
+
+# Audit one representative per cluster of near-duplicate prompts (IDs, dates and emails masked)
+AUDIT_DEDUP = os.environ.get("AUDIT_DEDUP", "1") == "1"
+AUDIT_DEDUP_THRESHOLD = float(os.environ.get("AUDIT_DEDUP_THRESHOLD", "0.9"))  # Word-bigram Jaccard similarity
+
+# Cache of per-log assessments, keyed by prompt, model, token bucket, policy and template versions
+AUDIT_CACHE = os.environ.get("AUDIT_CACHE", "1") == "1"
+AUDIT_CACHE_MAX_ENTRIES = int(os.environ.get("AUDIT_CACHE_MAX_ENTRIES", "10000"))
+AUDIT_CACHE_TTL = int(os.environ.get("AUDIT_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+AUDIT_CACHE_TOKEN_BUCKET = int(os.environ.get("AUDIT_CACHE_TOKEN_BUCKET", "250"))
+
+# Optional on-disk tier shared by workers and restarts (disabled when empty)
+AUDIT_CACHE_SQLITE_PATH = os.environ.get("AUDIT_CACHE_SQLITE_PATH", "")
+AUDIT_CACHE_SQLITE_MAX_ENTRIES = int(os.environ.get("AUDIT_CACHE_SQLITE_MAX_ENTRIES", "1000000"))
+
+# Directory of policy documents (.md and .txt, searched recursively) and the re-scan interval (seconds; 0 checks on every audit)
+POLICY_DIR = os.environ.get("POLICY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "policies"))
+POLICY_RELOAD_INTERVAL = float(os.environ.get("POLICY_RELOAD_INTERVAL", "2"))
+
+# Directory where the policy chunks, their vectors and the FAISS index are persisted
+POLICY_INDEX_DIR = os.environ.get("POLICY_INDEX_DIR", ".policy_index")
+
+# Approximate (IVF-PQ) search from this many policy chunks on, inverted lists probed per query,
+# and candidates per result re-ranked on exact vectors (1 disables re-ranking)
+POLICY_ANN_MIN_CHUNKS = int(os.environ.get("POLICY_ANN_MIN_CHUNKS", "10000"))
+POLICY_ANN_NPROBE = int(os.environ.get("POLICY_ANN_NPROBE", "16"))
+POLICY_ANN_RERANK = int(os.environ.get("POLICY_ANN_RERANK", "8"))
+
+# Policy retrieval: chunk size (tokens) of the index, chunks retrieved per log, and cached query results
+POLICY_CHUNK_SIZE = int(os.environ.get("POLICY_CHUNK_SIZE", "64"))
+POLICY_TOP_K = int(os.environ.get("POLICY_TOP_K", "2"))
+POLICY_RETRIEVAL_CACHE_SIZE = int(os.environ.get("POLICY_RETRIEVAL_CACHE_SIZE", "10000"))
+POLICY_EMBED_BATCH_SIZE = int(os.environ.get("POLICY_EMBED_BATCH_SIZE", "100"))  # Texts per embedding call
+
+# Add a Server-Timing header (prescreen, retrieval, format, llm, parse, ... in ms) to /audit responses
+AUDIT_SERVER_TIMING = os.environ.get("AUDIT_SERVER_TIMING", "0") == "1"
+
+# /audit and job results are compressed (gzip or zstd, as the client accepts) from this size on;
+# compressed request bodies may expand to at most WIRE_MAX_REQUEST_BYTES
+WIRE_COMPRESS_MIN_BYTES = int(os.environ.get("WIRE_COMPRESS_MIN_BYTES", "1024"))
+WIRE_MAX_REQUEST_BYTES = int(os.environ.get("WIRE_MAX_REQUEST_BYTES", str(1024 * 1024 * 1024)))
+
+# Connection pool shared by all upstream LLM calls made from one event loop
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", "120"))  # seconds
+
+# Local directory for SQLite stores (jobs, history, ...)
+DATA_DIR = os.environ.get("DATA_DIR", ".data")
+
+# Upstream LLM budgets, shared by all worker processes through a SQLite file (0 disables a budget)
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get("LLM_TOKENS_PER_MINUTE", "0"))
+LLM_RATE_LIMIT_DB_PATH = os.environ.get("LLM_RATE_LIMIT_DB_PATH", os.path.join(DATA_DIR, "ratelimit.db"))
+LLM_BULK_RESERVE = float(os.environ.get("LLM_BULK_RESERVE", "0.2"))  # Share of each budget bulk jobs leave to interactive audits
+LLM_INTERACTIVE_MAX_WAIT = float(os.environ.get("LLM_INTERACTIVE_MAX_WAIT", "30"))  # seconds before an interactive audit gets a 429
+
+# Retries of rate-limited (429), failed (5xx) and dropped upstream calls, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "1"))  # seconds, doubled per attempt
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "60"))
+
+# Background audit jobs
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))  # Jobs audited at the same time
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "100"))  # Pending jobs before submissions are rejected
+
+# History of every audited log (user, model, tokens, time, assessment) for analytics queries
+AUDIT_HISTORY = os.environ.get("AUDIT_HISTORY", "1") == "1"
+HISTORY_DB_PATH = os.environ.get("HISTORY_DB_PATH", os.path.join(DATA_DIR, "history.db"))
+
+# Rolling per-user and per-model risk profiles (exponentially decayed counts), shared by all worker processes
+PROFILE_DB_PATH = os.environ.get("PROFILE_DB_PATH", os.path.join(DATA_DIR, "profiles.db"))
+PROFILE_HALF_LIFE_HOURS = float(os.environ.get("PROFILE_HALF_LIFE_HOURS", "24"))
+PROFILE_MAX_KEYS = int(os.environ.get("PROFILE_MAX_KEYS", "100000"))  # Profiles kept per kind (LRU)
+
+# Optionally raise Low-risk logs to Medium for users whose recent findings are mostly High
+PROFILE_ESCALATION = os.environ.get("PROFILE_ESCALATION", "0") == "1"
+PROFILE_ESCALATION_MIN_HIGH = float(os.environ.get("PROFILE_ESCALATION_MIN_HIGH", "3"))  # Decayed High findings
+PROFILE_ESCALATION_SHARE = float(os.environ.get("PROFILE_ESCALATION_SHARE", "0.3"))  # Share of High findings
+
+# Streaming NDJSON audits: logs are validated one at a time and audited in windows of this size
+AUDIT_STREAM_WINDOW = int(os.environ.get("AUDIT_STREAM_WINDOW", "500"))
+AUDIT_STREAM_MAX_LINE_BYTES = int(os.environ.get("AUDIT_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Model backends: "openai" or "mock" (deterministic, offline stand-in for tests and benchmarks)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "openai")
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", LLM_BACKEND)
+EMBED_DIMENSION = int(os.environ.get("EMBED_DIMENSION", "1536"))  # OpenAI embedding dimension
+
+# Mock backend behaviour
+MOCK_LLM_LATENCY = float(os.environ.get("MOCK_LLM_LATENCY", "0"))  # seconds per call
+MOCK_LLM_LATENCY_PER_LOG = float(os.environ.get("MOCK_LLM_LATENCY_PER_LOG", "0"))  # extra seconds per log line
+MOCK_LLM_MALFORMED_RATE = float(os.environ.get("MOCK_LLM_MALFORMED_RATE", "0"))  # share of malformed responses
+MOCK_LLM_RATE_LIMIT_RATE = float(os.environ.get("MOCK_LLM_RATE_LIMIT_RATE", "0"))  # share of calls rejected with a 429
+MOCK_SEED = int(os.environ.get("MOCK_SEED", "0"))
@@ -0,0 +1,143 @@
+import re
+import zlib
+from typing import Dict, List, Tuple
+import numpy as np
+from .models import PromptLogEntry, LogRiskAssessment
+from .config import AUDIT_DEDUP_THRESHOLD, AUDIT_CACHE_TOKEN_BUCKET
+
+# Values that vary between otherwise identical scripted prompts are replaced by placeholders.
+# Branches only start at the beginning of a word so the scan stays linear in the prompt length.
+_MASK_PATTERN = re.compile(
+    r"(?P<email>(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+    r"|(?P<uuid>\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b)"
+    r"|(?P<hex>\b(?=[a-f]*[0-9])[0-9a-f]{8,}\b)"
+    r"|(?P<num>(?<!\d)\d+(?:[.,:/-]\d+)*)"
+)
+_MASKABLE_PATTERN = re.compile(r"[0-9@]")  # Every mask needs a digit or an "@"
+_TOKEN_PATTERN = re.compile(r"<\w+>|\w+")
+
+# MinHash with 64 permutations split into 16 LSH bands of 4 rows. Bands only propose candidates
+# (similarity around 0.5 and up); every candidate is verified with the exact Jaccard similarity.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+MAX_CANDIDATES = 20  # Representatives verified per log before it starts a cluster of its own
+SIGNATURE_BLOCK = 4096  # Logs hashed per vectorized MinHash step
+
+# Near-duplicates must also end in the same words: the final clause (who data goes to, what is
+# done with it) often decides the risk of an otherwise identical scripted prompt
+TAIL_TOKENS = 6
+
+def normalize_for_dedup(prompt):
+    """Lower-case a prompt and mask emails, UUIDs, hex IDs and numbers (dates, amounts, IDs)"""
+    text = prompt.lower()
+    if _MASKABLE_PATTERN.search(text) is None:
+        return text
+    return _MASK_PATTERN.sub(lambda m: f"<{m.lastgroup}>", text)
+
+def tokenize(text):
+    """Words and mask placeholders of a normalized prompt"""
+    return _TOKEN_PATTERN.findall(text)
+
+def shingles(tokens):
+    """Word bigrams of a tokenized, normalized prompt (the whole prompt when it has a single word)"""
+    if len(tokens) < 2:
+        return {" ".join(tokens)}
+    return {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+def minhash_signatures(shingle_sets):
+    """MinHash signatures (one row of NUM_PERMUTATIONS values per set), computed in blocks"""
+    signatures = np.empty((len(shingle_sets), NUM_PERMUTATIONS), dtype=np.uint64)
+    for start in range(0, len(shingle_sets), SIGNATURE_BLOCK):
+        block = shingle_sets[start:start + SIGNATURE_BLOCK]
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for shingle_set in block for s in shingle_set), dtype=np.uint64
+        )
+        offsets = np.cumsum([0] + [len(shingle_set) for shingle_set in block[:-1]])
+        permuted = (hashes[:, None] * _PERM_A + _PERM_B) % _PRIME
+        signatures[start:start + len(block)] = np.minimum.reduceat(permuted, offsets, axis=0)
+    return signatures
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def cluster_logs(indexed_logs: List[Tuple[int, PromptLogEntry]], threshold=AUDIT_DEDUP_THRESHOLD,
+                 token_bucket=AUDIT_CACHE_TOKEN_BUCKET):
+    """Group exact and near-duplicate prompts.
+
+    Logs only join a cluster with the same model and token bucket, and only when their
+    normalized prompt is at least `threshold` Jaccard-similar to the cluster's representative
+    and ends in the same TAIL_TOKENS words (never by chaining through other members). Returns
+    the representative (index, log) pairs and a {representative index: [member indices]} dict
+    for clusters with more than one log.
+    """
+    # Exact duplicates after masking
+    groups: Dict[tuple, List[Tuple[int, PromptLogEntry]]] = {}
+    for idx, log in indexed_logs:
+        key = (log.model, log.tokens // token_bucket, normalize_for_dedup(log.prompt))
+        groups.setdefault(key, []).append((idx, log))
+
+    keys = list(groups)
+    token_lists = [tokenize(key[2]) for key in keys]
+    shingle_sets = [shingles(tokens) for tokens in token_lists]
+    tails = [tokens[-TAIL_TOKENS:] for tokens in token_lists]
+    signatures = minhash_signatures(shingle_sets) if threshold < 1.0 and len(keys) > 1 else None
+
+    representatives = []
+    members: Dict[int, List[int]] = {}
+    buckets: Dict[tuple, List[int]] = {}  # (model, token bucket, band, band hash) -> representative key numbers
+    rep_of = {}  # key number -> representative key number
+    for n, key in enumerate(keys):
+        rep = None
+        if signatures is not None:
+            bands = [(key[0], key[1], band, signatures[n, band * _ROWS:(band + 1) * _ROWS].tobytes())
+                     for band in range(LSH_BANDS)]
+            candidates = []
+            for band_key in bands:
+                for candidate in buckets.get(band_key, ()):
+                    if candidate not in candidates:
+                        candidates.append(candidate)
+            for candidate in candidates[:MAX_CANDIDATES]:
+                if tails[n] == tails[candidate] and jaccard(shingle_sets[n], shingle_sets[candidate]) >= threshold:
+                    rep = candidate
+                    break
+            if rep is None:
+                for band_key in bands:
+                    buckets.setdefault(band_key, []).append(n)
+        rep_of[n] = n if rep is None else rep
+
+    first_index = {}
+    for n, key in enumerate(keys):
+        group = groups[key]
+        rep = rep_of[n]
+        if rep == n:
+            representatives.append(group[0])
+            first_index[n] = group[0][0]
+            group = group[1:]
+        if group:
+            members.setdefault(first_index[rep], []).extend(idx for idx, _ in group)
+
+    representatives.sort(key=lambda pair: pair[0])
+    return representatives, members
+
+def fan_out(log_assessments: Dict[int, LogRiskAssessment], members: Dict[int, List[int]], unsuffixed=frozenset()):
+    """Copy each representative's assessment to the members of its cluster.
+
+    Reasons in `unsuffixed` (fallbacks for logs the model never assessed) are copied as they
+    are, so members stay recognizable as unanalyzed.
+    """
+    expanded = dict(log_assessments)
+    for rep, assessment in log_assessments.items():
+        for idx in members.get(rep, ()):
+            if assessment.reason in unsuffixed:
+                expanded[idx] = assessment
+                continue
+            expanded[idx] = LogRiskAssessment(
+                risk_level=assessment.risk_level, reason=f"{assessment.reason} (near-duplicate of LOG {rep})"
+            )
+    return expanded
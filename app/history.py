@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from .models import PromptLogEntry, LogRiskAssessment, HistoryRiskCounts, HistoryTokenUsage, HistoryTrendPoint
+from .config import AUDIT_HISTORY, HISTORY_DB_PATH
+
+HOUR = 3600
+DAY = 86400
+INTERVALS = {"hour": HOUR, "day": DAY}
+ROLLUP_TABLES = {HOUR: "audit_rollup_hourly", DAY: "audit_rollup_daily"}
+GROUP_COLUMNS = {"user": "user", "model": "model"}
+
+# Rollup column (high, medium, low) of each risk level
+RISK_COLUMNS = {"High": 0, "Medium": 1, "Low": 2}
+
+# Planner statistics are refreshed whenever the number of recorded logs has doubled (and at least
+# every ANALYZE_EVERY logs), sampling ANALYSIS_LIMIT rows per index so each refresh stays cheap
+ANALYZE_EVERY = 100000
+ANALYSIS_LIMIT = 1000
+
+# Global history store (created on first use)
+_history = None
+
+def _epoch(timestamp, default):
+    """Seconds since the epoch for an ISO 8601 log timestamp (naive times are UTC)"""
+    if not timestamp:
+        return default
+    try:
+        parsed = datetime.fromisoformat(timestamp.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return default
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+class HistoryStore:
+    """Append-only SQLite history of audited logs, with hourly and daily rollups for analytics.
+
+    Every audited log is kept in audit_logs (without its prompt). The rollup tables hold one
+    row per (hour or day, user, model) with a column per risk level and the token total,
+    updated in the same transaction. Aggregate queries read whole days from the daily rollup
+    and only the partial days at the edges of a window from the hourly one, so they scan
+    thousands of rows instead of millions of logs. Covering (user or model, period) indexes on
+    the daily rollup let per-user and per-model queries skip-scan a window.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS audit_logs (
+                    id INTEGER PRIMARY KEY,
+                    ts REAL NOT NULL,
+                    audited_at REAL NOT NULL,
+                    user TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    risk_level TEXT NOT NULL,
+                    reason TEXT NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS audit_logs_ts ON audit_logs (ts)")
+            for table in ROLLUP_TABLES.values():
+                self._db.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        period INTEGER NOT NULL,
+                        user TEXT NOT NULL,
+                        model TEXT NOT NULL,
+                        high INTEGER NOT NULL,
+                        medium INTEGER NOT NULL,
+                        low INTEGER NOT NULL,
+                        logs INTEGER NOT NULL,
+                        tokens INTEGER NOT NULL,
+                        PRIMARY KEY (period, user, model)
+                    ) WITHOUT ROWID
+                """)
+            # Whole days of per-user and per-model queries skip-scan these instead of every period
+            table = ROLLUP_TABLES[DAY]
+            for column in GROUP_COLUMNS.values():
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column} "
+                    f"ON {table} ({column}, period, high, medium, low, logs, tokens)"
+                )
+            self._db.commit()
+            self._db.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            self._logs = self._db.execute("SELECT MAX(id) FROM audit_logs").fetchone()[0] or 0
+            self._analyzed_logs = self._logs if self._has_stats() else 0
+
+    def _has_stats(self):
+        try:
+            return self._db.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone() is not None
+        except sqlite3.OperationalError:
+            return False
+
+    def _analyze_if_needed(self):
+        """Refresh the rollup statistics the planner needs to pick the covering indexes (under the lock)"""
+        if self._analyzed_logs and self._logs - self._analyzed_logs < max(ANALYZE_EVERY, self._analyzed_logs):
+            return
+        self._db.execute(f"ANALYZE {ROLLUP_TABLES[DAY]}")
+        self._db.commit()
+        self._analyzed_logs = self._logs
+
+    def record(self, logs: List[PromptLogEntry], log_assessments: Dict[int, LogRiskAssessment], log_indices=None):
+        """Append audited logs; log i is assessed by log_assessments[log_indices[i]] (i by default)"""
+        now = time.time()
+        rows = []
+        rollups = {step: defaultdict(lambda: [0, 0, 0, 0, 0]) for step in ROLLUP_TABLES}
+        for i, log in enumerate(logs):
+            assessment = log_assessments.get(log_indices[i] if log_indices is not None else i)
+            if assessment is None:
+                continue
+            ts = _epoch(log.timestamp, now)
+            rows.append((ts, now, log.user, log.model, log.tokens, assessment.risk_level, assessment.reason))
+            column = RISK_COLUMNS.get(assessment.risk_level)
+            for step, rollup in rollups.items():
+                totals = rollup[(int(ts // step) * step, log.user, log.model)]
+                if column is not None:
+                    totals[column] += 1
+                totals[3] += 1
+                totals[4] += log.tokens
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO audit_logs (ts, audited_at, user, model, tokens, risk_level, reason) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            for step, rollup in rollups.items():
+                self._db.executemany(
+                    f"INSERT INTO {ROLLUP_TABLES[step]} (period, user, model, high, medium, low, logs, tokens) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (period, user, model) DO UPDATE SET "
+                    "high = high + excluded.high, medium = medium + excluded.medium, low = low + excluded.low, "
+                    "logs = logs + excluded.logs, tokens = tokens + excluded.tokens",
+                    (key + tuple(totals) for key, totals in rollup.items())
+                )
+            self._db.commit()
+            self._logs += len(rows)
+            self._analyze_if_needed()
+
+    def _rollup(self, since, until, interval="hour", user=None, model=None, group_by=None):
+        """Subquery over the rollup rows covering [since, until), to whole hours, and its parameters.
+
+        Whole days come from the daily rollup unless hourly periods were asked for. With
+        `group_by`, each part is already summed per user or model (in a `key` column), so the
+        outer query only merges a few rows per key.
+        """
+        since = int(since // HOUR) * HOUR
+        until = -int(-until // HOUR) * HOUR
+        ranges = [(HOUR, since, until)]
+        if interval != "hour":
+            first_day = -int(-since // DAY) * DAY
+            last_day = int(until // DAY) * DAY
+            if first_day < last_day:
+                ranges = [(HOUR, since, first_day), (DAY, first_day, last_day), (HOUR, last_day, until)]
+
+        filters = ""
+        extra = []
+        if user is not None:
+            filters += " AND user = ?"
+            extra.append(user)
+        if model is not None:
+            filters += " AND model = ?"
+            extra.append(model)
+
+        selects = []
+        params = []
+        for step, start, end in ranges:
+            if start >= end:
+                continue
+            if group_by is None:
+                selects.append(f"SELECT * FROM {ROLLUP_TABLES[step]} WHERE period >= ? AND period < ?{filters}")
+            else:
+                column = GROUP_COLUMNS[group_by]
+                selects.append(
+                    f"SELECT {column} AS key, SUM(high) AS high, SUM(medium) AS medium, SUM(low) AS low, "
+                    f"SUM(logs) AS logs, SUM(tokens) AS tokens FROM {ROLLUP_TABLES[step]} "
+                    f"WHERE period >= ? AND period < ?{filters} GROUP BY {column}"
+                )
+            params += [start, end] + extra
+        if not selects:
+            columns = "*" if group_by is None else f"{GROUP_COLUMNS[group_by]} AS key, high, medium, low, logs, tokens"
+            selects.append(f"SELECT {columns} FROM {ROLLUP_TABLES[HOUR]} WHERE 0")
+        return "(" + " UNION ALL ".join(selects) + ")", params
+
+    def risk_counts(self, since, until, group_by="user", limit=100) -> List[HistoryRiskCounts]:
+        """Logs per risk level for each user or model, most high-risk logs first"""
+        rollup, params = self._rollup(since, until, "day", group_by=group_by)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, SUM(high), SUM(medium), SUM(low), SUM(logs) FROM {rollup} "
+                f"GROUP BY key ORDER BY 2 DESC, 5 DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [HistoryRiskCounts(key=r[0], high=r[1], medium=r[2], low=r[3], total=r[4]) for r in rows]
+
+    def top_consumers(self, since, until, group_by="user", limit=10) -> List[HistoryTokenUsage]:
+        """Users or models with the highest token usage"""
+        rollup, params = self._rollup(since, until, "day", group_by=group_by)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, SUM(tokens), SUM(logs) FROM {rollup} GROUP BY key ORDER BY 2 DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [HistoryTokenUsage(key=r[0], tokens=r[1], logs=r[2]) for r in rows]
+
+    def trend(self, since, until, interval="day", user=None, model=None) -> List[HistoryTrendPoint]:
+        """High-risk and total logs per hour or day"""
+        step = INTERVALS[interval]
+        rollup, params = self._rollup(since, until, interval, user, model)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT (period / {step}) * {step} AS bucket, SUM(high), SUM(logs), SUM(tokens) "
+                f"FROM {rollup} GROUP BY bucket ORDER BY bucket",
+                params
+            ).fetchall()
+        return [
+            HistoryTrendPoint(period=_iso(r[0]), high=r[1], logs=r[2], tokens=r[3],
+                              high_share=round(r[1] / r[2], 4) if r[2] else 0.0)
+            for r in rows
+        ]
+
+def get_history() -> Optional[HistoryStore]:
+    """Return the process-wide history store, or None when history is disabled"""
+    global _history
+    if not AUDIT_HISTORY:
+        return None
+    if _history is None:
+        _history = HistoryStore()
+    return _history
@@ -0,0 +1,316 @@
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from .models import (
+    PromptLogEntry, AuditResponse, AuditJobStatus, LogRiskAssessment, AuditJobLog, AuditJobLogPage, AuditJobOverview,
+    HistoryRiskCounts
+)
+from .audit import audit_logs_async
+from .ratelimit import LANES, lane
+from .config import JOB_DB_PATH, JOB_WORKERS, JOB_QUEUE_SIZE
+
+# Largest page of logs returned by JobStore.logs_page
+MAX_PAGE_SIZE = 1000
+
+# Error of jobs that were running when the server stopped
+INTERRUPTED_ERROR = "Interrupted by a server restart; submit the job again"
+
+class JobQueueFull(Exception):
+    """Raised when the job queue cannot take another job"""
+
+class JobStore:
+    """SQLite-backed store for audit jobs, their input logs and per-log results"""
+
+    def __init__(self, path=JOB_DB_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority TEXT NOT NULL DEFAULT 'bulk',
+                    total INTEGER NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS job_logs (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    user TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    prompt TEXT NOT NULL,
+                    timestamp TEXT,
+                    risk_level TEXT,
+                    reason TEXT,
+                    PRIMARY KEY (job_id, idx)
+                );
+                -- Filtered pages of a job's logs, in log order
+                CREATE INDEX IF NOT EXISTS job_logs_risk ON job_logs (job_id, risk_level, idx);
+                CREATE INDEX IF NOT EXISTS job_logs_user ON job_logs (job_id, user, idx);
+                CREATE INDEX IF NOT EXISTS job_logs_model ON job_logs (job_id, model, idx);
+            """)
+            # Databases created before jobs kept their priority
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "priority" not in columns:
+                self._db.execute("ALTER TABLE jobs ADD COLUMN priority TEXT NOT NULL DEFAULT 'bulk'")
+            self._db.commit()
+
+    def create(self, job_id, logs: List[PromptLogEntry], priority="bulk"):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, priority, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, priority, len(logs), now, now)
+            )
+            self._db.executemany(
+                "INSERT INTO job_logs (job_id, idx, user, model, tokens, prompt, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((job_id, i, log.user, log.model, log.tokens, log.prompt, log.timestamp) for i, log in enumerate(logs))
+            )
+            self._db.commit()
+
+    def set_status(self, job_id, status, result: Optional[AuditResponse] = None, error=None):
+        """Update a job; a result's log assessments go to job_logs, the rest of it to the jobs row"""
+        with self._lock:
+            if result is not None:
+                # Final assessments replace the streamed ones (escalation may have changed a few)
+                self._db.executemany(
+                    "UPDATE job_logs SET risk_level = ?, reason = ? WHERE job_id = ? AND idx = ? "
+                    "AND (risk_level IS NOT ? OR reason IS NOT ?)",
+                    ((a.risk_level, a.reason, job_id, idx, a.risk_level, a.reason)
+                     for idx, a in result.log_assessments.items())
+                )
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, result = COALESCE(?, result), error = ? WHERE id = ?",
+                (status, time.time(), result.model_dump_json(exclude={"log_assessments"}) if result else None,
+                 error, job_id)
+            )
+            self._db.commit()
+
+    def recover(self):
+        """Fail the jobs a stopped server was running; returns ([(job_id, priority, logs)] still queued, failed count)"""
+        with self._lock:
+            interrupted = self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE status = 'running'",
+                (INTERRUPTED_ERROR, time.time())
+            ).rowcount
+            self._db.commit()
+            jobs = self._db.execute(
+                "SELECT id, priority FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+            queued = []
+            for job_id, priority in jobs:
+                rows = self._db.execute(
+                    "SELECT user, model, tokens, prompt, timestamp FROM job_logs WHERE job_id = ? ORDER BY idx",
+                    (job_id,)
+                )
+                logs = [PromptLogEntry(user=r[0], model=r[1], tokens=r[2], prompt=r[3], timestamp=r[4]) for r in rows]
+                queued.append((job_id, priority, logs))
+        return queued, interrupted
+
+    def save_assessments(self, job_id, assessments: Dict[int, LogRiskAssessment]):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE job_logs SET risk_level = ?, reason = ? WHERE job_id = ? AND idx = ? AND risk_level IS NULL",
+                ((a.risk_level, a.reason, job_id, idx) for idx, a in assessments.items())
+            )
+            self._db.execute(
+                "UPDATE jobs SET completed = (SELECT COUNT(*) FROM job_logs WHERE job_id = ? AND risk_level IS NOT NULL), "
+                "updated_at = ? WHERE id = ?",
+                (job_id, time.time(), job_id)
+            )
+            self._db.commit()
+
+    def assessments(self, job_id) -> Dict[int, LogRiskAssessment]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT idx, risk_level, reason FROM job_logs WHERE job_id = ? AND risk_level IS NOT NULL ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        return {r[0]: LogRiskAssessment(risk_level=r[1], reason=r[2]) for r in rows}
+
+    def get(self, job_id, include_results=True) -> Optional[AuditJobStatus]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, total, completed, created_at, updated_at, result, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        result = AuditResponse(**json.loads(row[6])) if row[6] and include_results else None
+        if result is not None and not result.log_assessments:
+            result.log_assessments = self.assessments(job_id)
+        status = AuditJobStatus(
+            job_id=row[0], status=row[1], total=row[2], completed=row[3],
+            created_at=row[4], updated_at=row[5], result=result, error=row[7]
+        )
+        if include_results and result is None:
+            status.log_assessments = self.assessments(job_id)
+        return status
+
+    def logs_page(self, job_id, offset=0, limit=100, risk_levels=(), user=None, model=None) -> AuditJobLogPage:
+        """A page of a job's logs with their assessments, in log order, optionally filtered"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        where = "job_id = ?"
+        params = [job_id]
+        if risk_levels:
+            where += f" AND risk_level IN ({', '.join('?' for _ in risk_levels)})"
+            params += list(risk_levels)
+        if user is not None:
+            where += " AND user = ?"
+            params.append(user)
+        if model is not None:
+            where += " AND model = ?"
+            params.append(model)
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM job_logs WHERE {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT idx, user, model, tokens, prompt, timestamp, risk_level, reason FROM job_logs "
+                f"WHERE {where} ORDER BY idx LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        logs = [
+            AuditJobLog(index=r[0], user=r[1], model=r[2], tokens=r[3], prompt=r[4], timestamp=r[5],
+                        risk_level=r[6], reason=r[7])
+            for r in rows
+        ]
+        return AuditJobLogPage(total=total, offset=offset, limit=limit, logs=logs)
+
+    def _risk_counts(self, job_id, column, limit):
+        rows = self._db.execute(
+            f"SELECT {column}, SUM(risk_level = 'High'), SUM(risk_level = 'Medium'), SUM(risk_level = 'Low'), "
+            f"COUNT(*) FROM job_logs WHERE job_id = ? GROUP BY {column} ORDER BY 2 DESC, 5 DESC LIMIT ?",
+            (job_id, limit)
+        ).fetchall()
+        return [HistoryRiskCounts(key=r[0], high=r[1], medium=r[2], low=r[3], total=r[4]) for r in rows]
+
+    def overview(self, job_id, top=20, flags=100) -> Optional[AuditJobOverview]:
+        """Status, result summary and per risk level, user and model counts of a job, without its logs"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, total, completed, created_at, updated_at, result, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            levels = self._db.execute(
+                "SELECT risk_level, COUNT(*), SUM(tokens) FROM job_logs WHERE job_id = ? GROUP BY risk_level",
+                (job_id,)
+            ).fetchall()
+            user_count = self._db.execute(
+                "SELECT COUNT(DISTINCT user) FROM job_logs WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            users = self._risk_counts(job_id, "user", top)
+            models = self._risk_counts(job_id, "model", top)
+
+        result = json.loads(row[6]) if row[6] else {}
+        return AuditJobOverview(
+            job_id=row[0], status=row[1], total=row[2], completed=row[3], created_at=row[4], updated_at=row[5],
+            error=row[7], summary=result.get("summary", ""), risk_status=result.get("risk_status"),
+            suggestions=result.get("suggestions", []), flags=result.get("flags", [])[:flags],
+            flag_count=len(result.get("flags", [])), stats=result.get("stats"),
+            risk_counts={level: count for level, count, _ in levels if level is not None},
+            tokens=sum(tokens for _, _, tokens in levels), user_count=user_count, users=users, models=models
+        )
+
+class JobManager:
+    """Runs audit jobs on a bounded pool of worker tasks fed by an in-process queue"""
+
+    def __init__(self, store: JobStore, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self.store = store
+        self.workers = workers
+        # Interactive jobs are picked up before bulk ones; the sequence number keeps each lane FIFO
+        self._queue = asyncio.PriorityQueue(maxsize=queue_size)
+        self._sequence = itertools.count()
+        self._reserved = 0  # Queue slots held by submits that are still persisting their job
+        self._tasks = []
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def start(self):
+        """Start the workers and requeue the jobs a previous server left queued (running ones are failed)"""
+        queued, interrupted = await asyncio.to_thread(self.store.recover)
+        if queued or interrupted:
+            print(f"Recovered audit jobs: {len(queued)} requeued, {interrupted} interrupted marked failed")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if queued:
+            self._tasks.append(asyncio.create_task(self._requeue(queued)))
+
+    async def _requeue(self, jobs):
+        # Waits for free slots when more jobs were left than the queue holds
+        for job_id, priority, logs in jobs:
+            await self._queue.put((LANES.index(priority), next(self._sequence), job_id, logs))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, logs: List[PromptLogEntry], priority="bulk") -> str:
+        """Persist a job and queue it in a priority lane; raises JobQueueFull when the queue is at capacity"""
+        # The slot is reserved before the first await, so concurrent submits cannot overfill the queue
+        if self._queue.maxsize and self._queue.qsize() + self._reserved >= self._queue.maxsize:
+            raise JobQueueFull("Too many pending audit jobs")
+        self._reserved += 1
+        try:
+            job_id = uuid.uuid4().hex
+            await asyncio.to_thread(self.store.create, job_id, logs, priority)
+            self._queue.put_nowait((LANES.index(priority), next(self._sequence), job_id, logs))
+        finally:
+            self._reserved -= 1
+        return job_id
+
+    def subscribe(self, job_id) -> asyncio.Queue:
+        """Receive ("assessments", {...}) and ("status", AuditJobStatus) events for a job"""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        queues = self._subscribers.get(job_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        if not queues:
+            self._subscribers.pop(job_id, None)
+
+    def _publish(self, job_id, event, payload):
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait((event, payload))
+
+    async def _worker(self):
+        while True:
+            rank, _, job_id, logs = await self._queue.get()
+            try:
+                with lane(LANES[rank]):
+                    await self._run(job_id, logs)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id, logs):
+        await asyncio.to_thread(self.store.set_status, job_id, "running")
+
+        async def on_progress(assessments):
+            await asyncio.to_thread(self.store.save_assessments, job_id, assessments)
+            self._publish(job_id, "assessments", assessments)
+
+        try:
+            result = await audit_logs_async(logs, on_progress=on_progress)
+            await asyncio.to_thread(self.store.set_status, job_id, "completed", result)
+        except Exception as e:
+            print(f"Audit job {job_id} failed: {str(e)}")
+            await asyncio.to_thread(self.store.set_status, job_id, "failed", None, str(e))
+
+        self._publish(job_id, "status", await asyncio.to_thread(self.store.get, job_id, False))
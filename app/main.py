@@ -1,21 +1,262 @@
+import asyncio
+import json
 import os
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Literal, Optional
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.routing import APIRoute
 from dotenv import load_dotenv
-from app.models import AuditRequest, AuditResponse
-from app.audit import audit_logs
 
-# Load environment variables
+# Load environment variables before any app module reads its settings (app.config reads them on import)
 load_dotenv()
 
-app = FastAPI(title="LLM Risk Auditor API")
+from app.models import (
+    AuditRequest, AuditResponse, AuditJob, AuditJobStatus, AuditJobLogPage, AuditJobOverview, HistoryRiskCounts,
+    HistoryTokenUsage, HistoryTrendPoint, RiskProfile
+)
+from app.audit import audit_logs_async
+from app.clients import close_http_client
+from app.jobs import JobStore, JobManager, JobQueueFull
+from app.streaming import aiter_lines, stream_audit
+from app.rag_policy import warm_policy_index
+from app.ratelimit import RateLimited
+from app.runtime import get_runtime
+from app.history import get_history
+from app.profiles import get_profiles
+from app.config import AUDIT_SERVER_TIMING
+from app import metrics, wire
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm the policy index so the first request does not pay the cold-start cost
+    try:
+        await asyncio.to_thread(warm_policy_index)
+    except Exception as e:
+        print(f"Policy index warm-up failed, it will be retried on the first audit: {str(e)}")
+
+    # Compile the prompt templates and create the pooled model client once for all requests
+    get_runtime().audit_chain()
+
+    app.state.jobs = JobManager(JobStore())
+    await app.state.jobs.start()
+    yield
+    await app.state.jobs.stop()
+    await close_http_client()
+
+class WireRequest(Request):
+    """Request whose body may be gzip or zstd compressed (Content-Encoding), parsed with orjson"""
+
+    async def body(self):
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            try:
+                self._body = wire.decompress(body, self.headers.get("content-encoding"))
+            except wire.UnsupportedEncoding as e:
+                raise HTTPException(status_code=415, detail=str(e))
+            except wire.PayloadTooLarge as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Could not decompress the request body: {str(e)}")
+        return self._body
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class WireRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request):
+            return await handler(WireRequest(request.scope, request.receive))
+
+        return route_handler
+
+app = FastAPI(title="LLM Risk Auditor API", lifespan=lifespan)
+app.router.route_class = WireRoute
+
+def wire_response(model, request: Request, headers=None):
+    """Serialize a large result in the format (Accept) and compression (Accept-Encoding) the client asked for.
+
+    application/json is the regular response; the columnar JSON and MessagePack types send
+    log_assessments as arrays with each distinct reason listed once.
+    """
+    media_type = wire.negotiate_media_type(request.headers.get("accept"))
+    encoding = wire.negotiate_encoding(request.headers.get("accept-encoding"))
+    with metrics.span("serialize", metrics.RESPONSE_ENCODE_DURATION, format=media_type, encoding=encoding or "identity"):
+        body, encoding = wire.encode(model, media_type, encoding)
+    headers = dict(headers or {}, Vary="Accept, Accept-Encoding")
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
 
 @app.post("/audit", response_model=AuditResponse)
-async def audit_endpoint(request: AuditRequest):
+async def audit_endpoint(request: AuditRequest, http_request: Request):
+    timings = metrics.start_request_timings() if AUDIT_SERVER_TIMING else None
     try:
-        result = audit_logs(request.logs)
-        return result
+        result = await audit_logs_async(request.logs)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    response = wire_response(result, http_request)
+    if timings:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings)
+    return response
+
+def _history_store():
+    history = get_history()
+    if history is None:
+        raise HTTPException(status_code=404, detail="Audit history is disabled")
+    return history
+
+def _history_window(since: Optional[datetime], until: Optional[datetime], days: int):
+    """[since, until) in epoch seconds; defaults to the last `days` days"""
+    end = until.timestamp() if until else time.time()
+    start = since.timestamp() if since else end - days * 86400
+    return start, end
+
+@app.get("/history/risk-counts", response_model=List[HistoryRiskCounts])
+async def history_risk_counts(group_by: Literal["user", "model"] = "user", since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, days: int = 7, limit: int = 100):
+    """Audited logs per risk level for each user or model in a time window"""
+    start, end = _history_window(since, until, days)
+    return await asyncio.to_thread(_history_store().risk_counts, start, end, group_by, limit)
+
+@app.get("/history/top-consumers", response_model=List[HistoryTokenUsage])
+async def history_top_consumers(group_by: Literal["user", "model"] = "user", since: Optional[datetime] = None,
+                                until: Optional[datetime] = None, days: int = 7, limit: int = 10):
+    """Users or models with the highest token usage in a time window"""
+    start, end = _history_window(since, until, days)
+    return await asyncio.to_thread(_history_store().top_consumers, start, end, group_by, limit)
+
+@app.get("/history/trend", response_model=List[HistoryTrendPoint])
+async def history_trend(interval: Literal["hour", "day"] = "day", user: Optional[str] = None,
+                        model: Optional[str] = None, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, days: int = 30):
+    """High-risk and total audited logs per hour or day, optionally for one user or model"""
+    start, end = _history_window(since, until, days)
+    return await asyncio.to_thread(_history_store().trend, start, end, interval, user, model)
+
+@app.get("/profiles", response_model=List[RiskProfile])
+async def list_risk_profiles(kind: Literal["user", "model"] = "user", limit: int = 20):
+    """Users or models with the highest current risk score (decayed High and Medium findings)"""
+    return await asyncio.to_thread(get_profiles().top, kind, limit)
+
+@app.get("/profiles/{kind}/{key}", response_model=RiskProfile)
+async def get_risk_profile(kind: Literal["user", "model"], key: str):
+    profile = await asyncio.to_thread(get_profiles().get, kind, key)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No audited logs for this key")
+    return profile
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of the audit metrics of this process"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+class FullDuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that can be sent while the request body is still being read.
+
+    StreamingResponse normally listens for client disconnects on `receive`, which would
+    swallow the request body chunks the response iterator is consuming.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.post("/audit/stream")
+async def audit_stream_endpoint(request: Request, window: int = 0):
+    """Audit a JSONL/NDJSON request body (one PromptLogEntry per line), streaming NDJSON results back"""
+    content_encoding = request.headers.get("content-encoding")
+    codings = wire.content_codings(content_encoding)
+    if len(codings) > 1 or any(coding not in wire.ENCODINGS for coding in codings):
+        raise HTTPException(status_code=415, detail=f"Unsupported content encoding for streamed bodies: {content_encoding}")
+    lines = aiter_lines(wire.adecompress(request.stream(), content_encoding))
+    results = stream_audit(lines, window=window) if window > 0 else stream_audit(lines)
+    return FullDuplexStreamingResponse(results, media_type="application/x-ndjson")
+
+@app.post("/audit/jobs", response_model=AuditJob, status_code=202)
+async def create_audit_job(request: AuditRequest, priority: Literal["interactive", "bulk"] = "bulk"):
+    try:
+        job_id = await app.state.jobs.submit(request.logs, priority)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return AuditJob(job_id=job_id, status="queued")
+
+@app.get("/audit/jobs/{job_id}", response_model=AuditJobStatus)
+async def get_audit_job(job_id: str, request: Request, include_results: bool = True):
+    status = await asyncio.to_thread(app.state.jobs.store.get, job_id, include_results)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Audit job not found")
+    return wire_response(status, request)
+
+@app.get("/audit/jobs/{job_id}/overview", response_model=AuditJobOverview)
+async def get_audit_job_overview(job_id: str, top: int = 20, flags: int = 100):
+    """Job status, result summary, the first `flags` flags and risk counts per level, user and model (top `top`)"""
+    overview = await asyncio.to_thread(app.state.jobs.store.overview, job_id, top, flags)
+    if overview is None:
+        raise HTTPException(status_code=404, detail="Audit job not found")
+    return overview
+
+@app.get("/audit/jobs/{job_id}/logs", response_model=AuditJobLogPage)
+async def list_audit_job_logs(job_id: str, request: Request, offset: int = 0, limit: int = 100,
+                              risk_level: List[str] = Query(default=[]), user: Optional[str] = None,
+                              model: Optional[str] = None):
+    """A page of a job's logs and assessments in log order, filtered by risk levels, user or model"""
+    store = app.state.jobs.store
+    if await asyncio.to_thread(store.get, job_id, False) is None:
+        raise HTTPException(status_code=404, detail="Audit job not found")
+    page = await asyncio.to_thread(store.logs_page, job_id, offset, limit, risk_level, user, model)
+    return wire_response(page, request)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.get("/audit/jobs/{job_id}/events")
+async def stream_audit_job(job_id: str):
+    """Server-sent events: one "assessment" event per log as chunks finish, then a final "status" event"""
+    manager = app.state.jobs
+    # Subscribe before reading the current state so no update falls in between
+    queue = manager.subscribe(job_id)
+    status = await asyncio.to_thread(manager.store.get, job_id, False)
+    if status is None:
+        manager.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail="Audit job not found")
+
+    async def events():
+        sent = set()
+
+        def assessment_events(assessments):
+            for idx, assessment in assessments.items():
+                if idx not in sent:
+                    sent.add(idx)
+                    yield _sse("assessment", json.dumps({"index": idx, **assessment.model_dump()}))
+
+        try:
+            current = status
+            yield _sse("status", current.model_dump_json())
+            for event in assessment_events(await asyncio.to_thread(manager.store.assessments, job_id)):
+                yield event
+            while current.status not in ("completed", "failed"):
+                kind, payload = await queue.get()
+                if kind == "assessments":
+                    for event in assessment_events(payload):
+                        yield event
+                else:
+                    current = payload
+                    yield _sse("status", current.model_dump_json())
+        finally:
+            manager.unsubscribe(job_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,155 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Default histogram buckets in seconds (5 ms to 2 min)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Registered metrics, rendered in this order by render()
+_registry = []
+
+# Per-request span durations (seconds by span name) when a request asked for a timing breakdown
+_request_timings: ContextVar = ContextVar("request_timings", default=None)
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Counter:
+    """Monotonic counter with optional labels (Prometheus counter semantics)"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (Prometheus histogram semantics)"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if position < len(self.buckets):
+                state[position] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labelnames + ("le",)
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_label_text(bucket_labels, key + (repr(bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_label_text(bucket_labels, key + ('+Inf',))} {state[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {state[-1]}")
+        return lines
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def span(name, histogram=None, **labels):
+    """Time a block into a histogram and into the current request's timing breakdown"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def start_request_timings():
+    """Collect span durations for the current request (shared by the tasks and threads it starts)"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings):
+    """Format a timing breakdown as a Server-Timing header value (durations in milliseconds)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+# Audit pipeline
+AUDIT_DURATION = Histogram("audit_duration_seconds", "End-to-end duration of an audit", ["model"])
+AUDIT_LOGS = Counter("audit_logs_total", "Logs audited, by the stage that assessed them", ["model", "stage"])
+CACHE_HITS = Counter("audit_cache_hits_total", "Per-log assessment cache hits", ["model"])
+CACHE_MISSES = Counter("audit_cache_misses_total", "Per-log assessment cache misses", ["model"])
+CHUNK_ERRORS = Counter("audit_chunk_errors_total", "Chunks that failed with an error", ["model"])
+
+RESPONSE_ENCODE_DURATION = Histogram("audit_response_encode_seconds", "Time to serialize and compress audit results",
+                                     ["format", "encoding"])
+
+# Policy index and retrieval
+INDEX_INIT_DURATION = Histogram("policy_index_init_seconds", "Time to load, update or build the policy index", ["source"])
+RETRIEVAL_DURATION = Histogram("policy_retrieval_seconds", "Time to retrieve policy chunks for a chunk of logs")
+RETRIEVAL_CACHE_HITS = Counter("policy_retrieval_cache_hits_total", "Retrieval queries answered from the cache")
+RETRIEVAL_CACHE_MISSES = Counter("policy_retrieval_cache_misses_total", "Retrieval queries that were embedded")
+
+# Model calls
+PROMPT_FORMAT_DURATION = Histogram("audit_prompt_format_seconds", "Time to format the logs and prompt of a chunk",
+                                   ["model"], buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+LLM_DURATION = Histogram("llm_request_seconds", "Latency of audit model calls", ["model", "call"])
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens sent to and received from the audit model", ["model", "direction"])
+FORMAT_FAILURES = Counter("audit_format_failures_total", "Responses with missing or unparsable LOG lines", ["model"])
+LLM_FIRST_ASSESSMENT = Histogram("llm_first_assessment_seconds",
+                                 "Time from the start of a streamed model call to its first complete LOG assessment",
+                                 ["model"])
+STREAM_ABORTS = Counter("llm_stream_aborts_total", "Streamed responses cut off after a format violation", ["model"])
+REPAIRS = Counter("audit_repairs_total", "Follow-up calls for LOG lines missing from a response", ["model"])
+PARSE_DURATION = Histogram("audit_parse_seconds", "Time to parse a model response", ["model", "format"],
+                           buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5))
+
+# Upstream rate limits
+RATE_LIMIT_WAIT = Histogram("llm_rate_limit_wait_seconds", "Time model calls waited for rate limit budget", ["lane"])
+LLM_RETRIES = Counter("llm_retries_total", "Model calls retried after a transient upstream error", ["status"])
+RATE_LIMITED = Counter("llm_rate_limited_total", "Model calls given up because of rate limits", ["lane"])
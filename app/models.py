@@ -1,5 +1,5 @@
-from typing import List, Optional, Dict
-from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Dict
+from pydantic import BaseModel, Field, field_validator
 
 class PromptLogEntry(BaseModel):
     user: str
@@ -15,9 +15,134 @@ class LogRiskAssessment(BaseModel):
 class AuditRequest(BaseModel):
     logs: List[PromptLogEntry]
 
+class AuditStats(BaseModel):
+    total_logs: int = 0
+    prescreened: int = 0  # Assessed by the local pre-screen
+    cache_hits: int = 0
+    cache_misses: int = 0
+    deduplicated: int = 0  # Assessed through a near-duplicate cluster representative
+    dedup_ratio: float = 0.0  # Share of the logs left after pre-screen and cache that reused a representative
+    llm_audited: int = 0  # Sent to the LLM
+    llm_batches: int = 0
+    llm_repairs: int = 0  # Follow-up calls for LOG lines missing from a response
+    escalated: int = 0  # Low-risk logs raised to Medium because their user keeps getting flagged
+
 class AuditResponse(BaseModel):
     summary: str
     risk_status: str = "Safe"  # "Safe", "Moderate", "High-Risk"
     flags: List[str] = Field(default_factory=list)
     suggestions: List[str] = Field(default_factory=list)
     log_assessments: Dict[int, LogRiskAssessment] = Field(default_factory=dict)
+    stats: Optional[AuditStats] = None
+
+def _risk_level_schema(schema):
+    schema.pop("pattern", None)
+    schema["enum"] = ["High", "Medium", "Low"]
+
+class LogAssessmentOutput(BaseModel):
+    log: int  # LOG number from the prompt
+    # Checked by the compiled validator (any casing), offered to the model as an enum
+    risk_level: str = Field(pattern=r"(?i)^\s*(high|medium|low)\s*$", json_schema_extra=_risk_level_schema)
+    reason: str = ""
+
+class AuditOutput(BaseModel):
+    """JSON object the audit model returns in JSON output mode (the wire form of AuditResponse)"""
+    log_assessments: List[LogAssessmentOutput] = Field(default_factory=list)
+    suggestions: List[str] = Field(default_factory=list)
+    flags: List[str] = Field(default_factory=list)
+    summary: str = ""
+    risk_status: Literal["Safe", "Moderate", "High-Risk"] = "Safe"
+
+    @field_validator("risk_status", mode="before")
+    @classmethod
+    def _normalize_status(cls, value):
+        if not isinstance(value, str):
+            return value
+        value = value.strip().lower()
+        if "high" in value:
+            return "High-Risk"
+        if "moderate" in value or "medium" in value:
+            return "Moderate"
+        return "Safe"
+
+class AuditJob(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "completed", "failed"
+
+class AuditJobStatus(AuditJob):
+    total: int
+    completed: int = 0
+    created_at: float
+    updated_at: float
+    log_assessments: Dict[int, LogRiskAssessment] = Field(default_factory=dict)  # Partial until completed
+    result: Optional[AuditResponse] = None
+    error: Optional[str] = None
+
+class HistoryRiskCounts(BaseModel):
+    key: str  # User or model
+    high: int = 0
+    medium: int = 0
+    low: int = 0
+    total: int = 0
+
+class AuditJobLog(BaseModel):
+    index: int
+    user: str
+    model: str
+    tokens: int
+    prompt: str
+    timestamp: Optional[str] = None
+    risk_level: Optional[str] = None  # None until the log has been assessed
+    reason: Optional[str] = None
+
+class AuditJobLogPage(BaseModel):
+    total: int  # Logs matching the filters
+    offset: int
+    limit: int
+    logs: List[AuditJobLog] = Field(default_factory=list)
+
+class AuditJobOverview(AuditJob):
+    """Job status with aggregates over its logs, for clients that page through the logs separately"""
+    total: int
+    completed: int = 0
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+    summary: str = ""  # Summary, risk status, suggestions and stats are set once completed
+    risk_status: Optional[str] = None
+    suggestions: List[str] = Field(default_factory=list)
+    flags: List[str] = Field(default_factory=list)  # The first flags only
+    flag_count: int = 0
+    stats: Optional[AuditStats] = None
+    risk_counts: Dict[str, int] = Field(default_factory=dict)  # Assessed logs per risk level
+    tokens: int = 0
+    user_count: int = 0
+    users: List[HistoryRiskCounts] = Field(default_factory=list)  # Most high-risk users first
+    models: List[HistoryRiskCounts] = Field(default_factory=list)
+
+class HistoryTokenUsage(BaseModel):
+    key: str  # User or model
+    tokens: int
+    logs: int
+
+class HistoryTrendPoint(BaseModel):
+    period: str  # Start of the hour or day (ISO 8601, UTC)
+    high: int
+    logs: int
+    tokens: int
+    high_share: float = 0.0
+
+class RiskProfile(BaseModel):
+    kind: str  # "user" or "model"
+    key: str
+    high: float = 0.0  # Exponentially decayed findings per risk level
+    medium: float = 0.0
+    low: float = 0.0
+    risk_score: float = 0.0  # high + 0.25 * medium
+    high_share: float = 0.0
+    tokens_p50: int = 0
+    tokens_p90: int = 0
+    tokens_p99: int = 0
+    repeat_rate: float = 0.0  # Share of recent logs repeating one of the key's recent prompts
+    escalated: bool = False
+    last_seen: str  # ISO 8601, UTC
@@ -0,0 +1,314 @@
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import numpy as np
+import faiss
+from llama_index.core.node_parser import SentenceSplitter
+from .config import (
+    EMBED_BACKEND, EMBED_DIMENSION, POLICY_CHUNK_SIZE, POLICY_ANN_MIN_CHUNKS, POLICY_ANN_NPROBE, POLICY_ANN_RERANK
+)
+
+DB_FILE = "policy.db"
+
+# An IVF-PQ index is retrained (from the stored vectors) once the corpus is this many times
+# larger than the corpus it was trained on
+RETRAIN_GROWTH = 4
+
+# Vectors sampled per inverted list (and at least overall) to train the IVF-PQ quantizers
+TRAIN_PER_LIST = 64
+TRAIN_MIN = 10000
+
+# Chunks embedded, or stored vectors read, per batch
+BATCH_SIZE = 10000
+
+# Ids bound per SQL statement (SQLite limits the number of parameters)
+SQL_BATCH = 900
+
+def _pq_subquantizers(dimension):
+    """Largest divisor of the dimension up to dimension / 16, so each PQ code stores 16+ dimensions in a byte"""
+    for m in range(max(1, dimension // 16), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class PolicyIndex:
+    """Policy chunks, their embeddings and a FAISS index over them, updated file by file.
+
+    Chunk text and vectors are kept in SQLite (policy.db) under a stable chunk id, which is
+    also the FAISS id. Small corpora get an exact flat index. From ann_min_chunks chunks on,
+    an IVF-PQ index stores about 1/64 of the vector bytes and probes only nprobe lists; its
+    top rerank * top_k candidates are re-ranked on their exact vectors.
+
+    Syncing a changed policy file removes and re-embeds only that file's chunks. The FAISS
+    index is rebuilt from the stored vectors (never re-embedded) only when it switches type
+    or the corpus outgrew the IVF-PQ training.
+    """
+
+    def __init__(self, persist_dir, dimension=EMBED_DIMENSION, chunk_size=POLICY_CHUNK_SIZE,
+                 ann_min_chunks=POLICY_ANN_MIN_CHUNKS, nprobe=POLICY_ANN_NPROBE, rerank=POLICY_ANN_RERANK,
+                 embed_backend=EMBED_BACKEND):
+        os.makedirs(persist_dir, exist_ok=True)
+        self.persist_dir = persist_dir
+        self.dimension = dimension
+        self.ann_min_chunks = ann_min_chunks
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self._settings = json.dumps({"embed_backend": embed_backend, "dimension": dimension, "chunk_size": chunk_size})
+        self._splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=0)
+        self._faiss = None
+        self._generation = None
+        self._lock = threading.Lock()
+        with self._lock:
+            # Autocommit mode: syncs run in one BEGIN IMMEDIATE transaction, so worker
+            # processes sharing persist_dir never embed the same change twice
+            self._db = sqlite3.connect(os.path.join(persist_dir, DB_FILE), timeout=600,
+                                       isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, sha TEXT NOT NULL)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused, so stale FAISS ids cannot alias
+                    path TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS chunks_path ON chunks (path)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    @property
+    def kind(self):
+        """'ivfpq' or 'flat' (None before the first sync)"""
+        if self._faiss is None:
+            return None
+        return "ivfpq" if isinstance(self._faiss, faiss.IndexIVF) else "flat"
+
+    @property
+    def ntotal(self):
+        return self._faiss.ntotal if self._faiss is not None else 0
+
+    def memory_bytes(self):
+        """Serialized size of the FAISS index (vectors or PQ codes, ids and quantizers)"""
+        return faiss.serialize_index(self._faiss).nbytes if self._faiss is not None else 0
+
+    def _meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _faiss_path(self, generation):
+        return os.path.join(self.persist_dir, f"policy-{generation}.faiss")
+
+    def _chunk(self, path):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        return [chunk for chunk in self._splitter.split_text(text) if chunk.strip()]
+
+    def _embed_and_insert(self, pending, embed_model, added_ids):
+        """Embed (path, text) chunks in one batched call and store them"""
+        vectors = np.asarray(embed_model.get_text_embedding_batch([text for _, text in pending]), dtype=np.float32)
+        for (path, text), vector in zip(pending, vectors):
+            cursor = self._db.execute("INSERT INTO chunks (path, text, vector) VALUES (?, ?, ?)",
+                                      (path, text, vector.tobytes()))
+            added_ids.append(cursor.lastrowid)
+
+    def _apply_changes(self, files, version, embed_model):
+        """Bring the stored chunks in line with `files`.
+
+        Returns the removed and added chunk ids, whether everything was re-embedded and the
+        generation the changes were made on top of.
+        """
+        previous = int(self._meta("generation", 0))
+        rebuild = self._meta("settings") != self._settings
+        if rebuild:
+            # Other embeddings or chunking: nothing stored can be reused
+            self._db.execute("DELETE FROM chunks")
+            self._db.execute("DELETE FROM files")
+            self._set_meta("settings", self._settings)
+
+        stored = dict(self._db.execute("SELECT path, sha FROM files").fetchall())
+        removed_ids = []
+        for path, sha in stored.items():
+            if files.get(path, (None, None))[1] != sha:
+                removed_ids += [row[0] for row in self._db.execute("SELECT id FROM chunks WHERE path = ?", (path,))]
+                self._db.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+
+        added_ids = []
+        pending = []
+        for path, (file_path, sha) in sorted(files.items()):
+            if stored.get(path) == sha:
+                continue
+            pending += [(path, text) for text in self._chunk(file_path)]
+            self._db.execute("INSERT INTO files (path, sha) VALUES (?, ?)", (path, sha))
+            if len(pending) >= BATCH_SIZE:
+                self._embed_and_insert(pending, embed_model, added_ids)
+                pending = []
+        if pending:
+            self._embed_and_insert(pending, embed_model, added_ids)
+
+        if rebuild or removed_ids or added_ids or self._meta("version") != version:
+            self._set_meta("generation", previous + 1)
+            self._set_meta("version", version)
+        return removed_ids, added_ids, rebuild, previous
+
+    def sync(self, files, version, embed_model):
+        """Index exactly `files` (relative path -> (file path, content hash)) as corpus `version`.
+
+        Returns how the FAISS index was obtained: 'loaded' (unchanged or read from disk),
+        'updated' (only changed files' vectors were removed and added) or 'built'.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                removed_ids, added_ids, rebuild, previous = self._apply_changes(files, version, embed_model)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+            generation = int(self._meta("generation", 0))
+            if self._faiss is not None and self._generation == generation:
+                return "loaded"
+            count = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            kind = self._target_kind(count)
+
+            source = None
+            if (self._faiss is not None and self._generation == previous and generation == previous + 1 and not rebuild
+                    and kind == self.kind and not self._needs_retraining(count)):
+                # Copy on write: searches keep using the current index until the swap
+                index = faiss.clone_index(self._faiss)
+                if removed_ids:
+                    index.remove_ids(np.asarray(removed_ids, dtype=np.int64))
+                for batch in _batches(added_ids, BATCH_SIZE):
+                    ids, vectors = self._vectors(batch)
+                    index.add_with_ids(vectors, ids)
+                source = "updated"
+            else:
+                # Another process may already have written this generation
+                index = self._read_faiss(generation, count)
+                if index is not None:
+                    source = "loaded"
+                else:
+                    index = self._build(count, kind)
+                    source = "built"
+            if isinstance(index, faiss.IndexIVF):
+                index.nprobe = self.nprobe
+            if source != "loaded":
+                self._write_faiss(index, generation)
+            self._faiss = index
+            self._generation = generation
+            return source
+
+    def _target_kind(self, count):
+        # Hysteresis: an IVF-PQ index is only dropped once the corpus shrank to half the threshold
+        if count >= self.ann_min_chunks or (self.kind == "ivfpq" and count >= self.ann_min_chunks // 2):
+            return "ivfpq"
+        return "flat"
+
+    def _needs_retraining(self, count):
+        return self.kind == "ivfpq" and count > RETRAIN_GROWTH * int(self._meta("trained_on", 0))
+
+    def _read_faiss(self, generation, count):
+        try:
+            index = faiss.read_index(self._faiss_path(generation))
+        except RuntimeError:
+            return None
+        return index if index.ntotal == count else None
+
+    def _write_faiss(self, index, generation):
+        path = self._faiss_path(generation)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, path)
+        for name in os.listdir(self.persist_dir):
+            if name.startswith("policy-") and name.endswith(".faiss") and name != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(self.persist_dir, name))
+                except OSError:
+                    pass
+
+    def _build(self, count, kind):
+        """New FAISS index over all stored vectors"""
+        ids = [row[0] for row in self._db.execute("SELECT id FROM chunks ORDER BY id")]
+        if kind == "ivfpq":
+            # sqrt(n) lists keeps both training and the precomputed distance tables small
+            nlist = max(1, min(int(math.sqrt(count)), count // 39))
+            sample = sorted(random.Random(0).sample(ids, min(count, max(TRAIN_PER_LIST * nlist, TRAIN_MIN))))
+            # 8-bit codes need about 10k training vectors; smaller corpora get 4-bit codes
+            nbits = 8 if len(sample) >= 39 * 256 else 4
+            index = faiss.index_factory(self.dimension, f"IVF{nlist},PQ{_pq_subquantizers(self.dimension)}x{nbits}")
+            index.do_polysemous_training = False  # Only used by Hamming-distance search; very slow to train
+            index.train(self._vectors(sample)[1])
+            self._set_meta("trained_on", count)
+        else:
+            index = faiss.index_factory(self.dimension, "IDMap2,Flat")
+        for batch in _batches(ids, BATCH_SIZE):
+            batch_ids, vectors = self._vectors(batch)
+            index.add_with_ids(vectors, batch_ids)
+        return index
+
+    def _vectors(self, ids):
+        """Stored (ids, float32 vectors) for the given chunk ids; unknown ids are left out"""
+        found = []
+        blobs = []
+        for batch in _batches(list(ids), SQL_BATCH):
+            rows = self._db.execute(
+                f"SELECT id, vector FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            for chunk_id, blob in rows:
+                found.append(chunk_id)
+                blobs.append(blob)
+        vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(found), self.dimension)
+        return np.asarray(found, dtype=np.int64), vectors
+
+    def search(self, vectors, top_k):
+        """Chunk ids of the top_k nearest chunks for each query vector"""
+        index = self._faiss
+        queries = np.asarray(vectors, dtype=np.float32)
+        k = min(top_k, index.ntotal) if index is not None else 0
+        if k == 0:
+            return [[] for _ in queries]
+        if not isinstance(index, faiss.IndexIVF) or self.rerank <= 1:
+            _, ids = index.search(queries, k)
+            return [[int(i) for i in row if i >= 0] for row in ids]
+
+        # Re-rank the approximate candidates on their exact vectors
+        _, candidates = index.search(queries, min(k * self.rerank, index.ntotal))
+        with self._lock:
+            found, stored = self._vectors(sorted({int(i) for i in candidates.flat if i >= 0}))
+        rows = {int(chunk_id): row for row, chunk_id in enumerate(found)}
+        results = []
+        for query, row in zip(queries, candidates):
+            ids = [int(i) for i in row if int(i) in rows]
+            if not ids:
+                results.append([])
+                continue
+            distances = ((stored[[rows[i] for i in ids]] - query) ** 2).sum(axis=1)
+            results.append([ids[j] for j in np.argsort(distances, kind="stable")[:k]])
+        return results
+
+    def texts(self, ids):
+        """Chunk text by chunk id"""
+        texts = {}
+        with self._lock:
+            for batch in _batches(list(ids), SQL_BATCH):
+                texts.update(self._db.execute(
+                    f"SELECT id, text FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return texts
+
+    def stored_vectors(self):
+        """All (ids, vectors) in the store, e.g. to measure recall against exact search"""
+        with self._lock:
+            ids = [row[0] for row in self._db.execute("SELECT id FROM chunks ORDER BY id")]
+            return self._vectors(ids)
@@ -0,0 +1,182 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+from .models import PromptLogEntry, AuditResponse, LogRiskAssessment
+
+_ROTATE_SECRETS = "Rotate any exposed credentials and keep secrets out of prompts"
+_REDACT_PII = "Redact PII such as SSNs, card numbers and email addresses before prompting"
+
+# Detectors are compiled into a single alternation so each prompt is scanned once.
+# Group name -> (risk level, human readable label, suggestion)
+DETECTORS = {
+    "aws_key": ("High", "AWS access key", _ROTATE_SECRETS),
+    "private_key": ("High", "private key", _ROTATE_SECRETS),
+    "api_token": ("High", "API token", _ROTATE_SECRETS),
+    "secret_assignment": ("High", "hard-coded secret", _ROTATE_SECRETS),
+    "ssn": ("High", "Social Security number", _REDACT_PII),
+    "card": ("High", "credit card number", _REDACT_PII),
+    "email": ("High", "email address", _REDACT_PII),
+    "jailbreak": ("High", "attempt to bypass safety controls",
+                  "Review accounts that attempt to bypass content or safety controls"),
+    "credential_dump": ("High", "request to extract credentials",
+                        "Restrict LLM access to credential stores and review the requesting account"),
+}
+
+# Detectors that start with a keyword only fire at the start of a word. Prompts are lower-cased
+# and prefixed with a space before scanning, and every branch of the combined pattern starts with a
+# literal character, so the regex engine can skip most positions without trying any branch.
+_WORD_DETECTORS = [
+    ("aws_key", r"a(?:kia|sia)[0-9a-z]{16}(?![0-9a-z])"),
+    ("api_token", r"sk-[a-z0-9_-]{20,}|gh[pousr]_[a-z0-9]{36}|xox[abprs]-[a-z0-9-]{10,}"),
+    ("secret_assignment", r"(?:pass(?:word|wd)|secret|api[_-]?key|token)\s*[:=]\s*['\"]?(?P<secret_value>[^\s'\"]{8,})"),
+    ("jailbreak", r"bypass\s+(?:\w+(?:'s)?\s+){0,2}(?:content\s+)?(?:filters?|safety|guardrails|moderation)"
+                  r"|ignore\s+(?:all\s+)?(?:previous|prior|your)\s+instructions"
+                  r"|jailbreak|dan\s+mode|disable\s+(?:the\s+|your\s+)?(?:safety|content)\s+filters?"),
+    ("credential_dump", r"(?:list|dump|extract|export)\s+all\s+[^.]{0,40}?"
+                        r"(?:access\s+keys|secret\s+keys|passwords|credentials)"),
+]
+_OTHER_DETECTORS = [
+    ("private_key", r"-----begin (?:rsa |ec |dsa |openssh )?private key-----"),
+    ("ssn", r"[0-9](?<![0-9][0-9])[0-9]{2}-[0-9]{2}-[0-9]{4}(?![0-9])"),
+    ("card", r"[0-9](?<![0-9][0-9])(?:[ -]?[0-9]){12,18}(?![0-9])"),
+    ("email", r"@(?<=[\w.+-]@)[a-z0-9-]+\.[a-z]{2,}"),
+]
+_WORD_BOUNDARY = r"[\s=:'\"(\[]"
+
+def _combine(named):
+    """Join detectors into one alternation, with or without named groups"""
+    word = "|".join(f"(?P<{n}>{r})" if named else f"(?:{r})" for n, r in _WORD_DETECTORS)
+    other = "|".join(f"(?P<{n}>{r})" if named else f"(?:{r})" for n, r in _OTHER_DETECTORS)
+    return f"{_WORD_BOUNDARY}(?:{word})|{other}"
+
+# Named groups at the start of a branch disable the literal prefix scan, so the scan runs with
+# anonymous groups and the (rare) hits are classified by matching the named twin at the same position.
+_SCAN_PATTERN = re.compile(_combine(named=False).replace("(?P<secret_value>", "(?:"))
+_CLASSIFY_PATTERN = re.compile(_combine(named=True))
+
+# A prompt is "plainly safe" when it is a short, ordinary business request with no risky vocabulary
+_SAFE_REQUEST_PATTERN = re.compile(
+    r"(?:summarize|draft|write|create|suggest|translate|generate a summary|provide a template)\b"
+)
+_RISK_VOCABULARY_PATTERN = re.compile(
+    _WORD_BOUNDARY + r"(?:password|credential|secret|token|key|ssn|social\s+security|credit\s+card|card\s+number|"
+    r"bank|account\s+number|address|phone|email|customer\s+data|database|scrape|hack|exploit|malware|"
+    r"bypass|filter|nsfw|internal|system\s+prompt|confidential|salary|medical|personal|"
+    r"bomb|explosive|weapon|gun|poison|drug|ransomware|virus|phishing|impersonat|pretend|threat|harass|"
+    r"kill|attack|steal|fraud|fake|forge|launder|evade|surveil|stalk|track)"
+)
+
+SAFE_MAX_PROMPT_CHARS = 300
+SAFE_MAX_TOKENS = 1000  # Large token usage must be justified (acceptable use policy)
+
+# Reason of logs rated Low by the pre-screen, distinct from any assessment the model made
+SAFE_REASON = "Prescreened: benign template"
+
+# Minimum Shannon entropy (bits per character) for a value assigned to a secret-like name
+SECRET_MIN_ENTROPY = 3.0
+
+def luhn_valid(number):
+    """Check a card number candidate with the Luhn checksum"""
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 13:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+def shannon_entropy(value):
+    """Shannon entropy of a string in bits per character"""
+    if not value:
+        return 0.0
+    length = len(value)
+    return -sum(count / length * math.log2(count / length) for count in Counter(value).values())
+
+def _scan_text(prompt):
+    """Text the detectors run on (offsets are shifted by one by the leading space)"""
+    return " " + prompt.lower()
+
+def detect(prompt):
+    """Return the first confident detector match in a prompt as (name, start, end), or None"""
+    text = _scan_text(prompt)
+    for match in _SCAN_PATTERN.finditer(text):
+        found = _CLASSIFY_PATTERN.match(text, match.start())
+        name = found.lastgroup
+        start, end = found.span(name)
+        if name == "card" and not luhn_valid(found.group(name)):
+            continue
+        if name == "secret_assignment":
+            # Measure entropy on the original casing when offsets line up
+            value_start, value_end = found.span("secret_value")
+            value = prompt[value_start - 1:value_end - 1] if len(text) == len(prompt) + 1 else found.group("secret_value")
+            if shannon_entropy(value) < SECRET_MIN_ENTROPY:
+                continue
+        if name == "email":
+            # The scan starts at "@"; extend the span back over the local part
+            while start > 1 and (text[start - 1].isalnum() or text[start - 1] in "._+-"):
+                start -= 1
+        return name, start - 1, end - 1
+    return None
+
+def suspicious_spans(prompt, limit=8):
+    """(start, end) offsets of detector candidates and risky vocabulary, to keep when a prompt is shortened"""
+    text = _scan_text(prompt)
+    spans = []
+    for pattern in (_SCAN_PATTERN, _RISK_VOCABULARY_PATTERN):
+        for match in pattern.finditer(text):
+            spans.append((max(match.start() - 1, 0), match.end() - 1))
+            if len(spans) >= limit:
+                return sorted(spans)
+    return sorted(spans)
+
+def is_plainly_safe(log: PromptLogEntry):
+    """Short, ordinary business requests without risky vocabulary need no LLM review.
+
+    A keyword heuristic that can miss harmful requests, so it is only used when enabled.
+    """
+    if len(log.prompt) > SAFE_MAX_PROMPT_CHARS or log.tokens > SAFE_MAX_TOKENS:
+        return False
+    text = _scan_text(log.prompt)
+    return _SAFE_REQUEST_PATTERN.match(text, 1) is not None and _RISK_VOCABULARY_PATTERN.search(text) is None
+
+def prescreen_logs(indexed_logs: List[Tuple[int, PromptLogEntry]], skip_safe=False):
+    """Assess clear-cut logs locally.
+
+    Returns an AuditResponse holding the confident assessments (keyed by global index)
+    and the (index, log) pairs that still need an LLM review.
+    """
+    log_assessments: Dict[int, LogRiskAssessment] = {}
+    flags = []
+    suggestions = []
+    ambiguous = []
+
+    for idx, log in indexed_logs:
+        found = detect(log.prompt)
+        if found:
+            name = found[0]
+            risk_level, label, suggestion = DETECTORS[name]
+            log_assessments[idx] = LogRiskAssessment(risk_level=risk_level, reason=f"Prompt contains {label}")
+            flags.append(f"LOG {idx}: {label} detected in prompt from {log.user}")
+            suggestions.append(suggestion)
+        elif skip_safe and is_plainly_safe(log):
+            log_assessments[idx] = LogRiskAssessment(risk_level="Low", reason=SAFE_REASON)
+        else:
+            ambiguous.append((idx, log))
+
+    high_count = sum(1 for a in log_assessments.values() if a.risk_level == "High")
+    summary = f"Local pre-screen assessed {len(log_assessments)} logs without an LLM call"
+    summary += f" ({high_count} high risk)." if high_count else "."
+
+    result = AuditResponse(
+        summary=summary if log_assessments else "",
+        risk_status="High-Risk" if high_count else "Safe",
+        flags=flags,
+        suggestions=list(dict.fromkeys(suggestions)),
+        log_assessments=log_assessments
+    )
+    return result, ambiguous
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from .models import PromptLogEntry, LogRiskAssessment, RiskProfile
+from .config import (
+    PROFILE_DB_PATH, PROFILE_HALF_LIFE_HOURS, PROFILE_MAX_KEYS, PROFILE_ESCALATION_MIN_HIGH, PROFILE_ESCALATION_SHARE
+)
+
+KINDS = ("user", "model")
+
+# Token sketch: log-spaced buckets with ~5% relative error (about 170 buckets up to 10M tokens)
+SKETCH_GAMMA = 1.1
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+
+# Recent prompt hashes remembered per key to detect repeated prompts (direct-mapped, fixed size)
+PROMPT_SLOTS = 64
+
+# Weight of a Medium finding relative to a High one in the risk score
+MEDIUM_WEIGHT = 0.25
+
+# Profiles read per query when an audit touches many keys (SQLite variable limit)
+KEY_BATCH = 500
+
+# Global profile store (created on first use)
+_profiles = None
+
+def _token_bucket(tokens):
+    return 0 if tokens <= 1 else math.ceil(math.log(tokens) / _LOG_GAMMA)
+
+def _prompt_hash(prompt):
+    """Stable 63-bit prompt hash, the same in every worker (0 marks an empty slot)"""
+    return (int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "big") >> 1) or 1
+
+class _Profile:
+    """Exponentially decayed risk state of one user or model, in constant memory"""
+
+    __slots__ = ("counts", "tokens", "logs", "repeats", "prompt_slots", "updated_at", "last_seen")
+
+    def __init__(self, now):
+        self.counts = [0.0, 0.0, 0.0]  # Decayed High, Medium, Low findings
+        self.tokens = {}  # Token sketch: bucket -> decayed count
+        self.logs = 0.0
+        self.repeats = 0.0
+        self.prompt_slots = [0] * PROMPT_SLOTS
+        self.updated_at = now
+        self.last_seen = now
+
+    def decay(self, now, half_life):
+        """Age every count to `now`"""
+        elapsed = now - self.updated_at
+        if elapsed <= 0:
+            return
+        factor = 0.5 ** (elapsed / half_life)
+        self.counts = [c * factor for c in self.counts]
+        self.tokens = {b: c * factor for b, c in self.tokens.items() if c * factor >= 1e-6}
+        self.logs *= factor
+        self.repeats *= factor
+        self.updated_at = now
+
+    def add(self, level, tokens, prompt_hash):
+        if level is not None:
+            self.counts[level] += 1
+        bucket = _token_bucket(tokens)
+        self.tokens[bucket] = self.tokens.get(bucket, 0.0) + 1
+        self.logs += 1
+        slot = prompt_hash % PROMPT_SLOTS
+        if self.prompt_slots[slot] == prompt_hash:
+            self.repeats += 1
+        self.prompt_slots[slot] = prompt_hash
+
+    def token_percentile(self, q):
+        total = sum(self.tokens.values())
+        if not total:
+            return 0
+        target = q * total
+        seen = 0.0
+        for bucket in sorted(self.tokens):
+            seen += self.tokens[bucket]
+            if seen >= target:
+                break
+        # Midpoint of the bucket's (gamma^(b-1), gamma^b] range
+        return round(2 * SKETCH_GAMMA ** bucket / (SKETCH_GAMMA + 1))
+
+    def counts_at(self, now, half_life):
+        """Decayed High, Medium, Low counts at `now`, without aging the profile"""
+        factor = 0.5 ** (max(now - self.updated_at, 0.0) / half_life)
+        return [c * factor for c in self.counts]
+
+    @classmethod
+    def from_row(cls, row):
+        """Profile from the columns after (kind, key) of a profiles row"""
+        high, medium, low, logs, repeats, tokens, prompt_slots, updated_at, last_seen = row
+        profile = cls(updated_at)
+        profile.counts = [high, medium, low]
+        profile.tokens = {int(b): c for b, c in json.loads(tokens).items()}
+        profile.logs = logs
+        profile.repeats = repeats
+        profile.prompt_slots = array("q", prompt_slots).tolist()
+        profile.last_seen = last_seen
+        return profile
+
+    def to_row(self, half_life):
+        high, medium, low = self.counts
+        return (high, medium, low, self.logs, self.repeats, json.dumps(self.tokens),
+                array("q", self.prompt_slots).tobytes(), self.updated_at, self.last_seen,
+                _rank(self.counts, self.updated_at, half_life))
+
+def _high_share(counts):
+    total = sum(counts)
+    return counts[0] / total if total else 0.0
+
+def _risk_score(counts):
+    return counts[0] + MEDIUM_WEIGHT * counts[1]
+
+def _rank(counts, updated_at, half_life):
+    """Orders profiles by their current risk score at any later time, without decaying them.
+
+    A score s set at time u is worth s * 0.5 ** ((now - u) / half_life) at `now`, so comparing
+    log2(s) + u / half_life compares current scores. Profiles without a score rank lowest (NULL).
+    """
+    score = _risk_score(counts)
+    return math.log2(score) + updated_at / half_life if score > 0 else None
+
+class ProfileStore:
+    """Rolling per-user and per-model risk profiles, updated as audits complete.
+
+    Counts decay with a half-life, so they describe recent behaviour without a history scan.
+    Profiles are kept in SQLite so every worker process reads and updates the same ones and
+    they survive restarts. At most max_keys profiles per kind are kept; the least recently
+    seen are dropped first.
+    """
+
+    def __init__(self, path=PROFILE_DB_PATH, half_life_hours=PROFILE_HALF_LIFE_HOURS, max_keys=PROFILE_MAX_KEYS,
+                 escalation_min_high=PROFILE_ESCALATION_MIN_HIGH, escalation_share=PROFILE_ESCALATION_SHARE):
+        self.half_life = half_life_hours * 3600
+        self.max_keys = max_keys
+        self.escalation_min_high = escalation_min_high
+        self.escalation_share = escalation_share
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode: updates are read-modify-write, in transactions opened with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    kind TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    high REAL NOT NULL,
+                    medium REAL NOT NULL,
+                    low REAL NOT NULL,
+                    logs REAL NOT NULL,
+                    repeats REAL NOT NULL,
+                    tokens TEXT NOT NULL,  -- Token sketch as JSON {bucket: decayed count}
+                    prompt_slots BLOB NOT NULL,  -- PROMPT_SLOTS 64-bit prompt hashes
+                    updated_at REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    rank REAL,  -- See _rank
+                    PRIMARY KEY (kind, key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS profiles_rank ON profiles (kind, rank);
+                CREATE INDEX IF NOT EXISTS profiles_seen ON profiles (kind, last_seen);
+                CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            self._rerank_if_needed()
+
+    def _rerank_if_needed(self):
+        """Ranks depend on the half-life, so they are recomputed once after it changes"""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'half_life'").fetchone()
+        if row is not None and float(row[0]) == self.half_life:
+            return
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._db.execute("SELECT kind, key, high, medium, updated_at FROM profiles").fetchall()
+            self._db.executemany(
+                "UPDATE profiles SET rank = ? WHERE kind = ? AND key = ?",
+                ((_rank([high, medium], updated_at, self.half_life), kind, key)
+                 for kind, key, high, medium, updated_at in rows)
+            )
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('half_life', ?)", (repr(self.half_life),))
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _load(self, kind, keys) -> Dict[str, _Profile]:
+        """Stored profiles of `keys` (missing keys are left out)"""
+        profiles = {}
+        keys = list(keys)
+        for start in range(0, len(keys), KEY_BATCH):
+            batch = keys[start:start + KEY_BATCH]
+            rows = self._db.execute(
+                "SELECT key, high, medium, low, logs, repeats, tokens, prompt_slots, updated_at, last_seen "
+                f"FROM profiles WHERE kind = ? AND key IN ({','.join('?' * len(batch))})", (kind, *batch)
+            )
+            for row in rows:
+                profiles[row[0]] = _Profile.from_row(row[1:])
+        return profiles
+
+    def observe(self, logs: List[PromptLogEntry], log_assessments: Dict[int, LogRiskAssessment], log_indices=None):
+        """Add the assessed logs of a finished audit to their user and model profiles"""
+        levels = {"High": 0, "Medium": 1, "Low": 2}
+        observed = []
+        for i, log in enumerate(logs):
+            assessment = log_assessments.get(log_indices[i] if log_indices is not None else i)
+            if assessment is not None:
+                observed.append((log, levels.get(assessment.risk_level), _prompt_hash(log.prompt)))
+        if not observed:
+            return
+
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for kind in KINDS:
+                    added = False
+                    keys = {getattr(log, kind) for log, _, _ in observed}
+                    profiles = self._load(kind, keys)
+                    for profile in profiles.values():
+                        profile.decay(now, self.half_life)
+                    for key in keys - profiles.keys():
+                        profiles[key] = _Profile(now)
+                        added = True
+                    for log, level, prompt_hash in observed:
+                        profiles[getattr(log, kind)].add(level, log.tokens, prompt_hash)
+                    for profile in profiles.values():
+                        profile.last_seen = now
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO profiles (kind, key, high, medium, low, logs, repeats, tokens, "
+                        "prompt_slots, updated_at, last_seen, rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((kind, key) + profile.to_row(self.half_life) for key, profile in profiles.items())
+                    )
+                    if added:
+                        # Only new keys can push a kind over max_keys
+                        self._db.execute(
+                            "DELETE FROM profiles WHERE kind = ? AND key IN (SELECT key FROM profiles WHERE kind = ? "
+                            "ORDER BY last_seen DESC LIMIT -1 OFFSET ?)", (kind, kind, self.max_keys)
+                        )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _is_escalated(self, counts):
+        return counts[0] >= self.escalation_min_high and _high_share(counts) >= self.escalation_share
+
+    def escalated_users(self, users):
+        """Users among `users` whose recent findings are mostly High"""
+        with self._lock:
+            profiles = self._load("user", set(users))
+        now = time.time()
+        return {user for user, profile in profiles.items()
+                if self._is_escalated(profile.counts_at(now, self.half_life))}
+
+    def _view(self, kind, key, profile, now):
+        # Token percentiles and the repeat rate are ratios, so decaying them changes nothing
+        counts = profile.counts_at(now, self.half_life)
+        high, medium, low = counts
+        return RiskProfile(
+            kind=kind,
+            key=key,
+            high=round(high, 3),
+            medium=round(medium, 3),
+            low=round(low, 3),
+            risk_score=round(_risk_score(counts), 3),
+            high_share=round(_high_share(counts), 4),
+            tokens_p50=profile.token_percentile(0.5),
+            tokens_p90=profile.token_percentile(0.9),
+            tokens_p99=profile.token_percentile(0.99),
+            repeat_rate=round(profile.repeats / profile.logs, 4) if profile.logs else 0.0,
+            escalated=kind == "user" and self._is_escalated(counts),
+            last_seen=datetime.fromtimestamp(profile.last_seen, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+
+    def top(self, kind="user", limit=20) -> List[RiskProfile]:
+        """Profiles with the highest current risk score"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, high, medium, low, logs, repeats, tokens, prompt_slots, updated_at, last_seen "
+                "FROM profiles WHERE kind = ? ORDER BY rank DESC LIMIT ?", (kind, limit)
+            ).fetchall()
+        now = time.time()
+        return [self._view(kind, row[0], _Profile.from_row(row[1:]), now) for row in rows]
+
+    def get(self, kind, key) -> Optional[RiskProfile]:
+        with self._lock:
+            profile = self._load(kind, [key]).get(key)
+        if profile is None:
+            return None
+        return self._view(kind, key, profile, time.time())
+
+def get_profiles() -> ProfileStore:
+    """Return the process-wide profile store (shared with other processes through PROFILE_DB_PATH)"""
+    global _profiles
+    if _profiles is None:
+        _profiles = ProfileStore()
+    return _profiles
@@ -0,0 +1,107 @@
+from typing import List, Tuple
+from .models import PromptLogEntry
+from .prescreen import suspicious_spans
+from .config import AUDIT_MODEL, AUDIT_MAX_PROMPT_TOKENS, LLM_BACKEND
+
+# tiktoken encoding for the audit model (None until first use, False when unavailable)
+_encoding = None
+
+# Share of a shortened prompt's character budget kept from its start and end; the rest goes to suspicious spans
+HEAD_SHARE = 0.4
+TAIL_SHARE = 0.2
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token for English text)"""
+    return len(text) // 4 + 1
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        # The mock backend stays offline (tiktoken downloads its vocabulary on first use)
+        if LLM_BACKEND != "mock":
+            try:
+                import tiktoken
+                try:
+                    _encoding = tiktoken.encoding_for_model(AUDIT_MODEL)
+                except KeyError:
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"Tokenizer unavailable, estimating token counts instead: {str(e)}")
+    return _encoding
+
+def count_tokens(text):
+    """Token count with the audit model's tokenizer, or an estimate when it is not available"""
+    encoding = _get_encoding()
+    if not encoding:
+        return estimate_tokens(text)
+    return len(encoding.encode_ordinary(text))
+
+def count_tokens_batch(texts):
+    """Token counts for many texts (tokenized in parallel when tiktoken is available)"""
+    encoding = _get_encoding()
+    if not encoding:
+        return [estimate_tokens(text) for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(list(texts))]
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _excerpt(prompt, budget):
+    """Head, tail and the context around suspicious spans of a prompt, within about `budget` characters"""
+    head = int(budget * HEAD_SHARE)
+    tail = int(budget * TAIL_SHARE)
+    intervals = [(0, head), (len(prompt) - tail, len(prompt))]
+
+    spans = suspicious_spans(prompt)
+    if spans:
+        window = (budget - head - tail) // len(spans)
+        for start, end in spans:
+            if end - start >= window:
+                intervals.append((start, start + window))
+            else:
+                # Center the span in its window
+                pad = (window - (end - start)) // 2
+                intervals.append((max(start - pad, 0), min(end + pad, len(prompt))))
+
+    pieces = []
+    position = 0
+    for start, end in _merge(intervals):
+        if start > position:
+            pieces.append(f" [...{start - position} chars omitted...] ")
+        pieces.append(prompt[start:end])
+        position = end
+    if position < len(prompt):
+        pieces.append(f" [...{len(prompt) - position} chars omitted...] ")
+    return "".join(pieces)
+
+def compact_prompt(prompt, max_tokens=AUDIT_MAX_PROMPT_TOKENS):
+    """Shorten a prompt to at most max_tokens, keeping its head, tail and suspicious spans (secrets, PII, ...)"""
+    # Even at two tokens per character a prompt this short fits
+    if len(prompt) * 2 <= max_tokens:
+        return prompt
+    tokens = count_tokens(prompt)
+    if tokens <= max_tokens:
+        return prompt
+
+    budget = int(len(prompt) * max_tokens / tokens * 0.9)
+    for _ in range(4):
+        text = _excerpt(prompt, budget)
+        if count_tokens(text) <= max_tokens:
+            break
+        budget = int(budget * 0.8)
+    return text
+
+def compact_logs(indexed_logs: List[Tuple[int, PromptLogEntry]], max_tokens=AUDIT_MAX_PROMPT_TOKENS):
+    """(index, log) pairs with oversized prompts shortened for the audit prompt"""
+    compacted = []
+    for idx, log in indexed_logs:
+        prompt = compact_prompt(log.prompt, max_tokens)
+        compacted.append((idx, log if prompt is log.prompt else log.model_copy(update={"prompt": prompt})))
+    return compacted
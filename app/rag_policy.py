@@ -1,60 +1,208 @@
+import asyncio
+import hashlib
 import os
-from llama_index.core import VectorStoreIndex
-from llama_index.core.readers import SimpleDirectoryReader
-from llama_index.core.storage import StorageContext
-from llama_index.vector_stores.faiss import FaissVectorStore  # Note: Capital F, no "FAISS"
-import faiss
+import threading
+import time
+from collections import OrderedDict
+from .backends import get_embed_model
+from .policy_index import PolicyIndex
+from .prompt_builder import count_tokens_batch
+from .runtime import get_runtime
+from . import metrics
+from .config import (
+    POLICY_DIR, POLICY_RELOAD_INTERVAL, POLICY_INDEX_DIR, POLICY_TOP_K, POLICY_RETRIEVAL_CACHE_SIZE,
+    AUDIT_POLICY_CONTEXT_TOKENS
+)
+
+# Default policy, created when the policy directory holds no documents
+POLICY_FILE = os.path.join(POLICY_DIR, "acceptable_use_policy.md")
+
+# Policy documents are the files with these extensions anywhere under POLICY_DIR
+POLICY_EXTENSIONS = (".md", ".txt")
+
+# Long prompts are cut to this many characters before they are embedded as retrieval queries
+POLICY_QUERY_MAX_CHARS = 2000
+
+# Tokens of a chunk's "[P12] " label and the blank line before it
+POLICY_LABEL_TOKENS = 6
 
 # Global index variable
 _index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+# Policy files as of the last scan: relative path -> (size, mtime_ns, sha256)
+_files = {}
+_corpus_version = None
+_scanned_at = 0.0
+_scan_lock = threading.Lock()
+
+# (index version, top_k, query hash) -> chunk ids of the query's top chunks
+_retrieval_cache = OrderedDict()
+_retrieval_lock = threading.Lock()
+
+def _file_sha(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _scan_policy_dir(policy_dir=POLICY_DIR):
+    """(relative path, stat) of every policy document under policy_dir"""
+    for root, dirs, names in os.walk(policy_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.lower().endswith(POLICY_EXTENSIONS) and not name.startswith("."):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, policy_dir).replace(os.sep, "/"), os.stat(path)
+
+def _scan():
+    """Current (corpus version, files); only files whose size or mtime changed are re-hashed"""
+    global _files, _corpus_version, _scanned_at
+    with _scan_lock:
+        now = time.monotonic()
+        if _corpus_version is not None and now - _scanned_at < POLICY_RELOAD_INTERVAL:
+            return _corpus_version, _files
+        files = {}
+        for path, stat in _scan_policy_dir():
+            known = _files.get(path)
+            if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                files[path] = known
+            else:
+                files[path] = (stat.st_size, stat.st_mtime_ns, _file_sha(os.path.join(POLICY_DIR, path)))
+        digest = hashlib.sha256()
+        for path in sorted(files):
+            digest.update(f"{path}\0{files[path][2]}\n".encode("utf-8"))
+        _files = files
+        _corpus_version = digest.hexdigest()[:16]
+        _scanned_at = now
+        return _corpus_version, _files
+
+def policy_corpus_version():
+    """Content hash of the policy documents (changes whenever a policy is added, edited or removed).
+
+    The directory is re-scanned at most every POLICY_RELOAD_INTERVAL seconds.
+    """
+    return _scan()[0]
+
+def _ensure_policy_file():
+    """Create a default policy file if the policy directory has no documents"""
+    global _corpus_version
+    if os.path.isdir(POLICY_DIR) and next(_scan_policy_dir(), None) is not None:
+        return
+    policy_file = POLICY_FILE
+    os.makedirs(os.path.dirname(policy_file), exist_ok=True)
+    with open(policy_file, "w") as f:
+        f.write("# Acceptable Use Policy\n\n")
+        f.write("1. Users should not submit prompts containing PII (Personal Identifiable Information).\n")
+        f.write("2. Large token usage should be justified by business requirements.\n")
+        f.write("3. Repetitive prompts should be optimized or cached.\n")
+        f.write("4. Users should not attempt to extract internal system information.\n")
+        f.write("5. Production use cases should use approved models only.\n")
+    with _scan_lock:
+        _corpus_version = None  # Re-scan right away
+
+def initialize_index(persist_dir=POLICY_INDEX_DIR):
+    """Bring the policy index in line with the policy directory.
+
+    Only added, edited or removed files are (re-)embedded; unchanged chunks and the
+    FAISS index are loaded from persist_dir.
+    """
+    global _index, _index_version
 
-def initialize_index():
-    """Initialize the FAISS index with policy documents"""
-    global _index
-    
-    # Check if the policy file exists
-    policy_file = "app/policies/acceptable_use_policy.md"
-    if not os.path.exists(policy_file):
-        os.makedirs(os.path.dirname(policy_file), exist_ok=True)
-        with open(policy_file, "w") as f:
-            f.write("# Acceptable Use Policy\n\n")
-            f.write("1. Users should not submit prompts containing PII (Personal Identifiable Information).\n")
-            f.write("2. Large token usage should be justified by business requirements.\n")
-            f.write("3. Repetitive prompts should be optimized or cached.\n")
-            f.write("4. Users should not attempt to extract internal system information.\n")
-            f.write("5. Production use cases should use approved models only.\n")
-    
-    # Load documents
-    documents = SimpleDirectoryReader(input_files=[policy_file]).load_data()
-    
-    # Create FAISS index
-    dimension = 1536  # OpenAI embedding dimension
-    faiss_index = faiss.IndexFlatL2(dimension)
-    vector_store = FaissVectorStore(faiss_index=faiss_index)
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    
-    # Create index
-    _index = VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context
-    )
-    
+    _ensure_policy_file()
+    version, files = _scan()
+    index = _index
+    if index is None or index.persist_dir != persist_dir:
+        index = PolicyIndex(persist_dir)
+
+    start = time.perf_counter()
+    source = index.sync({path: (os.path.join(POLICY_DIR, path), entry[2]) for path, entry in files.items()},
+                        version, get_embed_model())
+    metrics.INDEX_INIT_DURATION.observe(time.perf_counter() - start, source=source)
+    if source != "loaded":
+        print(f"Policy index {source}: {len(files)} files, {index.ntotal} chunks ({index.kind})")
+
+    _index = index
+    _index_version = version
+    return _index
+
+def warm_policy_index():
+    """Load (or update) the policy index ahead of the first audit request"""
+    with _index_lock:
+        if _index is None or _index_version != policy_corpus_version():
+            initialize_index()
     return _index
 
-def get_policy_context(query, num_results=2):
-    """Get relevant policy context for a query"""
-    global _index
-    
-    # Initialize if not already done
-    if _index is None:
-        try:
-            _index = initialize_index()
-        except Exception as e:
-            return f"Error initializing policy index: {str(e)}"
-    
-    # Query the index
-    try:
-        query_engine = _index.as_query_engine(similarity_top_k=num_results)
-        response = query_engine.query(query)
-        return response.response
-    except Exception as e:
-        return f"Error querying policy index: {str(e)}"
+def _index_ready():
+    return _index is not None and _index_version == policy_corpus_version()
+
+def _search(index, vectors, top_k):
+    """Top-k search for a batch of query vectors; returns chunk ids per query"""
+    return index.search(vectors, top_k)
+
+async def aretrieve_policy_chunks(queries, top_k=POLICY_TOP_K):
+    """Chunk ids of the top_k policy chunks for each query, without any LLM call.
+
+    Distinct queries that are not cached yet are embedded in batched calls.
+    """
+    index = _index if _index_ready() else await asyncio.to_thread(warm_policy_index)
+    keys = [(_index_version, top_k, hashlib.sha256(q.encode("utf-8")).digest()) for q in queries]
+
+    found = {}
+    with _retrieval_lock:
+        for key in keys:
+            ids = _retrieval_cache.get(key)
+            if ids is not None:
+                _retrieval_cache.move_to_end(key)
+                found[key] = ids
+
+    # Dict keys deduplicate repeated queries within the batch
+    pending = {key: query for key, query in zip(keys, queries) if key not in found}
+    metrics.RETRIEVAL_CACHE_HITS.inc(len(keys) - len(pending))
+    metrics.RETRIEVAL_CACHE_MISSES.inc(len(pending))
+    if pending:
+        texts = [query[:POLICY_QUERY_MAX_CHARS] for query in pending.values()]
+        vectors = await get_runtime().embed_model().aget_text_embedding_batch(texts)
+        results = await asyncio.to_thread(_search, index, vectors, top_k)
+        with _retrieval_lock:
+            for key, ids in zip(pending, results):
+                found[key] = ids
+                _retrieval_cache[key] = ids
+            while len(_retrieval_cache) > POLICY_RETRIEVAL_CACHE_SIZE:
+                _retrieval_cache.popitem(last=False)
+
+    return [found[key] for key in keys]
+
+def format_policy_context(ids_per_query, max_tokens=AUDIT_POLICY_CONTEXT_TOKENS):
+    """Deduplicate retrieved chunks across a batch, within a token allowance.
+
+    Returns the policy context text, with each chunk listed once and labelled P1, P2, ...,
+    and the labels retrieved for each query. Chunks are taken rank by rank (every query's
+    best chunk first) until max_tokens is used up; chunks that do not fit are left out.
+    """
+    texts = _index.texts({chunk_id for ids in ids_per_query for chunk_id in ids}) if _index is not None else {}
+    texts = {chunk_id: text.strip() for chunk_id, text in texts.items()}
+    costs = dict(zip(texts, count_tokens_batch(texts.values())))
+    labels = {}
+    used = 0
+    for rank in range(max((len(ids) for ids in ids_per_query), default=0)):
+        for ids in ids_per_query:
+            chunk_id = ids[rank] if rank < len(ids) else None
+            if chunk_id not in texts or chunk_id in labels:
+                continue
+            cost = costs[chunk_id] + POLICY_LABEL_TOKENS
+            if max_tokens is not None and used + cost > max_tokens:
+                continue
+            labels[chunk_id] = f"P{len(labels) + 1}"
+            used += cost
+    context = "\n\n".join(f"[{label}] {texts[chunk_id]}" for chunk_id, label in labels.items())
+    refs = [[labels[i] for i in ids if i in labels] for ids in ids_per_query]
+    return context, refs
+
+async def aget_log_policy_context(prompts, top_k=POLICY_TOP_K, max_tokens=AUDIT_POLICY_CONTEXT_TOKENS):
+    """Policy context for a batch of log prompts and the policy labels relevant to each prompt"""
+    with metrics.span("retrieval", metrics.RETRIEVAL_DURATION):
+        ids = await aretrieve_policy_chunks(prompts, top_k)
+        return format_policy_context(ids, max_tokens)
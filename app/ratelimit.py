@@ -0,0 +1,247 @@
+import asyncio
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import httpx
+import openai
+from . import metrics
+from .config import (
+    LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_RATE_LIMIT_DB_PATH, LLM_BULK_RESERVE,
+    LLM_INTERACTIVE_MAX_WAIT, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX
+)
+
+# Priority lanes: interactive audits are served before bulk jobs and streamed exports
+LANES = ("interactive", "bulk")
+
+# Upstream statuses worth retrying
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# Longest single sleep while waiting for budget, so waiters notice refills and cooldowns promptly
+MAX_POLL_INTERVAL = 1.0
+
+# Lane of the model calls made by the current request or job
+_lane: ContextVar = ContextVar("llm_lane", default="interactive")
+
+# Global limiter instance (created on first use)
+_limiter = None
+
+class RateLimited(Exception):
+    """Raised when an upstream model call cannot be made within the rate limits"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextmanager
+def lane(name):
+    """Make the model calls inside the block in the given priority lane"""
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def current_lane():
+    return _lane.get()
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error):
+    """Delay requested by the upstream Retry-After headers, if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def retry_delay(error, attempt):
+    """Seconds to wait before retrying a failed call, or None when the error is not transient"""
+    status = _status_code(error)
+    if status is not None:
+        if status not in RETRYABLE_STATUS:
+            return None
+    elif not isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return None
+    # Full exponential backoff with jitter, so workers that failed together do not retry together
+    delay = min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+    requested = _retry_after(error)
+    if requested is not None:
+        delay = max(delay, min(requested, LLM_BACKOFF_MAX))
+    return delay
+
+class RateLimiter:
+    """Requests/min and tokens/min token buckets for upstream model calls.
+
+    Bucket levels live in a SQLite file so every worker process draws from the same budget.
+    Bulk calls leave `bulk_reserve` of each bucket to interactive calls, and within a process
+    they also wait while interactive calls are queued. A 429 pauses all workers until the
+    upstream limit has reset.
+    """
+
+    def __init__(self, path=LLM_RATE_LIMIT_DB_PATH, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE, bulk_reserve=LLM_BULK_RESERVE,
+                 interactive_max_wait=LLM_INTERACTIVE_MAX_WAIT, max_retries=LLM_MAX_RETRIES):
+        self.limits = {name: per_minute for name, per_minute in
+                       (("requests", requests_per_minute), ("tokens", tokens_per_minute)) if per_minute > 0}
+        self.bulk_reserve = min(max(bulk_reserve, 0.0), 0.9)
+        self.interactive_max_wait = interactive_max_wait
+        self.max_retries = max_retries
+        self._waiting = {name: 0 for name in LANES}
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+        self._db = None
+        if self.limits:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def _take(self, tokens, lane):
+        """Take one request and `tokens` tokens from the shared buckets.
+
+        Returns 0 when the budget was taken, otherwise the seconds until enough will have refilled.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = {name: (level, updated_at) for name, level, updated_at
+                        in self._db.execute("SELECT name, level, updated_at FROM buckets")}
+                cooldown = rows.get("cooldown", (0.0, now))[0]
+                if cooldown > now:
+                    self._db.execute("COMMIT")
+                    return cooldown - now
+
+                wait = 0.0
+                levels = {}
+                costs = {}
+                for name, per_minute in self.limits.items():
+                    level, updated_at = rows.get(name, (per_minute, now))
+                    level = min(per_minute, level + (now - updated_at) * per_minute / 60)
+                    reserve = self.bulk_reserve * per_minute if lane == "bulk" else 0.0
+                    # Calls larger than the whole budget would never fit, so they take all of it
+                    cost = min(1 if name == "requests" else tokens, per_minute - reserve)
+                    if level < cost + reserve:
+                        wait = max(wait, (cost + reserve - level) * 60 / per_minute)
+                    levels[name] = level
+                    costs[name] = cost
+                if wait == 0.0:
+                    for name in levels:
+                        levels[name] -= costs[name]
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+                    ((name, level, now) for name, level in levels.items())
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _settle(self, tokens):
+        """Charge (or refund, when negative) the difference between estimated and actual tokens"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE buckets SET level = MIN(level - ?, ?) WHERE name = 'tokens'",
+                (tokens, self.limits["tokens"])
+            )
+
+    def _set_cooldown(self, until):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO buckets (name, level, updated_at) VALUES ('cooldown', ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET level = MAX(level, excluded.level), updated_at = excluded.updated_at",
+                (until, time.time())
+            )
+
+    async def settle(self, estimated, actual):
+        """Correct the token bucket once the actual usage of a call is known"""
+        if "tokens" in self.limits and actual and actual != estimated:
+            await asyncio.to_thread(self._settle, actual - estimated)
+
+    async def cooldown(self, seconds):
+        """Pause every call (in all worker processes sharing the budget) for `seconds`"""
+        until = time.time() + seconds
+        self._cooldown_until = max(self._cooldown_until, until)
+        if self._db is not None:
+            await asyncio.to_thread(self._set_cooldown, until)
+
+    async def acquire(self, tokens):
+        """Wait until the current lane may make a call of about `tokens` tokens.
+
+        Raises RateLimited when an interactive call would wait longer than interactive_max_wait.
+        """
+        lane = current_lane()
+        start = time.monotonic()
+        self._waiting[lane] += 1
+        try:
+            with metrics.span("ratelimit", metrics.RATE_LIMIT_WAIT, lane=lane):
+                while True:
+                    wait = self._cooldown_until - time.time()
+                    if wait <= 0 and lane == "bulk" and self._waiting["interactive"]:
+                        # Interactive calls queued in this process go first
+                        wait = 0.05
+                    if wait <= 0:
+                        if self._db is None:
+                            return
+                        wait = await asyncio.to_thread(self._take, tokens, lane)
+                        if wait <= 0:
+                            return
+                    waited = time.monotonic() - start
+                    if lane == "interactive" and waited + wait > self.interactive_max_wait:
+                        metrics.RATE_LIMITED.inc(lane=lane)
+                        raise RateLimited("Upstream model rate limit reached, please retry later", math.ceil(wait))
+                    # Jitter so waiting workers do not all retry at the same instant
+                    await asyncio.sleep(min(wait, MAX_POLL_INTERVAL) * random.uniform(1.0, 1.2))
+        finally:
+            self._waiting[lane] -= 1
+
+    async def call(self, invoke, tokens):
+        """Await invoke() within the budget, retrying transient upstream errors with backoff"""
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                return await invoke()
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                status = _status_code(e)
+                metrics.LLM_RETRIES.inc(status=status or "connection")
+                if attempt >= self.max_retries:
+                    if status == 429:
+                        metrics.RATE_LIMITED.inc(lane=current_lane())
+                        raise RateLimited("Upstream model rate limit reached, please retry later",
+                                          math.ceil(delay)) from e
+                    raise
+                attempt += 1
+                print(f"Model call failed ({status or type(e).__name__}), retrying in {delay:.1f}s...")
+                if status == 429:
+                    # The upstream limit is shared, so every worker backs off, not just this call
+                    await self.cooldown(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide rate limiter"""
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import weakref
+from langchain.prompts import PromptTemplate
+from .models import AuditOutput
+from .backends import get_chat_model, get_embed_model
+from .config import AUDIT_MODEL, AUDIT_OUTPUT_FORMAT, AUDIT_TEMPLATE_RELOAD_INTERVAL
+
+# Prompt templates per output format, resolved relative to the package (not the working directory)
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+PROMPT_TEMPLATES = {
+    "text": os.path.join(PROMPTS_DIR, "prompt_template.txt"),
+    "json": os.path.join(PROMPTS_DIR, "prompt_template_json.txt"),
+}
+
+# JSON schema the model fills in JSON output mode
+OUTPUT_SCHEMA = json.dumps(AuditOutput.model_json_schema(), separators=(",", ":"))
+
+_REPAIR_INTRO = """Your previous answer was missing the assessments for some logs. Assess ONLY the logs below.
+
+LOGS:
+{logs}
+
+POLICY CONTEXT:
+{policy_context}
+
+"""
+
+# Follow-up prompts that ask only for the missing LOG numbers, per output format
+REPAIR_TEMPLATES = {
+    "text": _REPAIR_INTRO + """Respond in exactly this structure, with one line for EACH of these log numbers: {log_numbers}
+
+===LOG ASSESSMENTS===
+LOG <number>: High/Medium/Low | Brief reason
+
+===FLAGS===
+- First flag/concern
+(or "- No policy violations detected" if none)
+""",
+    "json": _REPAIR_INTRO + """Respond with a single JSON object matching this JSON schema, with one log_assessments entry for EACH of these log numbers: {log_numbers}
+{schema}
+""",
+}
+
+# Global runtime instance (created at startup, or on first use)
+_runtime = None
+
+def load_prompt_template(output_format=AUDIT_OUTPUT_FORMAT):
+    with open(PROMPT_TEMPLATES[output_format], "r") as f:
+        return f.read()
+
+def template_version(template, output_format=AUDIT_OUTPUT_FORMAT):
+    """Content hash of a prompt template (and output schema), part of the cache key"""
+    content = template
+    if output_format == "json":
+        content += OUTPUT_SCHEMA
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+class AuditRuntime:
+    """Process-wide audit setup: settings, compiled prompt templates and pooled chat and embedding models.
+
+    The prompt template is recompiled when its file changes on disk (checked at most every
+    reload_interval seconds; 0 disables the check). Chat models, chains and the embedding
+    model are created once per event loop, because their pooled HTTP client belongs to a loop.
+    """
+
+    def __init__(self, model_name=AUDIT_MODEL, output_format=AUDIT_OUTPUT_FORMAT,
+                 reload_interval=AUDIT_TEMPLATE_RELOAD_INTERVAL):
+        self.model_name = model_name
+        self.output_format = output_format
+        self.json_output = output_format == "json"
+        self.template_path = PROMPT_TEMPLATES[output_format]
+        self.reload_interval = reload_interval
+        self.repair_prompt = PromptTemplate(
+            template=REPAIR_TEMPLATES[output_format],
+            input_variables=["logs", "policy_context", "log_numbers", "schema"]
+        )
+        self._chains = weakref.WeakKeyDictionary()  # event loop -> (template version, audit chain, repair chain)
+        self._embed_models = weakref.WeakKeyDictionary()  # event loop -> (HTTP client, embedding model)
+        self._checked_at = time.monotonic()
+        self._mtime = os.stat(self.template_path).st_mtime_ns
+        self._compile(load_prompt_template(output_format))
+
+    def _compile(self, template):
+        self.audit_prompt = PromptTemplate(template=template, input_variables=["logs", "policy_context", "schema"])
+        self.template_version = template_version(template, self.output_format)
+
+    def refresh(self):
+        """Recompile the prompt template if its file changed; a broken edit keeps the current one"""
+        if self.reload_interval <= 0 or time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.template_path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            self._compile(load_prompt_template(self.output_format))
+            self._mtime = mtime
+            print(f"Reloaded prompt template {self.template_path} (version {self.template_version})")
+        except Exception as e:
+            print(f"Prompt template reload failed, keeping the current template: {str(e)}")
+
+    def _loop_chains(self):
+        loop = asyncio.get_running_loop()
+        chains = self._chains.get(loop)
+        if chains is None or chains[0] != self.template_version:
+            llm = chains[1].last if chains is not None else get_chat_model(self.model_name, json_output=self.json_output)
+            chains = (self.template_version, self.audit_prompt | llm, self.repair_prompt | llm)
+            self._chains[loop] = chains
+        return chains
+
+    def audit_chain(self):
+        """Prompt | model chain for the first audit call of a chunk"""
+        return self._loop_chains()[1]
+
+    def repair_chain(self):
+        """Prompt | model chain for a follow-up call that re-requests missing LOG lines"""
+        return self._loop_chains()[2]
+
+    def embed_model(self):
+        """Embedding model for retrieval queries, on the pooled HTTP client of the running loop"""
+        from .clients import get_http_client
+        loop = asyncio.get_running_loop()
+        client = get_http_client()
+        entry = self._embed_models.get(loop)
+        # A closed pool is replaced by get_http_client, and the model with it
+        if entry is None or entry[0] is not client:
+            entry = (client, get_embed_model(async_http_client=client))
+            self._embed_models[loop] = entry
+        return entry[1]
+
+def get_runtime() -> AuditRuntime:
+    """Return the process-wide audit runtime"""
+    global _runtime
+    if _runtime is None:
+        _runtime = AuditRuntime()
+    return _runtime
@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import json
+import sys
+from collections import Counter
+from pydantic import ValidationError
+from .models import PromptLogEntry, LogRiskAssessment
+from .audit import audit_logs_async, RISK_STATUS_ORDER
+from .ratelimit import lane
+from .config import AUDIT_STREAM_WINDOW, AUDIT_STREAM_MAX_LINE_BYTES
+
+# Flags kept for the final summary line (the rest are only counted, to keep memory flat)
+MAX_SUMMARY_FLAGS = 100
+
+async def aiter_lines(chunks, max_line_bytes=AUDIT_STREAM_MAX_LINE_BYTES):
+    """Split an async stream of byte chunks into lines without buffering the whole body"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise ValueError(f"Line exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield bytes(buffer)
+
+async def aiter_file_lines(f):
+    """Async line iterator over an open binary file (used by the CLI)"""
+    for line in f:
+        yield line.rstrip(b"\r\n")
+
+def parse_log_line(line):
+    """Validate one JSONL record; returns (PromptLogEntry, None) or (None, error message)"""
+    try:
+        return PromptLogEntry.model_validate_json(line), None
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'line'}: {err['msg']}" for err in e.errors())
+
+async def stream_audit(lines, window=AUDIT_STREAM_WINDOW):
+    """Audit JSONL records in bounded windows, yielding NDJSON result lines.
+
+    One line is yielded per input record ({"index", "risk_level", "reason"} or {"index", "error"}),
+    followed by a final {"summary": ...} line. At most two windows are held in memory: the one
+    being audited and the one being read.
+    """
+    risk_counts = Counter()
+    flags = []
+    flag_count = 0
+    invalid = 0
+    failed = 0
+    total = 0
+    risk_status = "Safe"
+
+    async def audit_window(entries):
+        """(entries, result, error): a failing window is reported per record and the stream goes on"""
+        try:
+            # Streamed exports are bulk work: interactive audits get the upstream budget first
+            with lane("bulk"):
+                result = await audit_logs_async([log for _, log in entries], log_indices=[idx for idx, _ in entries])
+        except Exception as e:
+            print(f"Error auditing logs {entries[0][0]}-{entries[-1][0]}: {str(e)}", file=sys.stderr)
+            return entries, None, f"Audit failed: {str(e)}"
+        return entries, result, None
+
+    def window_lines(entries, result, error):
+        nonlocal risk_status, flag_count, failed
+        if error is not None:
+            failed += len(entries)
+            for idx, _ in entries:
+                yield json.dumps({"index": idx, "error": error}) + "\n"
+            return
+        for idx, _ in entries:
+            assessment = result.log_assessments.get(idx) or LogRiskAssessment(
+                risk_level="Medium", reason="Not analyzed due to processing error"
+            )
+            risk_counts[assessment.risk_level] += 1
+            yield json.dumps({"index": idx, **assessment.model_dump()}) + "\n"
+        if RISK_STATUS_ORDER.get(result.risk_status, 0) > RISK_STATUS_ORDER[risk_status]:
+            risk_status = result.risk_status
+        flag_count += len(result.flags)
+        for flag in result.flags:
+            if len(flags) < MAX_SUMMARY_FLAGS and flag not in flags:
+                flags.append(flag)
+
+    pending = None
+    entries = []
+    async for line in lines:
+        if not line.strip():
+            continue
+        idx = total
+        total += 1
+        log, error = parse_log_line(line)
+        if error:
+            invalid += 1
+            yield json.dumps({"index": idx, "error": error}) + "\n"
+            continue
+        entries.append((idx, log))
+        if len(entries) >= window:
+            # Wait for the previous window before starting the next one
+            if pending is not None:
+                for out in window_lines(*await pending):
+                    yield out
+            pending = asyncio.create_task(audit_window(entries))
+            entries = []
+
+    if pending is not None:
+        for out in window_lines(*await pending):
+            yield out
+    if entries:
+        for out in window_lines(*await audit_window(entries)):
+            yield out
+
+    yield json.dumps({"summary": {
+        "total": total,
+        "invalid": invalid,
+        "failed": failed,
+        "risk_status": risk_status,
+        "risk_counts": dict(risk_counts),
+        "flag_count": flag_count,
+        "flags": flags,
+    }}) + "\n"
+
+async def _run_cli(args):
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    target = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        async for out in stream_audit(aiter_file_lines(source), window=args.window):
+            target.write(out)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit a JSONL file of prompt logs and write NDJSON results")
+    parser.add_argument("input", help="JSONL file with one PromptLogEntry per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON output file ('-' for stdout)")
+    parser.add_argument("--window", type=int, default=AUDIT_STREAM_WINDOW, help="Logs audited per window")
+    args = parser.parse_args(argv)
+    asyncio.run(_run_cli(args))
+
+if __name__ == "__main__":
+    main()
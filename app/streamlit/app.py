@@ -1,14 +1,170 @@
 import streamlit as st
+import gzip
 import json
 import requests
 import pandas as pd
 from io import StringIO
 import os
+import time
 
 API_URL = os.environ.get("API_URL", "http://localhost:8000")
 
 st.set_page_config(page_title="LLM Risk Auditor", layout="wide")
 
+RISK_ICONS = {"High": "🔴", "Medium": "🟠", "Low": "🟢"}
+
+RISK_LABELS = {level: f"{icon} {level}" for level, icon in RISK_ICONS.items()}
+RISK_DISPLAY = {"High-Risk": "🔴 HIGH RISK", "Moderate": "🟠 MODERATE", "Safe": "✅ SAFE"}
+
+# Rows per page of the results table, top users and models in the charts, flags listed
+PAGE_SIZES = [50, 100, 500, 1000]
+TOP_KEYS = 50
+MAX_FLAGS = 50
+
+def follow_audit_job(job_id, total):
+    """Stream per-log results of an audit job into a progress bar and running risk counts"""
+    progress = st.progress(0.0, text="Waiting for the audit to start...")
+    live_counts = st.empty()
+    counts = {level: 0 for level in RISK_ICONS}
+    assessed = 0
+    status = None
+    last_refresh = 0.0
+
+    with requests.get(f"{API_URL}/audit/jobs/{job_id}/events", stream=True) as events:
+        events.raise_for_status()
+        event = None
+        for line in events.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "assessment":
+                    assessed += 1
+                    counts[data["risk_level"]] = counts.get(data["risk_level"], 0) + 1
+                elif event == "status":
+                    status = data
+
+                # Redraw at most a few times per second
+                now = time.monotonic()
+                if now - last_refresh > 0.5 or (status and status["status"] in ("completed", "failed")):
+                    last_refresh = now
+                    progress.progress(min(assessed / max(total, 1), 1.0), text=f"Assessed {assessed} of {total} logs")
+                    live_counts.markdown(" · ".join(f"{RISK_LABELS.get(level, level)}: {count:,}"
+                                                    for level, count in counts.items()))
+
+    progress.empty()
+    live_counts.empty()
+    if status is None or status["status"] != "completed":
+        st.error(f"Audit failed: {(status or {}).get('error') or 'unknown error'}")
+        return False
+    return True
+
+def api_get(path, params=None):
+    response = requests.get(f"{API_URL}{path}", params=params)
+    response.raise_for_status()
+    return response.json()
+
+def job_version(job_id):
+    """Last update time of a job (cheap status call), so cached views refresh while it runs"""
+    return api_get(f"/audit/jobs/{job_id}", {"include_results": "false"})["updated_at"]
+
+# Results are cached per job and version: a finished job is fetched once per view, however often the page reruns
+@st.cache_data(show_spinner=False, max_entries=64)
+def fetch_overview(job_id, version):
+    return api_get(f"/audit/jobs/{job_id}/overview", {"top": TOP_KEYS, "flags": MAX_FLAGS})
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def fetch_page(job_id, version, offset, limit, risk_levels, user, model):
+    """One page of the results table, built column-wise from the API's page of logs"""
+    params = {"offset": offset, "limit": limit, "risk_level": list(risk_levels)}
+    if user:
+        params["user"] = user
+    if model:
+        params["model"] = model
+    page = api_get(f"/audit/jobs/{job_id}/logs", params)
+    df = pd.DataFrame.from_records(
+        page["logs"], columns=["index", "user", "model", "tokens", "prompt", "timestamp", "risk_level", "reason"]
+    )
+    df["risk_level"] = df["risk_level"].map(RISK_LABELS).fillna("⏳ Pending")
+    df["reason"] = df["reason"].fillna("")
+    return page["total"], df.set_index("index")
+
+def risk_frame(counts):
+    """High/Medium/Low columns per user or model, for stacked bar charts"""
+    df = pd.DataFrame.from_records(counts, columns=["key", "high", "medium", "low", "total"])
+    return df.set_index("key")[["high", "medium", "low"]].rename(columns=str.capitalize)
+
+def reset_page():
+    st.session_state.page = 1
+
+def results_dashboard(job_id):
+    """Summary, charts and a paginated, filterable log table of an audit job, loaded from the API"""
+    try:
+        version = job_version(job_id)
+        overview = fetch_overview(job_id, version)
+    except requests.HTTPError as e:
+        st.error(f"Could not load audit job {job_id}: {str(e)}")
+        return
+
+    col_a, col_b, col_c = st.columns(3)
+    with col_a:
+        st.metric("Total Logs", f"{overview['total']:,}")
+    with col_b:
+        st.metric("Risk Status", RISK_DISPLAY.get(overview["risk_status"], overview["status"].upper()))
+    with col_c:
+        st.metric("Total Tokens", f"{overview['tokens']:,}")
+
+    if overview["summary"]:
+        st.info(overview["summary"])
+
+    if overview["flags"]:
+        st.subheader("🚨 Risk Flags")
+        for flag in overview["flags"]:
+            st.warning(flag)
+        if overview["flag_count"] > len(overview["flags"]):
+            st.caption(f"... and {overview['flag_count'] - len(overview['flags']):,} more flags")
+    elif overview["status"] == "completed":
+        st.success("No policy violations detected.")
+
+    if overview["suggestions"]:
+        st.subheader("💡 Suggestions")
+        for suggestion in overview["suggestions"]:
+            st.success(suggestion)
+
+    st.subheader("Risk Overview")
+    st.bar_chart(pd.Series(overview["risk_counts"], name="logs").reindex(list(RISK_ICONS), fill_value=0))
+    chart_users, chart_models = st.columns(2)
+    with chart_users:
+        st.caption(f"Most high-risk users (top {len(overview['users'])} of {overview['user_count']:,})")
+        st.bar_chart(risk_frame(overview["users"]))
+    with chart_models:
+        st.caption("Risk levels per model")
+        st.bar_chart(risk_frame(overview["models"]))
+
+    # Filters and paging are applied by the API; only the visible page is downloaded
+    st.subheader("Log Analysis")
+    filter_risk, filter_user, filter_model, page_size = st.columns(4)
+    with filter_risk:
+        risk_levels = st.multiselect("Risk level", list(RISK_ICONS), on_change=reset_page)
+    with filter_user:
+        user = st.selectbox("User", ["All"] + [u["key"] for u in overview["users"]], on_change=reset_page)
+    with filter_model:
+        model = st.selectbox("Model", ["All"] + [m["key"] for m in overview["models"]], on_change=reset_page)
+    with page_size:
+        limit = st.selectbox("Rows per page", PAGE_SIZES, index=1, on_change=reset_page)
+
+    page = st.number_input("Page", min_value=1, key="page")
+    total, df = fetch_page(job_id, version, (page - 1) * limit, limit, tuple(risk_levels),
+                           None if user == "All" else user, None if model == "All" else model)
+    pages = max(1, -(-total // limit))
+    st.caption(f"Page {page} of {pages:,} · {total:,} matching logs")
+    st.dataframe(df)
+    st.download_button("Download this page as CSV", df.to_csv().encode("utf-8"), f"audit-{job_id}-page-{page}.csv")
+
+    with st.expander("View Raw API Response"):
+        st.subheader("Job Overview")
+        st.json(overview, expanded=False)
+
 st.title("LLM Risk Auditor")
 st.markdown("### Analyze how safely your organization uses LLMs")
 
@@ -73,7 +229,9 @@ with tab1:
             uploaded_file = st.file_uploader("Upload a JSON file", type="json")
             if uploaded_file:
                 input_data = json.load(uploaded_file)
-                st.json(input_data)
+                # Large uploads are previewed rather than rendered in full on every rerun
+                st.caption(f"{len(input_data.get('logs', [])):,} logs, first 20 shown")
+                st.dataframe(pd.DataFrame.from_records(input_data.get("logs", [])[:20]), hide_index=True)
             else:
                 input_data = None
         else:  # Paste JSON
@@ -89,101 +247,31 @@ with tab1:
                 input_data = None
         
         if st.button("Run Audit") and input_data:
-            with st.spinner("Analyzing logs..."):
-                try:
-                    # Call your FastAPI endpoint
-                    response = requests.post(f"{API_URL}/audit", json=input_data)
-                    response.raise_for_status()
-                    result = response.json()
-                    
-                    # Store in session state
-                    st.session_state.audit_result = result
-                    st.session_state.input_data = input_data
+            try:
+                # Submit a background job (ahead of bulk jobs) and follow its progress as chunks finish
+                response = requests.post(
+                    f"{API_URL}/audit/jobs", params={"priority": "interactive"},
+                    data=gzip.compress(json.dumps(input_data).encode("utf-8"), compresslevel=1),
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+                )
+                response.raise_for_status()
+                job_id = response.json()["job_id"]
+
+                if follow_audit_job(job_id, len(input_data["logs"])):
+                    # Only the job id is kept; results are loaded from the API page by page
+                    st.session_state.job_id = job_id
+                    st.session_state.page = 1
                     st.success("Audit completed!")
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
     
-    # Rest of the code remains the same
-    with col2:        
+    with col2:
         st.subheader("Audit Results")
-        
-        if "audit_result" in st.session_state:            
-            result = st.session_state.audit_result
-            logs = st.session_state.input_data["logs"]
-            
-            # Create metrics with updated risk status display
-            col_a, col_b, col_c = st.columns(3)
-            with col_a:
-                st.metric("Total Logs", len(logs))
-            with col_b:
-                risk_status = result["risk_status"]
-                if risk_status == "High-Risk":
-                    risk_display = "🔴 HIGH RISK"
-                elif risk_status == "Moderate":
-                    risk_display = "🟠 MODERATE"
-                else:
-                    risk_display = "✅ SAFE"
-                st.metric("Risk Status", risk_display)
-            with col_c:
-                total_tokens = sum(log["tokens"] for log in logs)
-                st.metric("Total Tokens", f"{total_tokens:,}")
-            
-            # Show summary
-            st.info(result["summary"])
-            
-            # Show flags and suggestions
-            if result["flags"]:
-                st.subheader("🚨 Risk Flags")
-                for flag in result["flags"]:
-                    st.warning(flag)
-            else:
-                st.success("No policy violations detected.")
-            
-            if result["suggestions"]:
-                st.subheader("💡 Suggestions")
-                for suggestion in result["suggestions"]:
-                    st.success(suggestion)
-
-            # Raw response viewer
-            with st.expander("View Raw API Response"):
-                st.subheader("Raw JSON Response")
-                st.code(json.dumps(result, indent=2), language="json")
-                
-                # Optionally add the request too
-                st.subheader("Request Payload")
-                st.code(json.dumps(st.session_state.input_data, indent=2), language="json")                
-            
-            # Show logs table with LLM-determined risk levels
-            st.subheader("Log Analysis")
-            log_data = []
-            
-            for i, log in enumerate(logs):
-                log_dict = log.copy()
-                
-                # Add risk assessment if available
-                if "log_assessments" in result and str(i) in result["log_assessments"]:
-                    assessment = result["log_assessments"][str(i)]
-                    risk_level = assessment["risk_level"]
-                    reason = assessment["reason"]
-                    
-                    # Add risk icon based on level
-                    if risk_level == "High":
-                        icon = "🔴"
-                    elif risk_level == "Medium":
-                        icon = "🟠"
-                    else:
-                        icon = "🟢"
-                        
-                    log_dict["risk_level"] = f"{icon} {risk_level}"
-                    log_dict["reason"] = reason
-                else:
-                    log_dict["risk_level"] = "🟢 Low"
-                    log_dict["reason"] = "Not assessed"
-                
-                log_data.append(log_dict)
-            
-            df = pd.DataFrame(log_data)
-            st.dataframe(df)
+
+        job_id = st.text_input("Audit job", value=st.session_state.get("job_id", ""),
+                               help="Id of a background audit job; defaults to the last audit run here")
+        if job_id:
+            results_dashboard(job_id.strip())
         else:
             st.info("Run an audit to see results")
 
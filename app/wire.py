@@ -0,0 +1,173 @@
+import gzip
+import io
+import zlib
+from typing import Dict
+import orjson
+import ormsgpack
+import zstandard
+from pydantic import BaseModel
+from .models import LogRiskAssessment
+from .config import WIRE_COMPRESS_MIN_BYTES, WIRE_MAX_REQUEST_BYTES
+
+# Response media types: the regular JSON objects, or the columnar layout as JSON or MessagePack
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.llm-auditor.columnar+json"
+MSGPACK = "application/msgpack"
+MEDIA_TYPES = {JSON: JSON, COLUMNAR_JSON: COLUMNAR_JSON, MSGPACK: MSGPACK, "application/x-msgpack": MSGPACK}
+
+# Content codings in order of preference when a client accepts several equally, and their
+# (fast) levels: large bodies are compressed on every request
+ENCODINGS = ("zstd", "gzip")
+GZIP_LEVEL = 1
+ZSTD_LEVEL = 1
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+class PayloadTooLarge(ValueError):
+    pass
+
+def _qualities(header):
+    """{value: q} of an Accept or Accept-Encoding header, in header order"""
+    qualities = {}
+    for item in (header or "").split(","):
+        value, _, params = item.partition(";")
+        value = value.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if value:
+            qualities[value] = q
+    return qualities
+
+def negotiate_media_type(accept):
+    """Response media type for an Accept header (regular JSON unless a compact type is preferred)"""
+    qualities = _qualities(accept)
+    offered = [value for value, q in qualities.items() if value in MEDIA_TYPES and q > 0]
+    if not offered:
+        return JSON
+    return MEDIA_TYPES[max(offered, key=qualities.get)]
+
+def negotiate_encoding(accept_encoding):
+    """Content coding for an Accept-Encoding header, or None to send the body as is"""
+    qualities = _qualities(accept_encoding)
+    default = qualities.get("*", 0)
+    best = max(ENCODINGS, key=lambda encoding: qualities.get(encoding, default))
+    return best if qualities.get(best, default) > 0 else None
+
+def columnar_assessments(log_assessments: Dict[int, LogRiskAssessment]):
+    """Log assessments as parallel arrays, with risk levels and reasons stored once and referenced by position"""
+    levels = {}
+    reasons = {}
+    level_refs = []
+    reason_refs = []
+    for assessment in log_assessments.values():
+        level_refs.append(levels.setdefault(assessment.risk_level, len(levels)))
+        reason_refs.append(reasons.setdefault(assessment.reason, len(reasons)))
+    return {
+        "index": list(log_assessments),
+        "risk_levels": list(levels),
+        "risk_level": level_refs,
+        "reasons": list(reasons),
+        "reason": reason_refs,
+    }
+
+def expand_assessments(columns) -> Dict[int, LogRiskAssessment]:
+    """Inverse of columnar_assessments"""
+    levels = columns["risk_levels"]
+    reasons = columns["reasons"]
+    # The server built these from validated assessments, so validation is skipped
+    return {
+        idx: LogRiskAssessment.model_construct(risk_level=levels[level], reason=reasons[reason])
+        for idx, level, reason in zip(columns["index"], columns["risk_level"], columns["reason"])
+    }
+
+def to_wire(model: BaseModel, columnar=False):
+    """Plain data form of a response model; every log_assessments map is columnar if requested"""
+    data = {}
+    for name, value in model:
+        if name == "log_assessments":
+            if columnar:
+                value = columnar_assessments(value)
+            else:
+                value = {idx: {"risk_level": a.risk_level, "reason": a.reason} for idx, a in value.items()}
+        elif isinstance(value, BaseModel):
+            value = to_wire(value, columnar)
+        elif isinstance(value, list) and value and isinstance(value[0], BaseModel):
+            value = [to_wire(item, columnar) for item in value]
+        data[name] = value
+    return data
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    raise UnsupportedEncoding(f"Unsupported content encoding: {encoding}")
+
+def encode(model: BaseModel, media_type=JSON, encoding=None):
+    """Serialize a response model; returns (body, content encoding or None)"""
+    data = to_wire(model, columnar=media_type != JSON)
+    if media_type == MSGPACK:
+        body = ormsgpack.packb(data, option=ormsgpack.OPT_NON_STR_KEYS)
+    else:
+        body = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    # Small bodies are not worth the extra CPU on either side
+    if encoding is None or len(body) < WIRE_COMPRESS_MIN_BYTES:
+        return body, None
+    return compress(body, encoding), encoding
+
+def _decompressor(encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    raise UnsupportedEncoding(f"Unsupported content encoding: {encoding}")
+
+def content_codings(content_encoding):
+    """Codings of a Content-Encoding header, in the order they have to be undone"""
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",")]
+    return [c for c in reversed(codings) if c and c != "identity"]
+
+def decompress(body, content_encoding, max_bytes=WIRE_MAX_REQUEST_BYTES):
+    """Undo a Content-Encoding, refusing output larger than max_bytes (compression bombs; None for no limit)"""
+    for encoding in content_codings(content_encoding):
+        if encoding == "zstd":
+            reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(body), read_across_frames=True)
+            body = reader.read(-1 if max_bytes is None else max_bytes + 1)
+        else:
+            body = _decompressor(encoding).decompress(body, 0 if max_bytes is None else max_bytes + 1)
+        if max_bytes is not None and len(body) > max_bytes:
+            raise PayloadTooLarge(f"Decompressed body exceeds {max_bytes} bytes")
+    return body
+
+async def adecompress(chunks, content_encoding, max_bytes=WIRE_MAX_REQUEST_BYTES):
+    """Undo a single Content-Encoding on an async stream of body chunks"""
+    codings = content_codings(content_encoding)
+    if not codings:
+        async for chunk in chunks:
+            yield chunk
+        return
+    if len(codings) > 1:
+        raise UnsupportedEncoding("Streamed bodies support a single content encoding")
+    decompressor = _decompressor(codings[0])
+    total = 0
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        total += len(data)
+        if total > max_bytes:
+            raise PayloadTooLarge(f"Decompressed body exceeds {max_bytes} bytes")
+        if data:
+            yield data
+
+def decode(body, media_type=JSON, content_encoding=None):
+    """Client side of encode(): the response as plain data (log_assessments stay columnar if sent so)"""
+    body = decompress(body, content_encoding, max_bytes=None)
+    if media_type == MSGPACK:
+        return ormsgpack.unpackb(body, option=ormsgpack.OPT_NON_STR_KEYS)
+    return orjson.loads(body)
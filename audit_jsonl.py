@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+# Load environment variables before any app module reads its settings (app.config reads them on import)
+load_dotenv()
+
+from app.streaming import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""End-to-end audit benchmark on the offline mock backend.
+
+Usage: python -m benchmarks.bench_audit [--sizes 10,100,1000,10000,100000] [--output FILE] [--compare BASELINE]
+
+Reports requests/sec, logs/sec, p50/p95/p99 request latency, time to the first model
+assessment, response parse time and peak memory for each batch size, and writes them as JSON so runs can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def configure_environment(args):
+    """Select the mock backend before any app module reads its configuration"""
+    os.environ.update({
+        "LLM_BACKEND": "mock",
+        "EMBED_BACKEND": "mock",
+        "MOCK_LLM_LATENCY": str(args.latency),
+        "MOCK_LLM_LATENCY_PER_LOG": str(args.latency_per_log),
+        "MOCK_LLM_MALFORMED_RATE": str(args.malformed_rate),
+        "AUDIT_CACHE": "1" if args.cache else "0",
+        "AUDIT_PRESCREEN": "0" if args.no_prescreen else "1",
+        "AUDIT_HISTORY": "1" if args.history else "0",
+        "HISTORY_DB_PATH": os.path.join(tempfile.gettempdir(), "llm-risk-auditor-bench-history.db"),
+        "PROFILE_DB_PATH": os.path.join(tempfile.gettempdir(), "llm-risk-auditor-bench-profiles.db"),
+        "AUDIT_MAX_CONCURRENCY": str(args.concurrency),
+        "AUDIT_OUTPUT_FORMAT": args.output_format,
+        "AUDIT_STREAM_RESPONSES": "0" if args.no_stream else "1",
+        "POLICY_INDEX_DIR": os.path.join(tempfile.gettempdir(), "llm-risk-auditor-bench-index"),
+    })
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+async def run_requests(audit, logs, requests, parallel):
+    """Run `requests` audits of the same batch, `parallel` at a time; returns per-request latencies"""
+    semaphore = asyncio.Semaphore(parallel)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await audit(logs)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, time.perf_counter() - start
+
+async def first_model_result(logs):
+    """Seconds until on_progress reports the first log that was not resolved by the pre-screen"""
+    from app.audit import audit_logs_async
+    from app.config import AUDIT_PRESCREEN, AUDIT_PRESCREEN_SKIP_SAFE
+    from app.prescreen import prescreen_logs
+
+    local = set()
+    if AUDIT_PRESCREEN:
+        prescreened, _ = prescreen_logs(list(enumerate(logs)), skip_safe=AUDIT_PRESCREEN_SKIP_SAFE)
+        local = set(prescreened.log_assessments)
+    first = []
+    start = time.perf_counter()
+
+    async def on_progress(assessments):
+        if not first and any(idx not in local for idx in assessments):
+            first.append(time.perf_counter() - start)
+
+    await audit_logs_async(logs, on_progress=on_progress)
+    return first[0] if first else 0.0
+
+def measure_parse(size, repeats=5):
+    """Time parsing a well-formed response for `size` logs in the configured output format"""
+    from app.audit import format_log_line, parse_model_output
+    from app.backends import mock_audit_response
+    from app.config import AUDIT_OUTPUT_FORMAT
+    from benchmarks.data import generate_logs
+
+    prompt_text = "\n".join(format_log_line(i, log) for i, log in enumerate(generate_logs(size, seed=7)))
+    response = mock_audit_response(prompt_text, json_output=AUDIT_OUTPUT_FORMAT == "json")
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parse_model_output(response, size)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def benchmark_size(size, args):
+    from app.audit import audit_logs_async
+    from benchmarks.data import generate_logs
+
+    logs = generate_logs(size)
+    requests = args.requests or max(3, min(50, 20000 // size))
+
+    async def run():
+        # Warm-up (policy index, regex caches, ...)
+        await audit_logs_async(logs)
+        latencies, elapsed = await run_requests(audit_logs_async, logs, requests, args.parallel)
+        first = await first_model_result(logs)
+
+        tracemalloc.start()
+        await audit_logs_async(logs)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return latencies, elapsed, first, peak
+
+    latencies, elapsed, first, peak = asyncio.run(run())
+    return {
+        "batch_size": size,
+        "requests": requests,
+        "parallel": args.parallel,
+        "requests_per_sec": round(requests / elapsed, 3),
+        "logs_per_sec": round(requests * size / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+        },
+        "first_model_result_ms": round(first * 1000, 2),
+        "parse_ms": round(measure_parse(size) * 1000, 3),
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+
+def compare(report, baseline_path):
+    """Print the relative change of each metric against a baseline report"""
+    with open(baseline_path, "r") as f:
+        baseline = {r["batch_size"]: r for r in json.load(f)["results"]}
+    print(f"Compared to {baseline_path} (higher req/s is better, lower is better for the rest):")
+    for result in report["results"]:
+        base = baseline.get(result["batch_size"])
+        if base is None:
+            continue
+        changes = []
+        for name, current, previous in [
+            ("req/s", result["requests_per_sec"], base["requests_per_sec"]),
+            ("p95", result["latency_ms"]["p95"], base["latency_ms"]["p95"]),
+            ("first result", result.get("first_model_result_ms", 0), base.get("first_model_result_ms", 0)),
+            ("parse", result["parse_ms"], base["parse_ms"]),
+            ("memory", result["peak_memory_mb"], base["peak_memory_mb"]),
+        ]:
+            delta = (current - previous) / previous * 100 if previous else 0.0
+            changes.append(f"{name} {delta:+.1f}%")
+        print(f"  {result['batch_size']:>7} logs: " + ", ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="Comma separated batch sizes")
+    parser.add_argument("--requests", type=int, default=0, help="Requests per batch size (default: scaled to size)")
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM calls per request")
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock LLM latency per call (seconds)")
+    parser.add_argument("--latency-per-log", type=float, default=0.0005, help="Extra mock latency per log (seconds)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of malformed mock responses")
+    parser.add_argument("--output-format", choices=["json", "text"], default="json", help="Response format requested from the model")
+    parser.add_argument("--cache", action="store_true", help="Keep the assessment cache enabled")
+    parser.add_argument("--history", action="store_true", help="Record audited logs in the history store")
+    parser.add_argument("--no-prescreen", action="store_true", help="Send every log to the (mock) LLM")
+    parser.add_argument("--no-stream", action="store_true", help="Wait for complete model responses")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/audit-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    results = []
+    for size in sizes:
+        result = benchmark_size(size, args)
+        results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+    commit = git_commit()
+    report = {
+        "benchmark": "audit",
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"audit-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Ingest and query benchmark for the audit history store.
+
+Usage: python -m benchmarks.bench_history [--rows 1000000] [--days 90] [--max-query-ms 50]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.history import HistoryStore
+from app.models import PromptLogEntry, LogRiskAssessment
+from benchmarks.data import USERS, MODELS
+
+BATCH_SIZE = 10000
+
+def timed(fn, repeats=5):
+    """Median wall time of fn() in milliseconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--days", type=int, default=90, help="Time span the logs are spread over")
+    parser.add_argument("--max-query-ms", type=float, default=50, help="Fail if a query is slower than this")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    users = USERS + [f"user_{n}" for n in range(200)]
+    levels = [LogRiskAssessment(risk_level=level, reason="bench") for level in ("High", "Medium", "Low")]
+    end = datetime.now(timezone.utc)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.db"))
+        start = time.perf_counter()
+        for offset in range(0, args.rows, BATCH_SIZE):
+            count = min(BATCH_SIZE, args.rows - offset)
+            logs = [
+                PromptLogEntry(
+                    user=rng.choice(users), model=rng.choice(MODELS), prompt="", tokens=rng.randint(50, 4000),
+                    timestamp=(end - timedelta(seconds=rng.uniform(0, args.days * 86400))).isoformat()
+                )
+                for _ in range(count)
+            ]
+            store.record(logs, {i: rng.choices(levels, weights=(1, 3, 6))[0] for i in range(count)})
+        ingest_seconds = time.perf_counter() - start
+
+        until = end.timestamp()
+        since = until - args.days * 86400
+        queries = {
+            "risk_counts_by_user": lambda: store.risk_counts(since, until, "user"),
+            "risk_counts_by_model": lambda: store.risk_counts(since, until, "model"),
+            "top_consumers": lambda: store.top_consumers(since, until, "user"),
+            "daily_trend": lambda: store.trend(since, until, "day"),
+            "hourly_trend_one_user": lambda: store.trend(until - 7 * 86400, until, "hour", user=users[0]),
+        }
+        report = {
+            "rows": args.rows,
+            "ingest_rows_per_sec": round(args.rows / ingest_seconds),
+            "query_ms": {name: round(timed(query), 2) for name, query in queries.items()},
+        }
+    print(json.dumps(report, indent=2))
+
+    slow = [name for name, ms in report["query_ms"].items() if ms > args.max_query_ms]
+    if slow:
+        print(f"Queries slower than {args.max_query_ms:.0f} ms: {', '.join(slow)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Ingest, update and retrieval benchmark for the policy index, with recall against exact search.
+
+Usage: python -m benchmarks.bench_policy_index [--chunks 100000] [--files 500] [--min-recall 0.9]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from app.backends import MockEmbedding
+from app.config import POLICY_TOP_K, POLICY_EMBED_BATCH_SIZE, POLICY_ANN_NPROBE, POLICY_ANN_RERANK
+from app.policy_index import PolicyIndex
+from benchmarks.data import generate_prompts
+
+# Retrieval runs once per audit chunk for all of its prompts
+QUERY_BATCH = 100
+
+# Every TOPIC_EVERY-th paragraph is about a kind of request in the log queries, so they have true neighbours
+TOPIC_EVERY = 4
+
+SUBJECTS = ["Employees", "Contractors", "Vendors", "Support agents", "Analysts", "Service accounts", "Interns"]
+ACTIONS = ["must not share", "may only process", "must encrypt", "must report any leak of", "must not store",
+           "must redact", "may summarize", "must retain", "must delete"]
+OBJECTS = ["customer PII", "SSNs", "credit card numbers", "source code", "API keys", "medical records",
+           "financial results", "marketing drafts", "internal credentials", "employee reviews", "S3 buckets"]
+CONTEXTS = ["with external models", "in prompts", "outside the EU", "without approval", "in shared channels",
+            "for more than 30 days", "in the Boston office", "in the Berlin office", "in the Tokyo office"]
+
+def policy_paragraph(rng, unit, rule):
+    sentences = [
+        f"{rng.choice(SUBJECTS)} of business unit {unit} {rng.choice(ACTIONS)} {rng.choice(OBJECTS)} "
+        f"{rng.choice(CONTEXTS)} (rule {unit}.{rule}.{n})."
+        for n in range(2)
+    ]
+    return " ".join(sentences)
+
+def topic_paragraph(rng, unit, rule):
+    """A rule about one kind of request the auditor sees, quoting an example prompt"""
+    example = generate_prompts(1, seed=rng.random())[0]
+    return (f"{rng.choice(SUBJECTS)} of business unit {unit} {rng.choice(ACTIONS)} the output of requests such as "
+            f"\"{example}\" {rng.choice(CONTEXTS)} (rule {unit}.{rule}.0).")
+
+def write_corpus(policy_dir, files, chunks, rng):
+    """Policy files of about one chunk per paragraph; returns path -> (file path, sha)"""
+    per_file = max(1, chunks // files)
+    corpus = {}
+    for unit in range(files):
+        path = f"unit-{unit:04d}/policy.md"
+        file_path = os.path.join(policy_dir, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        text = f"# Business unit {unit} policy\n\n" + "\n\n".join(
+            (topic_paragraph if rule % TOPIC_EVERY == 0 else policy_paragraph)(rng, unit, rule)
+            for rule in range(per_file)
+        )
+        with open(file_path, "w") as f:
+            f.write(text)
+        corpus[path] = (file_path, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    return corpus
+
+def version_of(corpus):
+    return hashlib.sha256(json.dumps(sorted((p, sha) for p, (_, sha) in corpus.items())).encode()).hexdigest()[:16]
+
+def recall(flat, queries, approx, exact_distances, k):
+    """Share of the exact top k that was found; a result as close as the k-th exact one counts as found,
+    since templated policies have many equidistant chunks"""
+    found = 0
+    for query, ids, distances in zip(queries, approx, exact_distances):
+        for chunk_id in ids[:k]:
+            distance = float(((flat.reconstruct(int(chunk_id)) - query) ** 2).sum())
+            found += distance <= distances[k - 1] * (1 + 1e-5) + 1e-6
+    return found / (len(queries) * k)
+
+def search_ms(search, queries, top_k):
+    """Results of search(vectors, top_k) and its wall time per batch of QUERY_BATCH queries, in milliseconds"""
+    timings = []
+    results = []
+    for start in range(0, len(queries), QUERY_BATCH):
+        batch = queries[start:start + QUERY_BATCH]
+        t = time.perf_counter()
+        results += search(batch, top_k)
+        timings.append((time.perf_counter() - t) * 1000)
+    timings.sort()
+    return results, {"p50": round(statistics.median(timings), 2),
+                     "p99": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100000, help="Approximate number of policy chunks")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--top-k", type=int, default=POLICY_TOP_K)
+    parser.add_argument("--nprobe", type=int, default=POLICY_ANN_NPROBE)
+    parser.add_argument("--rerank", type=int, default=POLICY_ANN_RERANK)
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Fail if recall@k is below this")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    embed_model = MockEmbedding(embed_batch_size=POLICY_EMBED_BATCH_SIZE)
+    with tempfile.TemporaryDirectory() as tmp:
+        policy_dir = os.path.join(tmp, "policies")
+        corpus = write_corpus(policy_dir, args.files, args.chunks, rng)
+        index = PolicyIndex(os.path.join(tmp, "index"), nprobe=args.nprobe, rerank=args.rerank)
+
+        start = time.perf_counter()
+        index.sync(corpus, version_of(corpus), embed_model)
+        ingest_seconds = time.perf_counter() - start
+
+        # Half paraphrased policy sentences, half log prompts like the ones the auditor retrieves for;
+        # both are held to --min-recall
+        policy_count = args.queries - args.queries // 2
+        texts = [policy_paragraph(rng, rng.randrange(args.files), 0) for _ in range(policy_count)]
+        texts += generate_prompts(args.queries // 2, seed=1)
+        queries = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+
+        ids, vectors = index.stored_vectors()
+        flat = faiss.IndexIDMap2(faiss.IndexFlatL2(index.dimension))
+        flat.add_with_ids(vectors, ids)
+        flat_bytes = faiss.serialize_index(flat).nbytes
+        del vectors
+        exact_distances, _ = flat.search(queries, args.top_k)
+        _, flat_ms = search_ms(lambda batch, k: flat.search(batch, k)[1].tolist(), queries, args.top_k)
+
+        approx, ann_ms = search_ms(index.search, queries, args.top_k)
+        rerank = index.rerank
+        index.rerank = 1
+        no_rerank, _ = search_ms(index.search, queries, args.top_k)
+        index.rerank = rerank
+
+        # Edit one file, then remove another: only their chunks are re-embedded
+        edited_path, (edited_file, _) = sorted(corpus.items())[0]
+        with open(edited_file, "a") as f:
+            f.write("\n\n" + policy_paragraph(rng, 0, 10 ** 6))
+        with open(edited_file, "rb") as f:
+            corpus[edited_path] = (edited_file, hashlib.sha256(f.read()).hexdigest())
+        start = time.perf_counter()
+        edit_source = index.sync(corpus, version_of(corpus), embed_model)
+        edit_ms = (time.perf_counter() - start) * 1000
+
+        corpus.pop(sorted(corpus)[-1])
+        start = time.perf_counter()
+        remove_source = index.sync(corpus, version_of(corpus), embed_model)
+        remove_ms = (time.perf_counter() - start) * 1000
+
+        recalls = {}
+        for name, results in (("reranked", approx), ("without_rerank", no_rerank)):
+            for kind, part in (("policy_queries", slice(0, policy_count)), ("log_queries", slice(policy_count, None))):
+                recalls[f"{name}_{kind}"] = round(
+                    recall(flat, queries[part], results[part], exact_distances[part], args.top_k), 4
+                )
+
+        report = {
+            "files": args.files,
+            "chunks": len(ids),
+            "index": index.kind,
+            "ingest_seconds": round(ingest_seconds, 1),
+            "index_bytes": index.memory_bytes(),
+            "flat_index_bytes": flat_bytes,
+            "search_ms_per_batch": {"index": ann_ms, "flat": flat_ms, "batch": QUERY_BATCH},
+            "nprobe": args.nprobe,
+            "rerank": args.rerank,
+            f"recall@{args.top_k}": recalls,
+            "edit_one_file": {"ms": round(edit_ms, 1), "source": edit_source},
+            "remove_one_file": {"ms": round(remove_ms, 1), "source": remove_source},
+        }
+    print(json.dumps(report, indent=2))
+
+    recalls = report[f"recall@{args.top_k}"]
+    if min(recalls["reranked_policy_queries"], recalls["reranked_log_queries"]) < args.min_recall:
+        print(f"Recall below {args.min_recall}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
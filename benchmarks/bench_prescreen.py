@@ -0,0 +1,46 @@
+"""Throughput benchmark for the local pre-screen detector.
+
+Usage: python -m benchmarks.bench_prescreen [--prompts 200000] [--min-rate 100000]
+"""
+import argparse
+import json
+import sys
+import time
+
+from app.prescreen import detect, prescreen_logs
+from app.models import PromptLogEntry
+from benchmarks.data import generate_prompts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=200000)
+    parser.add_argument("--min-rate", type=float, default=100000, help="Fail if prompts/sec is below this")
+    args = parser.parse_args()
+
+    prompts = generate_prompts(args.prompts)
+
+    start = time.perf_counter()
+    matches = sum(1 for prompt in prompts if detect(prompt))
+    detect_seconds = time.perf_counter() - start
+
+    logs = [(i, PromptLogEntry(user="bench", prompt=p, tokens=200)) for i, p in enumerate(prompts)]
+    start = time.perf_counter()
+    result, ambiguous = prescreen_logs(logs)
+    stage_seconds = time.perf_counter() - start
+
+    report = {
+        "prompts": len(prompts),
+        "matches": matches,
+        "detect_prompts_per_sec": round(len(prompts) / detect_seconds),
+        "prescreen_prompts_per_sec": round(len(prompts) / stage_seconds),
+        "resolved_locally": len(result.log_assessments),
+        "sent_to_llm": len(ambiguous),
+    }
+    print(json.dumps(report, indent=2))
+
+    if report["detect_prompts_per_sec"] < args.min_rate:
+        print(f"Detector throughput below {args.min_rate:.0f} prompts/sec", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Payload size and encode/decode time of /audit responses in each wire format.
+
+Usage: python -m benchmarks.bench_wire [--logs 100000] [--min-gain 3]
+
+The baseline is the regular response as FastAPI serialized it before the wire formats
+(response model validation, then json.dumps) and as a client decoded it (json.loads).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+def configure_environment():
+    """Audit on the offline mock backend, with nothing persisted between runs"""
+    os.environ.update({
+        "LLM_BACKEND": "mock",
+        "EMBED_BACKEND": "mock",
+        "AUDIT_CACHE": "0",
+        "AUDIT_HISTORY": "0",
+        "PROFILE_DB_PATH": os.path.join(tempfile.gettempdir(), "llm-risk-auditor-bench-profiles.db"),
+        "POLICY_INDEX_DIR": os.path.join(tempfile.gettempdir(), "llm-risk-auditor-bench-index"),
+    })
+
+def timed(function, repeats):
+    """Result of function() and its best wall time in milliseconds (the least disturbed run)"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, round(min(timings), 2)
+
+def fastapi_baseline(result):
+    """Body of the response FastAPI builds from an AuditResponse through its response model"""
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+    from app.models import AuditResponse
+
+    field = create_model_field(name="response", type_=AuditResponse, mode="serialization")
+    content = asyncio.run(serialize_response(field=field, response_content=result))
+    return JSONResponse(content).body
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logs", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--min-gain", type=float, default=3,
+                        help="Fail unless MessagePack with zstd is this many times smaller and faster than the baseline")
+    args = parser.parse_args()
+
+    configure_environment()
+    from app.audit import audit_logs
+    from app.wire import JSON, COLUMNAR_JSON, MSGPACK, encode, decode
+    from benchmarks.data import generate_logs
+
+    result = audit_logs(generate_logs(args.logs))
+
+    body, baseline_encode = timed(lambda: fastapi_baseline(result), args.repeats)
+    _, baseline_decode = timed(lambda: json.loads(body), args.repeats)
+    baseline = {"bytes": len(body), "encode_ms": baseline_encode, "decode_ms": baseline_decode}
+
+    formats = {}
+    for media_type in (JSON, COLUMNAR_JSON, MSGPACK):
+        for encoding in (None, "gzip", "zstd"):
+            (body, used), encode_ms = timed(lambda: encode(result, media_type, encoding), args.repeats)
+            _, decode_ms = timed(lambda: decode(body, media_type, used), args.repeats)
+            formats[f"{media_type} {encoding or 'identity'}"] = {
+                "bytes": len(body), "encode_ms": encode_ms, "decode_ms": decode_ms,
+            }
+
+    best = formats[f"{MSGPACK} zstd"]
+    gains = {name: round(baseline[name] / max(best[name], 0.001), 1) for name in baseline}
+    report = {
+        "logs": args.logs,
+        "distinct_reasons": len({a.reason for a in result.log_assessments.values()}),
+        "flags": len(result.flags),
+        "baseline": baseline,
+        "formats": formats,
+        "msgpack_zstd_gain": gains,
+    }
+    print(json.dumps(report, indent=2))
+
+    if min(gains.values()) < args.min_gain:
+        print(f"MessagePack with zstd gains less than {args.min_gain}x over the baseline", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
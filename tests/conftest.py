@@ -0,0 +1,14 @@
+import os
+import tempfile
+
+# Settings are read when app.config is imported, so the offline backends and a throwaway
+# data directory are configured before any test module imports the app
+_DATA_DIR = tempfile.mkdtemp(prefix="llm-risk-auditor-tests-")
+os.environ.update({
+    "LLM_BACKEND": "mock",
+    "EMBED_BACKEND": "mock",
+    "AUDIT_CACHE": "0",
+    "AUDIT_HISTORY": "0",
+    "DATA_DIR": _DATA_DIR,
+    "POLICY_INDEX_DIR": os.path.join(_DATA_DIR, "policy_index"),
+})
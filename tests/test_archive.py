@@ -0,0 +1,56 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from app import archive
+from app.models import AuditResponse, LogRiskAssessment
+from app.ratelimit import RateLimited
+
+class InlinePool(ThreadPoolExecutor):
+    """Runs shards in threads of this process, where the audit can be faked"""
+
+    def __init__(self, max_workers, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+@pytest.fixture
+def archive_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ProcessPoolExecutor", InlinePool)
+    monkeypatch.setattr(archive, "warm_policy_index", lambda: None)
+    path = tmp_path / "archive.jsonl"
+    with open(path, "w") as f:
+        for i in range(10):
+            f.write(json.dumps({"user": f"user{i}", "prompt": f"prompt {i}", "tokens": 10, "model": "gpt-4"}) + "\n")
+    return str(path)
+
+def fake_audit(monkeypatch, fail_batch_with=None):
+    """Assess every log Low, raising RateLimited for the batch holding `fail_batch_with`"""
+    calls = []
+
+    async def audit_logs_async(logs, log_indices=None):
+        calls.append(log_indices)
+        if fail_batch_with in log_indices:
+            raise RateLimited("Upstream rate limit", retry_after=1)
+        return AuditResponse(summary="", log_assessments={
+            idx: LogRiskAssessment(risk_level="Low", reason="Routine") for idx in log_indices
+        })
+    monkeypatch.setattr(archive, "audit_logs_async", audit_logs_async)
+    return calls
+
+def test_failed_batch_is_retried_on_resume(archive_path, tmp_path, monkeypatch):
+    output_dir = str(tmp_path / "out")
+    calls = fake_audit(monkeypatch, fail_batch_with=4)
+    with pytest.raises(SystemExit, match="1 of 4 batches failed"):
+        archive.run_archive(archive_path, output_dir, workers=2, batch_size=3)
+    # The other batches of the failing shard still ran
+    assert sorted(calls) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    assert sorted(os.listdir(os.path.join(output_dir, archive.PARTS_DIR))) == [
+        "batch-000000.ndjson", "batch-000002.ndjson", "batch-000003.ndjson"
+    ]
+
+    calls = fake_audit(monkeypatch)
+    summary = archive.run_archive(archive_path, output_dir, workers=2, batch_size=3)
+    assert calls == [[3, 4, 5]]
+    assert summary["run"]["resumed_batches"] == 3
+    assert summary["total"] == 10 and summary["risk_counts"] == {"Low": 10}
+    with open(os.path.join(output_dir, archive.RESULTS_FILE)) as f:
+        assert [json.loads(line)["index"] for line in f] == list(range(10))
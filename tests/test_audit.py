@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from app import audit
+from app.history import HistoryStore
+from app.models import AuditResponse, LogRiskAssessment, PromptLogEntry
+from app.profiles import ProfileStore
+
+REPORT = "Send the Q{n} revenue report for region {n} to the finance team"
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    history = HistoryStore(str(tmp_path / "history.db"))
+    profiles = ProfileStore(str(tmp_path / "profiles.db"))
+    monkeypatch.setattr(audit, "get_history", lambda: history)
+    monkeypatch.setattr(audit, "get_profiles", lambda: profiles)
+    monkeypatch.setattr(audit, "AUDIT_PRESCREEN", False)
+    monkeypatch.setattr(audit, "PROFILE_ESCALATION", True)
+    # One log per chunk, so the cluster representative fails on its own
+    monkeypatch.setattr(audit, "chunk_logs", lambda indexed_logs: [[pair] for pair in indexed_logs])
+    return history, profiles
+
+def test_failed_representative_is_not_recorded_for_its_members(stores, monkeypatch):
+    history, profiles = stores
+    logs = [PromptLogEntry(user="alice", prompt=REPORT.format(n=n), tokens=100, model="gpt-4") for n in range(5)]
+    logs.append(PromptLogEntry(user="bob", prompt="Summarize the onboarding guide", tokens=100, model="gpt-4"))
+
+    async def audit_chunk(chunk, on_assessments=None):
+        (idx, log), = chunk
+        if log.user == "alice":
+            raise RuntimeError("upstream unavailable")
+        return AuditResponse(summary="Fine", log_assessments={idx: LogRiskAssessment(risk_level="Low", reason="Routine")})
+    monkeypatch.setattr(audit, "_audit_chunk", audit_chunk)
+
+    result = asyncio.run(audit.audit_logs_async(logs))
+
+    assert result.stats.deduplicated == 4
+    for idx in range(5):
+        assert result.log_assessments[idx].reason == "Not analyzed due to processing error"
+    rows = history._db.execute("SELECT user, risk_level FROM audit_logs").fetchall()
+    assert rows == [("bob", "Low")]
+    # The unanalyzed logs neither count as findings nor raise the risk scores
+    assert profiles.get("user", "alice") is None
+    assert profiles.get("user", "bob").low == pytest.approx(1, abs=0.01)
+    assert profiles.get("model", "gpt-4").medium == 0
@@ -0,0 +1,105 @@
+import os
+import pytest
+from app import cache as cache_module
+from app import rag_policy
+from app import runtime as runtime_module
+from app.cache import AuditCache, cache_key
+from app.models import LogRiskAssessment, PromptLogEntry
+from app.runtime import AuditRuntime
+
+HIGH = LogRiskAssessment(risk_level="High", reason="Shares credentials")
+LOW = LogRiskAssessment(risk_level="Low", reason="Routine")
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def sqlite_path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+def test_entries_expire_after_ttl(clock, sqlite_path):
+    cache = AuditCache(ttl=60, sqlite_path=sqlite_path)
+    cache.set("k", HIGH)
+    clock[0] += 59
+    assert cache.get("k") == HIGH
+    clock[0] += 2
+    assert cache.get("k") is None
+    # The SQLite tier expires too
+    assert AuditCache(ttl=60, sqlite_path=sqlite_path).get("k") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "memory_entries": 0}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AuditCache(max_entries=2)
+    cache.set("a", HIGH)
+    cache.set("b", LOW)
+    assert cache.get("a") == HIGH  # "b" is now the least recently used
+    cache.set("c", LOW)
+    assert cache.get("b") is None
+    assert cache.get("a") == HIGH and cache.get("c") == LOW
+
+def test_sqlite_hits_are_promoted_to_memory(sqlite_path):
+    AuditCache(sqlite_path=sqlite_path).set("k", HIGH)
+    cache = AuditCache(sqlite_path=sqlite_path)  # Another worker: empty memory tier
+    assert cache.stats()["memory_entries"] == 0
+    assert cache.get("k") == HIGH
+    assert cache.stats()["memory_entries"] == 1
+    cache._db.execute("DELETE FROM assessments")
+    assert cache.get("k") == HIGH
+
+def test_sqlite_tier_keeps_the_most_recently_used_rows(clock, sqlite_path):
+    cache = AuditCache(sqlite_path=sqlite_path, sqlite_max_entries=10)
+    for n in range(1000):
+        clock[0] += 1
+        cache.set(f"k{n}", LOW)
+    assert cache._db.execute("SELECT COUNT(*) FROM assessments").fetchone()[0] == 10
+    assert AuditCache(sqlite_path=sqlite_path).get("k999") == LOW
+
+def key(prompt="Send me the payroll file", tokens=120, policy="policy-v1", template="template-v1"):
+    return cache_key(PromptLogEntry(user="alice", prompt=prompt, tokens=tokens, model="gpt-4"),
+                     "openai:gpt-4o", policy, template)
+
+def test_key_ignores_whitespace_and_case_but_not_content():
+    assert key() == key("  send me THE payroll\nfile ")
+    assert key() != key("Send me the holiday calendar")
+    assert key(tokens=120) == key(tokens=130)  # Same token bucket
+    assert key(tokens=120) != key(tokens=5000)
+
+def test_key_changes_with_policy_corpus_and_template_versions():
+    assert key(policy="policy-v1") != key(policy="policy-v2")
+    assert key(template="template-v1") != key(template="template-v2")
+
+def test_editing_a_policy_changes_the_corpus_version(tmp_path, monkeypatch):
+    policy_dir = tmp_path / "policies"
+    policy_dir.mkdir()
+    (policy_dir / "aup.md").write_text("1. Do not share credentials.\n")
+    scan = rag_policy._scan_policy_dir
+    monkeypatch.setattr(rag_policy, "_scan_policy_dir", lambda: scan(str(policy_dir)))
+    monkeypatch.setattr(rag_policy, "POLICY_DIR", str(policy_dir))
+    monkeypatch.setattr(rag_policy, "POLICY_RELOAD_INTERVAL", 0)
+    monkeypatch.setattr(rag_policy, "_files", {})
+    monkeypatch.setattr(rag_policy, "_corpus_version", None)
+
+    before = rag_policy.policy_corpus_version()
+    (policy_dir / "aup.md").write_text("1. Do not share credentials or customer data.\n")
+    edited = rag_policy.policy_corpus_version()
+    (policy_dir / "extra.txt").write_text("2. Use approved models only.\n")
+    added = rag_policy.policy_corpus_version()
+    assert len({before, edited, added}) == 3
+    assert key(policy=before) != key(policy=edited)
+
+def test_editing_the_prompt_template_changes_the_template_version(tmp_path, monkeypatch):
+    template = tmp_path / "template.txt"
+    template.write_text(open(runtime_module.PROMPT_TEMPLATES["json"]).read())
+    monkeypatch.setitem(runtime_module.PROMPT_TEMPLATES, "json", str(template))
+    runtime = AuditRuntime(output_format="json", reload_interval=0.001)
+    before = runtime.template_version
+
+    template.write_text(template.read_text() + "\nBe strict about credentials.\n")
+    os.utime(template, ns=(runtime._mtime + 10**9, runtime._mtime + 10**9))
+    runtime._checked_at = float("-inf")
+    runtime.refresh()
+    assert runtime.template_version != before
+    assert key(template=before) != key(template=runtime.template_version)
@@ -0,0 +1,38 @@
+from app import rag_policy
+from app.audit import chunk_logs, format_log_line
+from app.models import PromptLogEntry
+from app.prompt_builder import count_tokens
+
+class FakeIndex:
+    def __init__(self, texts):
+        self._texts = texts
+
+    def texts(self, ids):
+        return {chunk_id: self._texts[chunk_id] for chunk_id in ids if chunk_id in self._texts}
+
+def test_policy_context_stays_within_its_allowance(monkeypatch):
+    # 100 logs with two distinct ~64-token chunks each, far more than the allowance
+    chunks = {n: f"Section {n}: " + "employees must not share confidential data " * 6 for n in range(200)}
+    monkeypatch.setattr(rag_policy, "_index", FakeIndex(chunks))
+    ids = [[2 * q, 2 * q + 1] for q in range(100)]
+
+    context, refs = rag_policy.format_policy_context(ids, max_tokens=1500)
+
+    assert count_tokens(context) <= 1500
+    # Every log's best chunk goes in before any second-ranked chunk
+    included = [q for q, labels in enumerate(refs) if labels]
+    assert all(len(refs[q]) == 1 for q in included)
+    assert included == list(range(len(included)))
+    assert context.count("[P") == len(included)
+
+def test_shared_chunks_are_listed_once(monkeypatch):
+    monkeypatch.setattr(rag_policy, "_index", FakeIndex({1: "Keep secrets out of prompts", 2: "Be polite"}))
+    context, refs = rag_policy.format_policy_context([[1, 2], [1]], max_tokens=None)
+    assert context == "[P1] Keep secrets out of prompts\n\n[P2] Be polite"
+    assert refs == [["P1", "P2"], ["P1"]]
+
+def test_chunks_reserve_the_policy_allowance():
+    logs = [(i, PromptLogEntry(user="u", prompt="word " * 40, tokens=50, model="gpt-4")) for i in range(200)]
+    line_tokens = count_tokens(format_log_line(0, logs[0][1])) + 8
+    chunks = chunk_logs(logs, token_budget=6000, max_logs=1000, policy_tokens=1500)
+    assert max(len(chunk) for chunk in chunks) == 4500 // line_tokens
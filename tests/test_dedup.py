@@ -0,0 +1,66 @@
+from app.dedup import cluster_logs, fan_out, normalize_for_dedup
+from app.models import LogRiskAssessment, PromptLogEntry
+
+REPORT = ("Please compile the quarterly revenue figures for every region in the {region} sales organisation, "
+          "format them as a table with subtotals per product line and a grand total at the bottom, highlight "
+          "any region that missed its target by more than five percent, and share it with {audience}")
+
+def logs_of(*prompts, model="gpt-4", tokens=300):
+    return [(i, PromptLogEntry(user="tester", prompt=p, tokens=tokens, model=model)) for i, p in enumerate(prompts)]
+
+def test_masks_variable_values():
+    assert normalize_for_dedup("Refund order 123-456 for bob@example.com, ref 9f8e7d6c5b4a") == \
+        "refund order <num> for <email>, ref <hex>"
+
+def test_exact_duplicates_after_masking_cluster():
+    representatives, members = cluster_logs(logs_of(
+        "Summarize ticket #1234 for the support lead",
+        "Summarize ticket #98765 for the support lead",
+        "Translate the onboarding guide into Spanish",
+    ))
+    assert [idx for idx, _ in representatives] == [0, 2]
+    assert members == {0: [1]}
+
+def test_near_duplicates_cluster():
+    representatives, members = cluster_logs(logs_of(
+        REPORT.format(region="EMEA", audience="the engineering leads"),
+        REPORT.format(region="APAC", audience="the engineering leads"),
+    ))
+    assert members == {0: [1]}
+
+def test_different_final_clause_does_not_cluster():
+    representatives, members = cluster_logs(logs_of(
+        REPORT.format(region="EMEA", audience="the engineering leads"),
+        REPORT.format(region="EMEA", audience="our competitor acme corp"),
+    ))
+    assert [idx for idx, _ in representatives] == [0, 1]
+    assert members == {}
+
+def test_clusters_never_cross_models_or_token_buckets():
+    prompt = "Summarize ticket #1 for the support lead"
+    logs = logs_of(prompt, prompt) + [(2, PromptLogEntry(user="u", prompt=prompt, tokens=300, model="gpt-3.5-turbo")),
+                                      (3, PromptLogEntry(user="u", prompt=prompt, tokens=5000, model="gpt-4"))]
+    representatives, members = cluster_logs(logs)
+    assert [idx for idx, _ in representatives] == [0, 2, 3]
+    assert members == {0: [1]}
+
+def test_exact_threshold_only_clusters_exact_duplicates():
+    representatives, members = cluster_logs(logs_of(
+        REPORT.format(region="EMEA", audience="the engineering leads"),
+        REPORT.format(region="APAC", audience="the engineering leads"),
+    ), threshold=1.0)
+    assert members == {}
+
+def test_fan_out_copies_representative_assessment():
+    assessments = {0: LogRiskAssessment(risk_level="High", reason="Shares revenue data"),
+                   2: LogRiskAssessment(risk_level="Low", reason="Routine")}
+    expanded = fan_out(assessments, {0: [1, 3]})
+    assert set(expanded) == {0, 1, 2, 3}
+    assert expanded[3].risk_level == "High"
+    assert expanded[3].reason == "Shares revenue data (near-duplicate of LOG 0)"
+    assert expanded[0] is assessments[0]
+
+def test_fan_out_keeps_fallback_reasons_unsuffixed():
+    failed = LogRiskAssessment(risk_level="Medium", reason="Not analyzed due to processing error")
+    expanded = fan_out({0: failed}, {0: [1, 2]}, unsuffixed={failed.reason})
+    assert [expanded[idx].reason for idx in (1, 2)] == [failed.reason] * 2
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+import pytest
+from app.history import HistoryStore, DAY, HOUR
+from app.models import LogRiskAssessment, PromptLogEntry
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc).timestamp()
+
+def record(store, entries):
+    """Record (offset seconds from START, user, model, risk level) entries"""
+    logs = [
+        PromptLogEntry(user=user, model=model, prompt="", tokens=100,
+                       timestamp=datetime.fromtimestamp(START + offset, timezone.utc).isoformat())
+        for offset, user, model, _ in entries
+    ]
+    store.record(logs, {i: LogRiskAssessment(risk_level=level, reason="test") for i, (*_, level) in enumerate(entries)})
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / "history.db"))
+
+def test_risk_counts_merge_daily_and_hourly_parts(store):
+    record(store, [
+        (-2 * HOUR, "alice", "gpt-4", "High"),           # Partial day before the window's first whole day
+        (DAY + HOUR, "alice", "claude", "High"),         # Whole day
+        (DAY + 2 * HOUR, "bob", "gpt-4", "Low"),
+        (3 * DAY + HOUR, "alice", "gpt-4", "Medium"),    # Partial day at the end of the window
+        (10 * DAY, "alice", "gpt-4", "High"),            # Outside the window
+    ])
+    counts = store.risk_counts(START - 3 * HOUR, START + 3 * DAY + 2 * HOUR, "user")
+    assert [(c.key, c.high, c.medium, c.low, c.total) for c in counts] == [("alice", 2, 1, 0, 3), ("bob", 0, 0, 1, 1)]
+
+    by_model = store.risk_counts(START - 3 * HOUR, START + 3 * DAY + 2 * HOUR, "model")
+    assert {c.key: c.total for c in by_model} == {"gpt-4": 3, "claude": 1}
+    top = store.top_consumers(START - 3 * HOUR, START + 3 * DAY + 2 * HOUR, "user", limit=1)
+    assert [(t.key, t.tokens, t.logs) for t in top] == [("alice", 300, 3)]
+
+def test_empty_window(store):
+    record(store, [(0, "alice", "gpt-4", "High")])
+    assert store.risk_counts(START + DAY, START + DAY) == []
+    assert store.top_consumers(START + DAY, START + DAY) == []
+
+def test_planner_statistics_pick_the_covering_index(store):
+    record(store, [(day * DAY + n, f"user_{n}", "gpt-4", "Low") for day in range(90) for n in range(20)])
+    plan = store._db.execute(
+        "EXPLAIN QUERY PLAN SELECT user, SUM(high) FROM audit_rollup_daily WHERE period >= ? AND period < ? GROUP BY user",
+        (START, START + 80 * DAY)
+    ).fetchall()
+    assert "audit_rollup_daily_user" in plan[0][3]
+
+def test_statistics_survive_restart(tmp_path):
+    path = str(tmp_path / "history.db")
+    record(HistoryStore(path), [(0, "alice", "gpt-4", "High")])
+    reopened = HistoryStore(path)
+    assert reopened._analyzed_logs == reopened._logs == 1
@@ -0,0 +1,92 @@
+import pytest
+from app.audit import IncrementalParser
+from tests.test_parse import JSON_RESPONSE, TEXT_RESPONSE, fenced
+
+def feed_in_pieces(parser, text, size=7):
+    """Feed text a few characters at a time, like a token stream; returns the batches returned"""
+    batches = []
+    for start in range(0, len(text), size):
+        new = parser.feed(text[start:start + size])
+        if new:
+            batches.append(new)
+    return batches
+
+@pytest.mark.parametrize("response", [
+    TEXT_RESPONSE, fenced(TEXT_RESPONSE), fenced(TEXT_RESPONSE, "text"),
+    JSON_RESPONSE, fenced(JSON_RESPONSE), fenced(JSON_RESPONSE, "json"),
+], ids=["text", "fenced-text", "fenced-text-language", "json", "fenced-json", "fenced-json-language"])
+def test_streams_assessments_in_either_format(response):
+    parser = IncrementalParser([4, 5])
+    batches = feed_in_pieces(parser, response + "\n")
+    assert parser.violation is None
+    assert {idx: a.risk_level for idx, a in parser.assessments.items()} == {4: "High", 5: "Low"}
+    # Every LOG is returned exactly once, as soon as it is complete
+    assert sorted(idx for batch in batches for idx in batch) == [4, 5]
+    assert len(batches) == 2
+
+@pytest.mark.parametrize("response, complete", [
+    (TEXT_RESPONSE, "LOG 4: High | Prompt contains an API token\n"),
+    (JSON_RESPONSE, '"reason": "Prompt contains an API token"}'),
+], ids=["text", "json"])
+def test_truncated_response_keeps_complete_entries(response, complete):
+    parser = IncrementalParser([4, 5])
+    cut = response.index(complete) + len(complete)
+    feed_in_pieces(parser, response[:cut + 12])
+    assert list(parser.assessments) == [4]
+    assert parser.violation is None
+
+def test_text_entry_waits_for_end_of_line():
+    parser = IncrementalParser([4, 5])
+    assert parser.feed("===LOG ASSESSMENTS===\nLOG 4: High | Prompt contains") == {}
+    assert parser.feed(" an API token\n")[4].reason == "Prompt contains an API token"
+
+def test_missing_section_header_is_a_violation():
+    parser = IncrementalParser([0])
+    parser.feed("Sure! Here is my assessment of the logs you sent. " * 10)
+    assert parser.violation == "no section header at the start of the response"
+    assert parser.feed("===LOG ASSESSMENTS===\nLOG 0: Low | fine\n") == {}
+
+def test_repeated_unexpected_logs_are_a_violation():
+    parser = IncrementalParser([0])
+    parser.feed("===LOG ASSESSMENTS===\n" + "".join(f"LOG {i}: Low | fine\n" for i in range(7, 10)))
+    assert parser.violation.startswith("3 malformed LOG entries in a row")
+    assert parser.assessments == {}
+
+def test_reset_keeps_returned_assessments():
+    parser = IncrementalParser([0, 1])
+    parser.feed("===LOG ASSESSMENTS===\nLOG 0: High | leaked key\n")
+    parser.reset()
+    # A retried call repeats LOG 0; it is not returned again
+    new = parser.feed("===LOG ASSESSMENTS===\nLOG 0: High | leaked key\nLOG 1: Low | fine\n")
+    assert list(new) == [1]
+    assert set(parser.assessments) == {0, 1}
+
+@pytest.mark.parametrize("fmt", ["text", "json"])
+def test_retried_stream_repeating_returned_logs_is_not_a_violation(fmt):
+    indices = list(range(6))
+    if fmt == "text":
+        head = "===LOG ASSESSMENTS===\n"
+        entries = [f"LOG {i}: Low | fine\n" for i in indices]
+        response = head + "".join(entries) + "===SUMMARY===\nFine\n"
+    else:
+        head = '{"log_assessments": ['
+        entries = [f'{{"log": {i}, "risk_level": "Low", "reason": "fine"}}, ' for i in indices]
+        response = head + "".join(entries) + '], "summary": "Fine"}'
+    parser = IncrementalParser(indices)
+    # The first attempt drops after LOG 0..2
+    feed_in_pieces(parser, head + "".join(entries[:3]))
+    parser.reset()
+    batches = feed_in_pieces(parser, response)
+    assert parser.violation is None
+    assert sorted(idx for batch in batches for idx in batch) == [3, 4, 5]
+
+def test_duplicate_log_within_a_response_is_still_unexpected():
+    parser = IncrementalParser([0])
+    parser.feed("===LOG ASSESSMENTS===\n" + "LOG 0: Low | fine\n" * 4)
+    assert parser.violation.startswith("3 malformed LOG entries in a row (unexpected LOG 0)")
+
+def test_long_stream_keeps_only_the_unconsumed_tail():
+    parser = IncrementalParser(range(1000))
+    feed_in_pieces(parser, "===LOG ASSESSMENTS===\n" + "".join(f"LOG {i}: Low | fine\n" for i in range(1000)) + "LOG 10")
+    assert len(parser.assessments) == 1000
+    assert parser._buffer == "LOG 10"
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from app.jobs import INTERRUPTED_ERROR, JobManager, JobQueueFull, JobStore
+from app.models import PromptLogEntry
+
+LOGS = [PromptLogEntry(user="tester", prompt="Summarize the meeting notes", tokens=100, model="gpt-4")]
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+def test_concurrent_submits_respect_queue_size(store):
+    async def submit_many():
+        # No workers are started, so every accepted job stays queued
+        manager = JobManager(store, workers=0, queue_size=2)
+        return await asyncio.gather(*(manager.submit(LOGS) for _ in range(5)), return_exceptions=True)
+
+    outcomes = asyncio.run(submit_many())
+
+    accepted = [job_id for job_id in outcomes if isinstance(job_id, str)]
+    assert len(accepted) == 2
+    assert all(isinstance(e, JobQueueFull) for e in outcomes if not isinstance(e, str))
+    # Rejected submits leave no job behind
+    count = store._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+    assert count == 2
+    assert all(store.get(job_id).status == "queued" for job_id in accepted)
+
+def test_slot_is_released_when_persisting_fails(store, monkeypatch):
+    def create(job_id, logs, priority):
+        raise OSError("disk full")
+
+    async def submit_twice():
+        manager = JobManager(store, workers=0, queue_size=1)
+        monkeypatch.setattr(store, "create", create)
+        with pytest.raises(OSError):
+            await manager.submit(LOGS)
+        monkeypatch.undo()
+        return await manager.submit(LOGS)
+
+    assert store.get(asyncio.run(submit_twice())).status == "queued"
+
+def test_job_runs_to_completion(store):
+    async def run_job():
+        manager = JobManager(store, workers=1, queue_size=4)
+        await manager.start()
+        job_id = await manager.submit(LOGS, priority="interactive")
+        events = manager.subscribe(job_id)
+        while True:
+            event, payload = await asyncio.wait_for(events.get(), timeout=30)
+            if event == "status" and payload.status in ("completed", "failed"):
+                break
+        await manager.stop()
+        return job_id
+
+    status = store.get(asyncio.run(run_job()))
+    assert status.status == "completed"
+    assert list(status.result.log_assessments) == [0]
+    assert store.logs_page(status.job_id).total == 1
+
+def test_restart_requeues_queued_jobs_and_fails_running_ones(store, tmp_path):
+    async def leave_jobs_behind():
+        # A server that stopped with one job running and two still queued
+        manager = JobManager(store, workers=0, queue_size=4)
+        running = await manager.submit(LOGS)
+        bulk = await manager.submit(LOGS * 2)
+        interactive = await manager.submit(LOGS, priority="interactive")
+        store.set_status(running, "running")
+        return running, bulk, interactive
+
+    running, bulk, interactive = asyncio.run(leave_jobs_behind())
+    restarted = JobStore(str(tmp_path / "jobs.db"))
+
+    async def restart():
+        manager = JobManager(restarted, workers=1, queue_size=1)
+        subscriptions = [manager.subscribe(job_id) for job_id in (bulk, interactive)]
+        await manager.start()
+        for events in subscriptions:
+            while True:
+                event, payload = await asyncio.wait_for(events.get(), timeout=30)
+                if event == "status" and payload.status in ("completed", "failed"):
+                    break
+        await manager.stop()
+
+    asyncio.run(restart())
+    assert restarted.get(running).status == "failed"
+    assert restarted.get(running).error == INTERRUPTED_ERROR
+    assert restarted.get(bulk).status == "completed"
+    assert list(restarted.get(bulk).result.log_assessments) == [0, 1]
+    assert restarted.get(interactive).status == "completed"
+    assert restarted._db.execute("SELECT priority FROM jobs WHERE id = ?", (interactive,)).fetchone()[0] == "interactive"
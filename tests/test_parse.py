@@ -0,0 +1,44 @@
+import pytest
+from app.audit import parse_model_output
+
+TEXT_RESPONSE = """===LOG ASSESSMENTS===
+LOG 4: High | Prompt contains an API token
+LOG 5: [Risk Level: Low] | Routine summary
+===SUGGESTIONS===
+- Rotate the exposed token
+===FLAGS===
+- LOG 4: API token in prompt
+===SUMMARY===
+One of two logs is high risk.
+===RISK STATUS===
+High-Risk"""
+
+JSON_RESPONSE = """{"log_assessments": [
+  {"log": 4, "risk_level": "high", "reason": "Prompt contains an API token"},
+  {"log": 5, "risk_level": "Low", "reason": "Routine summary"}
+], "suggestions": ["Rotate the exposed token"], "flags": ["LOG 4: API token in prompt"],
+"summary": "One of two logs is high risk.", "risk_status": "High-Risk"}"""
+
+def fenced(text, language=""):
+    return f"```{language}\n{text}\n```"
+
+@pytest.mark.parametrize("response", [
+    TEXT_RESPONSE, fenced(TEXT_RESPONSE), fenced(TEXT_RESPONSE, "text"),
+    JSON_RESPONSE, fenced(JSON_RESPONSE), fenced(JSON_RESPONSE, "json"),
+], ids=["text", "fenced-text", "fenced-text-language", "json", "fenced-json", "fenced-json-language"])
+def test_parses_either_format_with_or_without_fence(response):
+    result = parse_model_output(response, 2, [4, 5], fill_missing=False)
+    assert {idx: a.risk_level for idx, a in result.log_assessments.items()} == {4: "High", 5: "Low"}
+    assert result.log_assessments[4].reason == "Prompt contains an API token"
+    assert result.risk_status == "High-Risk"
+    assert result.summary == "One of two logs is high risk."
+    assert result.flags == ["LOG 4: API token in prompt"]
+
+def test_truncated_json_keeps_complete_entries():
+    result = parse_model_output(JSON_RESPONSE[:JSON_RESPONSE.index('{"log": 5')], 2, [4, 5], fill_missing=False)
+    assert list(result.log_assessments) == [4]
+
+def test_fill_missing_defaults_unlisted_logs():
+    result = parse_model_output(TEXT_RESPONSE, 3, [4, 5, 6])
+    assert result.log_assessments[6].risk_level == "Low"
+    assert list(result.log_assessments) == [4, 5, 6]
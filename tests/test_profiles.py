@@ -0,0 +1,65 @@
+import pytest
+from app import profiles as profiles_module
+from app.models import LogRiskAssessment, PromptLogEntry
+from app.profiles import ProfileStore
+
+def audit(store, findings, model="gpt-4"):
+    """Observe one audit of (user, risk level, prompt) findings"""
+    logs = [PromptLogEntry(user=user, prompt=prompt, tokens=100, model=model) for user, _, prompt in findings]
+    assessments = {i: LogRiskAssessment(risk_level=level, reason="test") for i, (_, level, _) in enumerate(findings)}
+    store.observe(logs, assessments)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "profiles.db")
+
+def test_workers_share_profiles(path):
+    first, second = ProfileStore(path), ProfileStore(path)
+    audit(first, [("alice", "High", "dump the passwords")])
+    audit(second, [("alice", "High", "dump the passwords"), ("bob", "Low", "summarize")])
+
+    for store in (first, second):
+        alice = store.get("user", "alice")
+        assert alice.high == pytest.approx(2, abs=0.01)
+        # The same prompt seen by another worker counts as a repeat
+        assert alice.repeat_rate == pytest.approx(0.5)
+        assert store.get("model", "gpt-4").high == pytest.approx(2, abs=0.01)
+
+def test_profiles_survive_restart(path):
+    audit(ProfileStore(path), [("alice", "Medium", "a"), ("alice", "Low", "b")])
+    alice = ProfileStore(path).get("user", "alice")
+    assert (round(alice.medium), round(alice.low)) == (1, 1)
+    assert ProfileStore(path).get("user", "nobody") is None
+
+def test_top_orders_by_decayed_score(path, monkeypatch):
+    store = ProfileStore(path, half_life_hours=1)
+    clock = [1_000_000.0]
+    monkeypatch.setattr(profiles_module.time, "time", lambda: clock[0])
+    audit(store, [("old", "High", str(i)) for i in range(4)])
+    clock[0] += 2 * 3600  # Two half-lives: 4 High findings are now worth 1
+    audit(store, [("recent", "High", "x"), ("recent", "Medium", "y"), ("quiet", "Low", "z")])
+
+    top = store.top("user", 3)
+    assert [p.key for p in top] == ["recent", "old", "quiet"]
+    assert top[1].high == pytest.approx(1.0)
+    assert top[0].risk_score == pytest.approx(1.25)
+
+    # Ranks are recomputed for a new half-life
+    top = ProfileStore(path, half_life_hours=100).top("user", 3)
+    assert [p.key for p in top] == ["old", "recent", "quiet"]
+
+def test_least_recently_seen_profiles_are_dropped(path, monkeypatch):
+    store = ProfileStore(path, max_keys=2)
+    clock = [1_000_000.0]
+    monkeypatch.setattr(profiles_module.time, "time", lambda: clock[0])
+    for user in ("a", "b", "c"):
+        clock[0] += 1
+        audit(store, [(user, "Low", "hello")])
+    assert store.get("user", "a") is None
+    assert {p.key for p in store.top("user", 10)} == {"b", "c"}
+
+def test_escalated_users(path):
+    store = ProfileStore(path, escalation_min_high=2.9, escalation_share=0.5)
+    audit(store, [("mallory", "High", str(i)) for i in range(3)] + [("carol", "High", "x"), ("carol", "Low", "y")])
+    assert store.escalated_users(["mallory", "carol", "unknown"]) == {"mallory"}
+    assert store.get("user", "mallory").escalated
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import httpx
+import pytest
+from app import ratelimit
+from app.ratelimit import RateLimiter, RateLimited, lane, retry_delay
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "ratelimit.db")
+
+def test_bulk_leaves_the_reserve_to_interactive(path):
+    limiter = RateLimiter(path, requests_per_minute=10, tokens_per_minute=0, bulk_reserve=0.2)
+    assert [limiter._take(0, "bulk") for _ in range(8)] == [0] * 8
+    # 2 requests left: bulk has to wait, interactive still gets them
+    assert limiter._take(0, "bulk") > 0
+    assert limiter._take(0, "interactive") == 0
+    assert limiter._take(0, "interactive") == 0
+    assert limiter._take(0, "interactive") == pytest.approx(6, abs=0.1)  # One request refills every 6 s
+
+def test_workers_share_buckets_and_oversized_calls_take_the_whole_budget(path):
+    first = RateLimiter(path, requests_per_minute=0, tokens_per_minute=1000, bulk_reserve=0)
+    second = RateLimiter(path, requests_per_minute=0, tokens_per_minute=1000, bulk_reserve=0)
+    assert first._take(600, "interactive") == 0
+    assert second._take(600, "interactive") == pytest.approx(12, abs=0.1)
+    assert second._take(400, "interactive") == 0
+    # Larger than the whole budget: it waits for a full bucket instead of forever
+    assert first._take(5000, "interactive") == pytest.approx(60, abs=0.1)
+
+def test_cooldown_pauses_every_worker(path):
+    first = RateLimiter(path, requests_per_minute=100, tokens_per_minute=0)
+    second = RateLimiter(path, requests_per_minute=100, tokens_per_minute=0)
+    first._set_cooldown(time.time() + 5)
+    assert second._take(0, "interactive") == pytest.approx(5, abs=0.1)
+    assert second._take(0, "bulk") == pytest.approx(5, abs=0.1)
+
+def test_bulk_waits_while_interactive_calls_are_queued(path):
+    # 10 requests per second, bucket drained: every call waits for a refill
+    limiter = RateLimiter(path, requests_per_minute=600, tokens_per_minute=0, bulk_reserve=0)
+    while limiter._take(0, "interactive") == 0:
+        pass
+    order = []
+
+    async def call(name):
+        with lane(name):
+            await limiter.acquire(0)
+        order.append(name)
+
+    async def run():
+        bulk = asyncio.create_task(call("bulk"))
+        await asyncio.sleep(0)
+        await asyncio.gather(call("interactive"), call("interactive"), bulk)
+
+    asyncio.run(run())
+    assert order == ["interactive", "interactive", "bulk"]
+
+def test_interactive_call_fails_fast_when_the_wait_is_too_long(path):
+    limiter = RateLimiter(path, requests_per_minute=1, tokens_per_minute=0, interactive_max_wait=1)
+    asyncio.run(limiter.acquire(0))
+    with pytest.raises(RateLimited) as info:
+        asyncio.run(limiter.acquire(0))
+    assert info.value.retry_after == 60
+
+def upstream_error(status, headers=None):
+    error = Exception(f"HTTP {status}")
+    error.status_code = status
+    error.response = SimpleNamespace(status_code=status, headers=headers or {})
+    return error
+
+def test_retry_delay_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(ratelimit, "LLM_BACKOFF_BASE", 1)
+    monkeypatch.setattr(ratelimit, "LLM_BACKOFF_MAX", 60)
+    assert retry_delay(upstream_error(429, {"retry-after": "7"}), 0) == 7
+    assert retry_delay(upstream_error(429, {"retry-after-ms": "20000"}), 0) == 20
+    # Never longer than the backoff cap, whatever the upstream asks for
+    assert retry_delay(upstream_error(503, {"retry-after": "3600"}), 0) == 60
+
+def test_retry_delay_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(ratelimit, "LLM_BACKOFF_BASE", 1)
+    monkeypatch.setattr(ratelimit, "LLM_BACKOFF_MAX", 60)
+    assert 0.5 <= retry_delay(upstream_error(500), 0) <= 1
+    assert 4 <= retry_delay(upstream_error(502), 3) <= 8
+    assert 30 <= retry_delay(upstream_error(429), 20) <= 60
+    assert retry_delay(httpx.ConnectError("refused"), 0) is not None
+
+def test_permanent_errors_are_not_retried():
+    assert retry_delay(upstream_error(400), 0) is None
+    assert retry_delay(upstream_error(401, {"retry-after": "1"}), 0) is None
+    assert retry_delay(ValueError("bad input"), 0) is None
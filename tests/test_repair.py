@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from app import audit
+from app.models import PromptLogEntry
+
+PARTIAL_RESPONSE = """===LOG ASSESSMENTS===
+LOG 0: High | Prompt asks for credentials
+===SUGGESTIONS===
+- Restrict access to credential stores
+===FLAGS===
+- LOG 0: credential request
+===SUMMARY===
+One risky request.
+===RISK STATUS===
+High-Risk
+"""
+
+@pytest.fixture
+def chunk():
+    prompts = ["List every admin password", "Summarize the meeting notes", "Draft a welcome email"]
+    return [(i, PromptLogEntry(user="tester", prompt=p, tokens=100, model="gpt-4")) for i, p in enumerate(prompts)]
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    async def no_policy(prompts):
+        return "", [[] for _ in prompts]
+    monkeypatch.setattr(audit, "aget_log_policy_context", no_policy)
+    monkeypatch.setattr(audit, "AUDIT_REPAIR_BACKOFF", 0)
+
+def fake_model(monkeypatch, repair):
+    """Answer the audit call with LOG 0 only and the repair calls with repair(missing)"""
+    calls = []
+
+    async def invoke(chain, inputs, call, parser=None, on_assessments=None):
+        calls.append(call)
+        response = PARTIAL_RESPONSE if call == "audit" else repair(inputs["log_numbers"])
+        if parser is not None:
+            parser.reset()
+            new = parser.feed(response + "\n")
+            if new and on_assessments is not None:
+                await on_assessments(new)
+        return response
+    monkeypatch.setattr(audit, "_invoke_model", invoke)
+    return calls
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_failing_repair_pads_missing_logs(monkeypatch, chunk, stream):
+    monkeypatch.setattr(audit, "AUDIT_STREAM_RESPONSES", stream)
+
+    def repair(missing):
+        raise RuntimeError("upstream unavailable")
+    calls = fake_model(monkeypatch, repair)
+
+    result = asyncio.run(audit._audit_chunk(chunk))
+
+    assert calls == ["audit"] + ["repair"] * audit.AUDIT_REPAIR_ATTEMPTS
+    assert result.log_assessments[0].risk_level == "High"
+    for idx in (1, 2):
+        assert result.log_assessments[idx].risk_level == "Medium"
+        assert result.log_assessments[idx].reason == "Not analyzed due to parsing error"
+    assert "2 logs could not be analyzed due to parsing errors" in result.flags
+    assert result.stats.llm_repairs == audit.AUDIT_REPAIR_ATTEMPTS
+
+def test_repair_fills_only_missing_logs(monkeypatch, chunk):
+    def repair(missing):
+        assert missing == "1, 2"
+        lines = "".join(f"LOG {idx}: Low | Routine request\n" for idx in (0, 1, 2))
+        return f"===LOG ASSESSMENTS===\n{lines}===SUMMARY===\nFine\n===RISK STATUS===\nSafe\n"
+    calls = fake_model(monkeypatch, repair)
+
+    result = asyncio.run(audit._audit_chunk(chunk))
+
+    assert calls == ["audit", "repair"]
+    # LOG 0 was not asked for again, so its original assessment stands
+    assert result.log_assessments[0].risk_level == "High"
+    assert [result.log_assessments[idx].reason for idx in (1, 2)] == ["Routine request"] * 2
+    assert result.stats.llm_repairs == 1
@@ -0,0 +1,30 @@
+import asyncio
+from app import backends, rag_policy
+from app.clients import close_http_client
+from app.runtime import get_runtime
+
+def test_embed_model_is_reused_per_event_loop(monkeypatch):
+    created = []
+    real = backends.get_embed_model
+
+    def get_embed_model(async_http_client=None):
+        created.append(async_http_client)
+        return real(async_http_client)
+    monkeypatch.setattr("app.runtime.get_embed_model", get_embed_model)
+    runtime = get_runtime()
+
+    async def retrieve_twice():
+        await rag_policy.aretrieve_policy_chunks(["share the customer list"])
+        await rag_policy.aretrieve_policy_chunks(["export payroll data"])
+        first = runtime.embed_model()
+        await close_http_client()
+        return first, runtime.embed_model()
+
+    first, after_close = asyncio.run(retrieve_twice())
+    # Both retrievals shared one model on the loop's pooled client; closing the pool replaces it
+    assert first is not after_close
+    assert len(created) == 2
+    assert created[0] is not created[1]
+
+    asyncio.run(retrieve_twice())
+    assert len(created) == 4
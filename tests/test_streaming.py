@@ -0,0 +1,58 @@
+import asyncio
+import json
+from app import streaming
+from app.models import AuditResponse, LogRiskAssessment
+from app.ratelimit import RateLimited
+
+def record(i):
+    return json.dumps({"user": f"user{i}", "prompt": f"Summarize report {i}", "tokens": 100, "model": "gpt-4"}).encode()
+
+async def lines_of(records):
+    for line in records:
+        yield line
+
+def run(records, window):
+    async def collect():
+        return [json.loads(out) async for out in streaming.stream_audit(lines_of(records), window=window)]
+    return asyncio.run(collect())
+
+def fake_audit(monkeypatch, failing):
+    """Assess every log Low, except that windows containing an index in failing raise"""
+    async def audit_logs_async(logs, log_indices):
+        if failing & set(log_indices):
+            raise RateLimited("Upstream model rate limit reached, please retry later", 30)
+        return AuditResponse(summary="", risk_status="Safe",
+                             log_assessments={i: LogRiskAssessment(risk_level="Low", reason="fine") for i in log_indices})
+    monkeypatch.setattr(streaming, "audit_logs_async", audit_logs_async)
+
+def test_failing_window_yields_error_lines_and_continues(monkeypatch):
+    fake_audit(monkeypatch, failing={3})
+    out = run([record(i) for i in range(7)], window=2)
+
+    results, summary = out[:-1], out[-1]["summary"]
+    assert [line["index"] for line in results] == list(range(7))
+    errors = {line["index"]: line["error"] for line in results if "error" in line}
+    assert set(errors) == {2, 3}
+    assert errors[2].startswith("Audit failed: Upstream model rate limit reached")
+    assert all(line["risk_level"] == "Low" for line in results if "error" not in line)
+    assert summary["total"] == 7
+    assert summary["failed"] == 2
+    assert summary["risk_counts"] == {"Low": 5}
+
+def test_invalid_records_are_reported_in_place(monkeypatch):
+    fake_audit(monkeypatch, failing=set())
+    out = run([record(0), b'{"user": "x"}', b"", record(2)], window=10)
+
+    assert [line.get("index") for line in out[:-1]] == [1, 0, 2]
+    assert "prompt" in out[0]["error"]
+    assert out[-1]["summary"]["invalid"] == 1
+    assert out[-1]["summary"]["failed"] == 0
+
+def test_aiter_lines_splits_across_chunks():
+    async def chunks():
+        for chunk in (b'{"a": 1}\n{"b"', b': 2}\n', b'{"c": 3}'):
+            yield chunk
+
+    async def collect():
+        return [line async for line in streaming.aiter_lines(chunks())]
+    assert asyncio.run(collect()) == [b'{"a": 1}', b'{"b": 2}', b'{"c": 3}']
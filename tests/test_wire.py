@@ -0,0 +1,87 @@
+import asyncio
+import gzip
+import pytest
+import zstandard
+from app import wire
+from app.models import AuditResponse, LogRiskAssessment
+
+def response(logs=2000):
+    assessments = {
+        idx: LogRiskAssessment(risk_level=("High", "Medium", "Low")[idx % 3], reason=f"Reason {idx % 5}")
+        for idx in range(logs)
+    }
+    return AuditResponse(risk_status="Critical", summary="Summary", flags=["LOG 0: High"], log_assessments=assessments)
+
+def assessments_of(data, media_type):
+    """{index: (risk level, reason)} of a decoded response"""
+    if media_type == wire.JSON:
+        return {int(idx): (a["risk_level"], a["reason"]) for idx, a in data["log_assessments"].items()}
+    return {idx: (a.risk_level, a.reason) for idx, a in wire.expand_assessments(data["log_assessments"]).items()}
+
+@pytest.mark.parametrize("media_type", [wire.JSON, wire.COLUMNAR_JSON, wire.MSGPACK])
+@pytest.mark.parametrize("encoding", [None, "gzip", "zstd"])
+def test_encode_decode_round_trip(media_type, encoding):
+    model = response()
+    body, used = wire.encode(model, media_type, encoding)
+    assert used == encoding  # The body is large enough to be compressed
+
+    data = wire.decode(body, media_type, used)
+    assert (data["risk_status"], data["summary"], data["flags"]) == ("Critical", "Summary", ["LOG 0: High"])
+    assert assessments_of(data, media_type) == {
+        idx: (a.risk_level, a.reason) for idx, a in model.log_assessments.items()
+    }
+
+def test_columnar_lists_each_reason_once():
+    columns = wire.columnar_assessments(response().log_assessments)
+    assert len(columns["reasons"]) == 5 and len(columns["risk_levels"]) == 3
+    assert len(columns["reason"]) == len(columns["index"]) == 2000
+
+def test_small_bodies_are_not_compressed():
+    body, used = wire.encode(response(logs=1), wire.JSON, "zstd")
+    assert used is None
+    assert wire.decode(body)["risk_status"] == "Critical"
+
+@pytest.mark.parametrize("compress", [gzip.compress, zstandard.ZstdCompressor().compress])
+def test_decompress_limit(compress):
+    encoding = "gzip" if compress is gzip.compress else "zstd"
+    body = compress(b"x" * 10000)
+    assert wire.decompress(body, encoding, max_bytes=10000) == b"x" * 10000
+    with pytest.raises(wire.PayloadTooLarge):
+        wire.decompress(body, encoding, max_bytes=9999)
+
+def test_decompress_stacked_codings():
+    body = zstandard.ZstdCompressor().compress(gzip.compress(b"payload"))
+    assert wire.decompress(body, "gzip, zstd") == b"payload"
+    assert wire.decompress(b"payload", "identity") == b"payload"
+    with pytest.raises(wire.UnsupportedEncoding):
+        wire.decompress(b"payload", "br")
+
+def test_adecompress_limit():
+    async def chunks(body):
+        for start in range(0, len(body), 100):
+            yield body[start:start + 100]
+
+    async def collect(body, max_bytes):
+        return b"".join([chunk async for chunk in wire.adecompress(chunks(body), "gzip", max_bytes)])
+
+    body = gzip.compress(b"y" * 5000)
+    assert asyncio.run(collect(body, 5000)) == b"y" * 5000
+    with pytest.raises(wire.PayloadTooLarge):
+        asyncio.run(collect(body, 4999))
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, wire.JSON),
+    ("application/msgpack", wire.MSGPACK),
+    ("application/x-msgpack", wire.MSGPACK),
+    ("application/json;q=0.5, application/vnd.llm-auditor.columnar+json", wire.COLUMNAR_JSON),
+    ("text/html", wire.JSON),
+])
+def test_negotiate_media_type(accept, expected):
+    assert wire.negotiate_media_type(accept) == expected
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None), ("gzip", "gzip"), ("gzip, zstd", "zstd"), ("zstd;q=0.5, gzip", "gzip"), ("*", "zstd"),
+    ("zstd;q=0, gzip;q=0", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert wire.negotiate_encoding(accept_encoding) == expected